@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18/oct/2026
+
+Benchmark for comment log archival: the plain-text log + bz2 level 9 pass done after 
+re-fetching, against compressing the log as it is written (compressed_log), for each
+available codec and a few compression levels.
+
+For each method, the same comments are written through the logging module, and the 
+log file is then archived. The benchmark reports the uncompressed MB/s, the 
+CPU-seconds per million comments, and the archive size.
+
+Usage: python bench_compression.py [number of comments] [comment log file to replay]
+'''
+
+import bz2
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from logging.handlers import TimedRotatingFileHandler
+from shutil import copyfileobj
+from compressed_log import CODECS, CompressedTimedRotatingFileHandler
+from fake_reddit import synthetic_comments
+
+def _cpu_time():
+    t = os.times()
+    return t[0] + t[1]
+
+def _log_comments(handler, lines):
+    logger = logging.getLogger("bench_compression_%s" % id(handler))
+    logger.propagate = False
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    for line in lines:
+        logger.info(line)
+    handler.close()
+    logger.removeHandler(handler)
+
+def bench(name, make_handler, archive, lines, n_bytes, folder):
+    fpath = os.path.join(folder, name)
+    start_time, start_cpu = time.time(), _cpu_time()
+    _log_comments(make_handler(fpath), lines)
+    archive_fpath = archive(fpath)
+    elapsed, cpu = time.time() - start_time, _cpu_time() - start_cpu
+    size = os.path.getsize(archive_fpath)
+    os.remove(archive_fpath)
+    print "%-12s %8.2f MB/s %10.2f CPU-s/M comments %8.2f MB (ratio %5.2f)" % (name, n_bytes / elapsed / 2**20, cpu * 10**6 / len(lines), size / 2.**20, float(n_bytes) / size)
+
+def _two_pass_archive(fpath):
+    # same as reddeat.archive_log_files, which cannot be imported without connecting to Reddit
+    with open(fpath, 'rb') as infile:
+        with bz2.BZ2File(fpath+'.bz2', 'wb', compresslevel=9) as outfile:
+            copyfileobj(infile, outfile)
+    os.remove(fpath)
+    return fpath + ".bz2"
+
+if __name__ == '__main__':
+    n_comments = int(sys.argv[1]) if len(sys.argv) > 1 else 10**5
+    if len(sys.argv) > 2:
+        with open(sys.argv[2]) as f:
+            lines = [line.rstrip("\n").decode("utf8") for line in f][:n_comments]
+    else:
+        lines = [json.dumps(c) for c in synthetic_comments(n_comments)]
+    n_bytes = sum(len(line.encode("utf8")) + 1 for line in lines)
+    print "%d comments, %.2f MB uncompressed" % (len(lines), n_bytes / 2.**20)
+    folder = tempfile.mkdtemp()
+    try:
+        rotating_handler_args = dict(when="D", interval=1, backupCount=0, delay=False, utc=True)
+        bench("plain+bz2-9", lambda fpath: TimedRotatingFileHandler(fpath, encoding="utf8", **rotating_handler_args), _two_pass_archive, lines, n_bytes, folder)
+        for codec in sorted(CODECS.itervalues(), key=lambda c: c.name):
+            for level in sorted(set([1, codec.default_level, 9])):
+                bench("%s-%d" % (codec.name, level),
+                      lambda fpath: CompressedTimedRotatingFileHandler(fpath, codec=codec.name, level=level, **rotating_handler_args),
+                      lambda fpath: (os.rename(fpath, fpath+codec.extension), fpath+codec.extension)[1],
+                      lines, n_bytes, folder)
+    finally:
+        shutil.rmtree(folder)
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18/oct/2026
+
+Compares recheck horizon schedules by API cost per removal detected, by running
+the RecheckScheduler over a simulated day of comments.
+
+A share of the comments is removed, after a log-normally distributed time (7 hours on
+average, as found by Pree.ch on the slowest moderated subreddit in their tests). Every
+schedule re-fetches the comments at its horizons, dropping the ones found removed, and
+the benchmark reports the requests issued, the removals detected (out of all the
+removals), the requests per removal detected, and the average detection lag.
+
+Usage: python bench_horizons.py [comments] [removed share]
+'''
+
+import math
+import sys
+import numpy as np
+from recheck_scheduler import RecheckScheduler
+from fullnames import fullname_to_numeric, numeric_to_fullnames
+
+HOURS = 60*60
+DAYS = 24*HOURS
+SCHEDULES = (
+    [1*HOURS], [7*HOURS], [1*DAYS], [7*DAYS],
+    [1*HOURS, 7*HOURS, 1*DAYS],
+    [1*HOURS, 7*HOURS, 1*DAYS, 7*DAYS],
+    )
+MEAN_REMOVAL_DELAY = 7*HOURS
+REMOVAL_DELAY_SIGMA = 1.5 # of the log-normal distribution of removal delays
+
+def simulate(horizons, created, removed_at, batch_size=100):
+    '''
+    :param horizons: recheck horizons, in seconds
+    :param created: creation time of every comment
+    :param removed_at: removal time of every comment (inf if never removed)
+
+    :returns: (requests, removals detected, total detection lag, RecheckScheduler)
+    '''
+    scheduler = RecheckScheduler(horizons, batch_size)
+    # comment i has numeric id i
+    for fullname, created_utc in zip(numeric_to_fullnames(np.arange(len(created))).tolist(), created):
+        scheduler.schedule(fullname, created_utc)
+    n_requests, n_detected, total_lag = 0, 0, 0.
+    while len(scheduler):
+        # every comment is re-fetched at its due time
+        batch, _ = scheduler.next_batch(now=lambda: float("inf"))
+        n_requests += 1
+        removed = set()
+        for fullname, _, _, horizon, created_utc in batch:
+            i = fullname_to_numeric(fullname)
+            checked_at = created_utc + scheduler.horizons[horizon]
+            if removed_at[i] <= checked_at:
+                removed.add(fullname)
+                total_lag += checked_at - removed_at[i]
+        n_detected += len(removed)
+        scheduler.task_done(batch, removed)
+    return n_requests, n_detected, total_lag, scheduler
+
+def format_duration(seconds):
+    return "%dd" % (seconds // DAYS) if not seconds % DAYS else "%dh" % (seconds // HOURS)
+
+if __name__ == '__main__':
+    n_comments = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    removed_share = float(sys.argv[2]) if len(sys.argv) > 2 else .1
+    rnd = np.random.RandomState(0)
+    created = np.sort(rnd.uniform(0, 1*DAYS, n_comments))
+    mu = math.log(MEAN_REMOVAL_DELAY) - REMOVAL_DELAY_SIGMA**2 / 2
+    removed_at = np.where(rnd.uniform(size=n_comments) < removed_share,
+                          created + rnd.lognormal(mu, REMOVAL_DELAY_SIGMA, n_comments), np.inf)
+    n_removals = np.isfinite(removed_at).sum()
+    print "%d comments, %d removed (mean delay %s)" % (n_comments, n_removals, format_duration(MEAN_REMOVAL_DELAY))
+    print "%-16s %9s %18s %14s %12s   per horizon (checked/removed)" % ("horizons", "requests", "detected", "req./removal", "avg. lag")
+    for horizons in SCHEDULES:
+        n_requests, n_detected, total_lag, scheduler = simulate(horizons, created, removed_at)
+        print "%-16s %9d %9d (%5.1f%%) %14.2f %11.1fh   %s" % (
+            ",".join(format_duration(h) for h in horizons), n_requests, n_detected, 100. * n_detected / n_removals,
+            float(n_requests) / max(n_detected, 1), total_lag / max(n_detected, 1) / HOURS,
+            " ".join("%s:%d/%d" % (format_duration(s["horizon"]), s["checked"], s["removed"]) for s in scheduler.stats()))
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18/oct/2026
+
+Benchmark for the ingest engines, against a local fake Reddit (fake_reddit.py):
+- stream: a port of the listing polling done by PRAW's stream.comments()
+- poll: IdPoller, walking the comment ids through the info endpoint
+
+The fake Reddit receives synthetic comments at a steady rate, leaves some of them
+out of the comment listing, and allows a fixed number of requests per second. Each
+engine runs for the same time, against a fresh corpus, and the benchmark reports the
+coverage (comments collected / comments posted during the run) and the number of
+API requests per 1000 comments collected.
+
+Usage: python bench_ingest.py [comments per second] [requests per second] [seconds]
+'''
+
+import sys
+import time
+from fake_reddit import FakeRedditServer, synthetic_comments, http_info_fetcher, http_listing_fetcher, listing_stream
+from id_poller import IdPoller
+from refetch_pool import TokenBucketLimiter, RateLimited
+
+LISTING_HIDDEN = .02 # fraction of comments left out of the listing, as the automatically moderated ones
+RATE_LIMIT_WINDOW = 10 # seconds
+CATCH_UP_TIME = 10 # seconds
+
+def run(engine, comments_per_second, requests_per_second, duration):
+    start_time = time.time()
+    # enough comments for the run, and for the engines to run ahead
+    corpus = {c["name"]: c for c in synthetic_comments(int(comments_per_second * (duration + 10)), start_time=start_time, rate=comments_per_second)}
+    server = FakeRedditServer(corpus, requests_per_window=requests_per_second * RATE_LIMIT_WINDOW, window=RATE_LIMIT_WINDOW,
+                              listing_hidden=LISTING_HIDDEN).start()
+    limiter = TokenBucketLimiter(requests_per_second)
+    if engine == "stream":
+        comments = listing_stream(http_listing_fetcher(server.url), limiter)
+    else:
+        first_id = min(int(c["id"], 36) for c in corpus.itervalues())
+        comments = IdPoller(http_info_fetcher(server.url), first_id, limiter=limiter, fullname_of=lambda c: c["name"]).comments()
+    collected = set()
+    end_time = start_time + duration
+    try:
+        for comment in comments:
+            if comment["created_utc"] < end_time:
+                collected.add(comment["name"])
+            # give the engines a few seconds to catch up with the comments posted before the end
+            if comment["created_utc"] >= end_time or time.time() > end_time + CATCH_UP_TIME:
+                break
+    except RateLimited:
+        pass
+    finally:
+        server.stop()
+    posted = sum(1 for c in corpus.itervalues() if c["created_utc"] < end_time)
+    print "%-6s coverage %6.2f%% (%d/%d), %6.1f requests per 1000 comments, %d requests rate limited" % (
+        engine, 100. * len(collected) / posted, len(collected), posted, 1000. * server.n_requests / max(len(collected), 1), server.n_rate_limited)
+
+if __name__ == '__main__':
+    comments_per_second = float(sys.argv[1]) if len(sys.argv) > 1 else 30.
+    requests_per_second = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    duration = float(sys.argv[3]) if len(sys.argv) > 3 else 60.
+    print "%.0f comments/s, %d requests/s, %.0f s" % (comments_per_second, requests_per_second, duration)
+    for engine in ("stream", "poll"):
+        run(engine, comments_per_second, requests_per_second, duration)
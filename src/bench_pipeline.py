@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18/oct/2026
+
+End-to-end benchmark of reddeat's pipeline (ingest -> rotate -> recheck -> archive),
+against a local fake Reddit (fake_reddit.py), at multiples of Reddit's ~30 comments/s.
+
+For every scale, the fake Reddit serves a fresh synthetic corpus (or a recorded comment
+log, replayed at the scale's rate), removes a share of the comments after a log-normal
+delay, delays its answers, and injects 429s. reddeat runs in a child process, with
+reddeat.client replaced by a FakeRedditClient, and time compressed: log files rotate
+every few seconds, and comments are re-fetched seconds after posting. The API budget of
+the fake Reddit grows with the scale, so that the pipeline, not the rate limit, is
+measured. Once ingest stops, the child waits for the last re-fetches, and reports its
+CPU time and peak RSS. The benchmark then reads the log files, and reports:
+- coverage: comments logged / comments posted during the run
+- cpu: CPU seconds of the pipeline process, and CPU microseconds per comment posted
+- rss: peak resident memory of the pipeline process
+- disk: bytes written to the log folder, and bytes per comment posted
+- detection: removals found / removals that happened before the last re-fetch horizon
+- lag: time from removal to detection (refetched_utc - removal time)
+- coalescing: re-fetch requests saved by sharing requests between the re-fetch sources,
+  and fullnames per re-fetch request
+
+Runs are deterministic, up to thread scheduling: corpus, removals and injected errors are seeded.
+
+Usage: python bench_pipeline.py [seconds] [scales, e.g. 1,10,100] [ingest engine: stream or poll] [recorded log file]
+'''
+
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from fake_reddit import FakeRedditServer, FakeRedditClient, synthetic_comments, recorded_comments, removal_times
+from compressed_log import open_log
+from pending_store import scan_comment_line
+from refetch_pool import TokenBucketLimiter
+from block_archive import INDEX_SUFFIX
+from checkpoint import CHECKPOINT_SUFFIX, DONE_SUFFIX
+from seen_set import SNAPSHOT_SUFFIX as SEEN_SET_SUFFIX
+
+REDDIT_RATE = 30. # comments per second posted on Reddit
+RECHECK_HORIZONS = [5, 20] # seconds: time is compressed, as is the removal delay
+ROTATION_INTERVAL = 5 # seconds
+REMOVED_SHARE = .05 # fraction of the comments removed
+MEAN_REMOVAL_DELAY = 10 # seconds
+LATENCY = .05 # seconds before the fake Reddit answers
+ERROR_RATE = .01 # fraction of the requests answered with a 429
+LISTING_HIDDEN = .02 # fraction of comments left out of the listing, as the automatically moderated ones
+RATE_LIMIT_WINDOW = 10 # seconds
+START_DELAY = 3 # seconds given to the child process to start, before the first comment is posted
+DRAIN_TIMEOUT = 60 # seconds to wait for the last re-fetches, after the last due time
+
+def api_budget(rate):
+    '''
+    :param rate: comments per second
+
+    :returns: requests per second enough for the listing, the re-fetches at every horizon, and the retries
+    '''
+    return max(2., 2 * rate * (1 + len(RECHECK_HORIZONS)) / 100.)
+
+def run_pipeline(config):
+    '''
+    Child process: run reddeat against the fake Reddit, and write the CPU time and peak RSS to config["result"]
+    '''
+    import reddeat
+    folder = config["folder"]
+    reddeat.LOGGER_FOLDER = os.path.join(folder, "log") + "/"
+    reddeat.ERROR_LOGGER_FOLDER = folder + "/"
+    reddeat.RUN_FOR = config["run_for"]
+    reddeat.LOG_ROTATION_UNIT, reddeat.LOG_ROTATION_INTERVAL = "S", ROTATION_INTERVAL
+    reddeat.RECHECK_HORIZONS = RECHECK_HORIZONS
+    reddeat.REDDIT_API_INTERVAL = 1. / config["api_budget"]
+    reddeat.BACKOFF_BASE, reddeat.DEFAULT_SLEEP_TIME = .1, 2
+    reddeat.BLOCK_ARCHIVE = True
+    reddeat.METRICS_DUMP_INTERVAL = 0
+    reddeat.INGEST_ENGINE = config["ingest_engine"]
+    reddeat.client = FakeRedditClient(config["url"], TokenBucketLimiter(config["api_budget"]))
+    reddeat.setup_error_logger()
+    reddeat.setup_comment_logger()
+    reddeat.reddeat()
+    # seal the log file being written, as the next rotation would
+    reddeat.logging.getLogger(reddeat.LOGGER_NAME).handlers[0].doRollover()
+    drain_end = time.time() + max(RECHECK_HORIZONS) + DRAIN_TIMEOUT
+    while len(reddeat.recheck_scheduler) and time.time() < drain_end:
+        time.sleep(.5)
+    # leave time to store and archive the last batches
+    time.sleep(2)
+    user_time, system_time = os.times()[:2]
+    with open(config["result"], 'w') as f:
+        json.dump({"cpu": user_time + system_time, "max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+                   "pending": len(reddeat.recheck_scheduler), "metrics": reddeat.metrics.snapshot()}, f)
+
+def read_logs(log_folder):
+    '''
+    :returns: (set of logged fullnames, dict of removed fullname -> refetched_utc of the first detection)
+    '''
+    logged, detected = set(), {}
+    for fname in os.listdir(log_folder):
+        fpath = os.path.join(log_folder, fname)
+        if fname.endswith((INDEX_SUFFIX, CHECKPOINT_SUFFIX, DONE_SUFFIX, SEEN_SET_SUFFIX, ".spill")) or not fname.startswith("reddeat"):
+            continue
+        with open_log(fpath, 'r') as log_f:
+            for line in log_f:
+                if not line.strip():
+                    continue
+                if ".removed" in fname:
+                    record = json.loads(line)
+                    detected[record["name"]] = min(detected.get(record["name"], float("inf")), record["refetched_utc"])
+                else:
+                    logged.add(scan_comment_line(line)[0])
+    return logged, detected
+
+def disk_bytes(folder):
+    return sum(os.path.getsize(os.path.join(root, fname)) for root, _, fnames in os.walk(folder) for fname in fnames)
+
+def run(scale, duration, recorded_fpath=None, ingest_engine="stream"):
+    rate = REDDIT_RATE * scale
+    start_time = time.time() + START_DELAY
+    # enough comments for the run, and for the ingest engine to run ahead
+    n_comments = int(rate * (duration + 10))
+    if recorded_fpath:
+        comments = recorded_comments(recorded_fpath, start_time=start_time, rate=rate)[:n_comments]
+    else:
+        comments = list(synthetic_comments(n_comments, start_time=start_time, rate=rate))
+    corpus = dict((c["name"], c) for c in comments)
+    removals = removal_times(comments, REMOVED_SHARE, MEAN_REMOVAL_DELAY)
+    budget = api_budget(rate)
+    server = FakeRedditServer(corpus, requests_per_window=int(budget * RATE_LIMIT_WINDOW), window=RATE_LIMIT_WINDOW,
+                              latency=LATENCY, listing_hidden=LISTING_HIDDEN, error_rate=ERROR_RATE, removals=removals).start()
+    folder = tempfile.mkdtemp(prefix="bench_pipeline_")
+    config = {"url": server.url, "folder": folder, "run_for": START_DELAY + duration, "api_budget": budget,
+              "ingest_engine": ingest_engine, "result": os.path.join(folder, "result.json")}
+    try:
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call([sys.executable, os.path.abspath(__file__), "--child", json.dumps(config)], stdout=devnull)
+        with open(config["result"]) as f:
+            result = json.load(f)
+        os.remove(config["result"])
+        logged, detected = read_logs(os.path.join(folder, "log"))
+        size = disk_bytes(os.path.join(folder, "log"))
+    finally:
+        server.stop()
+        shutil.rmtree(folder, ignore_errors=True)
+    end_time = start_time + duration
+    posted = set(c["name"] for c in comments if start_time <= c["created_utc"] < end_time)
+    # removals the last horizon can find, among the comments posted during the run
+    detectable = set(name for name in posted if removals.get(name, float("inf")) <= corpus[name]["created_utc"] + max(RECHECK_HORIZONS))
+    lags = np.array([detected[name] - removals[name] for name in detectable if name in detected])
+    print "%4dx %6.0f comments/s: coverage %6.2f%%, cpu %6.1f s (%5.0f us/comment), rss %6.1f MB, disk %7.2f MB (%4.0f B/comment), " \
+          "detection %6.2f%% (%d/%d), lag mean %5.1f s p50 %5.1f s max %5.1f s, %d requests (%d rate limited, %d injected 429s), " \
+          "%d re-fetch requests saved (%.1f fullnames/request), %d left pending" % (
+        scale, rate, 100. * len(logged & posted) / len(posted), result["cpu"], 1e6 * result["cpu"] / len(posted),
+        result["max_rss"] / 2.**20, size / 2.**20, float(size) / len(posted),
+        100. * len(lags) / max(len(detectable), 1), len(lags), len(detectable),
+        lags.mean() if len(lags) else float("nan"), np.median(lags) if len(lags) else float("nan"), lags.max() if len(lags) else float("nan"),
+        server.n_requests, server.n_rate_limited, server.n_errors, result["metrics"]["reddeat_refetch_requests_saved_total"],
+        float(result["metrics"]["reddeat_refetch_fullnames_total"]) / max(result["metrics"]["reddeat_refetch_requests_total"], 1), result["pending"])
+    sys.stdout.flush()
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == "--child":
+        run_pipeline(json.loads(sys.argv[2]))
+        sys.exit(0)
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 60.
+    scales = [int(s) for s in sys.argv[2].split(",")] if len(sys.argv) > 2 else [1, 10, 100]
+    ingest_engine = sys.argv[3] if len(sys.argv) > 3 else "stream"
+    recorded_fpath = sys.argv[4] if len(sys.argv) > 4 else None
+    print "%s ingest engine, %.0f s per run, re-fetches at %s s, rotation every %d s, %.0f%% of comments removed after %d s on average" % (
+        ingest_engine, duration, ",".join(str(h) for h in RECHECK_HORIZONS), ROTATION_INTERVAL, 100 * REMOVED_SHARE, MEAN_REMOVAL_DELAY)
+    for scale in scales:
+        run(scale, duration, recorded_fpath, ingest_engine)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18/oct/2026
+
+Microbenchmark for comment serialization: reddeat's original 
+to_json(strip_empty_fields(comment.__dict__)) against CommentSerializer, with each
+installed json library.
+
+Comments are replayed from recorded comment logs (json lines, as stored by reddeat),
+or generated by fake_reddit.synthetic_comments. Each comment is turned back into 
+something shaped like a PRAW Comment's __dict__: author and subreddit objects, 
+private attributes, and the empty fields reddeat drops. The benchmark checks that
+all methods produce the same comments, and reports comments/s.
+
+Usage: python bench_serializer.py [number of comments] [comment log files to replay...]
+'''
+
+import json
+import sys
+import time
+from numbers import Number
+import numpy as np
+from comment_serializer import CommentSerializer, COMMENT_FIELDS, orjson, ujson
+from compressed_log import open_log
+from fake_reddit import synthetic_comments
+
+class _Redditor(object):
+    def __init__(self, name):
+        self.name = name
+
+class _Subreddit(object):
+    def __init__(self, display_name):
+        self.display_name = display_name
+
+def praw_like_dict(comment):
+    '''
+    :param comment: a stored comment (dict)
+
+    :returns: a dict shaped like the __dict__ of the PRAW Comment it was stored from
+    '''
+    d = dict.fromkeys(COMMENT_FIELDS)
+    d.update({"archived": False, "can_gild": True, "collapsed": False, "controversiality": 0, "downs": 0,
+              "edited": False, "gilded": 0, "is_submitter": False, "saved": False, "stickied": False,
+              "mod_reports": [], "user_reports": [], "replies": "", "_reddit": object(), "_fetched": True,
+              "_replies": [], "_submission": None})
+    d.update(comment)
+    if "author" in comment:
+        d["author"] = _Redditor(comment["author"])
+    if "subreddit" in comment:
+        d["subreddit"] = _Subreddit(comment["subreddit"])
+    return d
+
+# reddeat's serialization, before CommentSerializer
+def _to_json(praw_entity):
+    to_dump = {i:j for i, j in praw_entity.iteritems() if not i.startswith('_')}
+    if ('author' in to_dump) and to_dump['author'] and hasattr(to_dump['author'], 'name'):
+        to_dump['author'] = to_dump['author'].name
+    if ('subreddit' in to_dump) and to_dump['subreddit'] and hasattr(to_dump['subreddit'], 'display_name'):
+        to_dump['subreddit'] = to_dump['subreddit'].display_name
+    return json.dumps(to_dump, check_circular=False)
+
+def _check_not_null(x):
+    if isinstance(x, (Number, bool)):
+        return not np.isnan(x)
+    else:
+        return x
+
+def _strip_empty_fields(d):
+    if type(d) is dict:
+        return dict((k, _strip_empty_fields(v)) for k, v in d.iteritems() if _check_not_null(v) and _strip_empty_fields(v))
+    else:
+        return d
+
+def bench(name, serialize, comments, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start_time = time.time()
+        lines = [serialize(c) for c in comments]
+        elapsed = time.time() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    print "%-24s %10.0f comments/s" % (name, len(comments) / best)
+    return lines
+
+if __name__ == '__main__':
+    n_comments = int(sys.argv[1]) if len(sys.argv) > 1 else 10**5
+    if len(sys.argv) > 2:
+        stored = []
+        for fpath in sys.argv[2:]:
+            with open_log(fpath) as f:
+                stored.extend(json.loads(line) for line in f if line.strip())
+        stored = stored[:n_comments]
+    else:
+        stored = list(synthetic_comments(n_comments))
+    comments = [praw_like_dict(c) for c in stored]
+    print "%d comments" % (len(comments),)
+
+    expected = [json.loads(line) for line in bench("to_json/strip_empty_fields", lambda c: _to_json(_strip_empty_fields(c)), comments)]
+    for backend, available in [("json", True), ("ujson", ujson), ("orjson", orjson)]:
+        if not available:
+            print "%-24s not installed" % (backend,)
+            continue
+        serializer = CommentSerializer(json_backend=backend)
+        lines = bench("CommentSerializer/%s" % (backend,), lambda c: serializer.serialize(c)[1], comments)
+        assert [json.loads(line) for line in lines] == expected, "%s output differs from to_json/strip_empty_fields" % (backend,)
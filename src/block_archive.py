@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18/oct/2026
+
+Indexed, random-access archive of comment log files.
+
+The comments of a rotated log file are stored in independently compressed blocks of
+roughly BLOCK_SIZE compressed bytes. Concatenated, the blocks are still a valid
+compressed file for the standard tools (e.g. bzip2 -dc log.blocks.bz2), and for
+open_log. A sidecar index, saved with numpy, stores:
+- the position and length of every block in the archive
+- the min/max created_utc and the set of subreddits of every block
+- for every comment, sorted by numeric id: its block, and its offset in the decompressed block
+
+Looking up a comment by fullname only decompresses its block; time slices and
+subreddit queries only decompress the blocks whose time range and subreddit set match.
+
+Usage:
+    python block_archive.py build LOG_FILE [LOG_FILE ...]
+    python block_archive.py get ARCHIVE FULLNAME [FULLNAME ...]
+    python block_archive.py range ARCHIVE START_UTC END_UTC [-s SUBREDDIT]
+'''
+
+import json
+import numpy as np
+from optparse import OptionParser
+from compressed_log import get_codec, open_log
+from fullnames import fullname_to_numeric, numeric_to_fullname
+
+BLOCK_SIZE = 2*1024*1024 # target compressed bytes per block
+ARCHIVE_SUFFIX = ".blocks" # suffix for the archive file, appended to the log file path, before the codec extension
+INDEX_SUFFIX = ".idx" # suffix for the index file, appended to the archive file path
+
+def archive_fpaths(log_fpath, codec="bz2"):
+    '''
+    :returns: (archive path, index path) for a log file
+    '''
+    archive_fpath = log_fpath + ARCHIVE_SUFFIX + get_codec(codec).extension
+    return archive_fpath, archive_fpath + INDEX_SUFFIX
+
+def build_archive(log_fpath, codec="bz2", level=None, block_size=BLOCK_SIZE, log_codec=None):
+    '''
+    Build the block archive and index of a comment log file
+    :param log_fpath: comment log file. comments are json entries, one per line
+    :param codec: codec name for compressing the blocks
+    :param level: compression level. None for the codec's default
+    :param block_size: target compressed bytes per block
+    :param log_codec: codec name of the log file, if compressed. None to guess it from the extension
+
+    :returns: (archive path, index path)
+    '''
+    archive_fpath, index_fpath = archive_fpaths(log_fpath, get_codec(codec).name)
+    with open_log(log_fpath, 'r', log_codec) as log_f:
+        write_archive(log_f, archive_fpath, index_fpath, codec, level, block_size)
+    return archive_fpath, index_fpath
+
+def write_archive(lines, archive_fpath, index_fpath, codec="bz2", level=None, block_size=BLOCK_SIZE):
+    '''
+    Write comment log lines to a block archive and its index
+    :param lines: iterator over comment log lines (unicode). comments are json entries
+    :param archive_fpath: archive file path
+    :param index_fpath: index file path
+    :param codec: codec name for compressing the blocks
+    :param level: compression level. None for the codec's default
+    :param block_size: target compressed bytes per block
+
+    :returns: number of comments written
+    '''
+    codec = get_codec(codec)
+    level = codec.default_level if level is None else level
+    ratio = 5. # expected compression ratio, updated after every block
+    ids, blocks_of, offsets = [], [], []
+    block_positions, block_lengths, block_min_created, block_max_created, block_subreddits = [], [], [], [], []
+    block, block_bytes, subreddits, min_created, max_created = [], 0, set(), float("inf"), float("-inf")
+    with open(archive_fpath, 'wb') as archive_f:
+        def write_block():
+            data = codec.compress_frame("".join(block), level)
+            block_positions.append(archive_f.tell())
+            block_lengths.append(len(data))
+            block_min_created.append(min_created)
+            block_max_created.append(max_created)
+            block_subreddits.append(sorted(subreddits))
+            archive_f.write(data)
+            return float(block_bytes) / len(data)
+        for line in lines:
+            if not line.strip():
+                continue
+            comment = json.loads(line)
+            line = line.rstrip(u"\n").encode("utf8") + "\n"
+            ids.append(fullname_to_numeric(comment["name"]))
+            blocks_of.append(len(block_positions))
+            offsets.append(block_bytes)
+            block.append(line)
+            block_bytes += len(line)
+            created_utc = float(comment.get("created_utc", 0))
+            min_created, max_created = min(min_created, created_utc), max(max_created, created_utc)
+            if "subreddit" in comment:
+                subreddits.add(comment["subreddit"])
+            if block_bytes >= block_size * ratio:
+                ratio = write_block()
+                block, block_bytes, subreddits, min_created, max_created = [], 0, set(), float("inf"), float("-inf")
+        if block:
+            write_block()
+    ids = np.array(ids, dtype=np.int64)
+    order = np.argsort(ids, kind="mergesort")
+    with open(index_fpath, 'wb') as index_f:
+        np.savez(index_f, codec=np.array(codec.name), ids=ids[order],
+                 blocks_of=np.array(blocks_of, dtype=np.int32)[order], offsets=np.array(offsets, dtype=np.int32)[order],
+                 block_positions=np.array(block_positions, dtype=np.int64), block_lengths=np.array(block_lengths, dtype=np.int64),
+                 block_min_created=np.array(block_min_created), block_max_created=np.array(block_max_created),
+                 block_subreddits=np.array(json.dumps(block_subreddits)))
+    return len(ids)
+
+class BlockArchive(object):
+    '''
+    Read-only access to a block archive, through its index
+    '''
+    def __init__(self, archive_fpath, cache_size=4):
+        '''
+        :param archive_fpath: archive file path
+        :param cache_size: how many decompressed blocks to keep in memory
+        '''
+        self.archive_fpath = archive_fpath
+        index = np.load(archive_fpath + INDEX_SUFFIX)
+        self.codec = get_codec(str(index["codec"]))
+        self.ids = index["ids"]
+        self.blocks_of = index["blocks_of"]
+        self.offsets = index["offsets"]
+        self.block_positions = index["block_positions"]
+        self.block_lengths = index["block_lengths"]
+        self.block_min_created = index["block_min_created"]
+        self.block_max_created = index["block_max_created"]
+        self.block_subreddits = [frozenset(s) for s in json.loads(str(index["block_subreddits"]))]
+        self.cache_size = cache_size
+        self.n_decompressed = 0
+        self._cache = [] # (block number, data), most recently used last
+        self._f = open(archive_fpath, 'rb')
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _block(self, i):
+        for cached in self._cache:
+            if cached[0] == i:
+                self._cache.remove(cached)
+                self._cache.append(cached)
+                return cached[1]
+        self._f.seek(self.block_positions[i])
+        data = self.codec.decompressor().decompress(self._f.read(self.block_lengths[i]))
+        self.n_decompressed += 1
+        self._cache.append((i, data))
+        del self._cache[:-self.cache_size]
+        return data
+
+    def get(self, fullname):
+        '''
+        :param fullname: comment fullname
+
+        :returns: the comment (dict), or None if it is not in the archive
+        '''
+        numeric_id = fullname_to_numeric(fullname)
+        i = np.searchsorted(self.ids, numeric_id)
+        if i == len(self.ids) or self.ids[i] != numeric_id:
+            return None
+        data = self._block(self.blocks_of[i])
+        offset = self.offsets[i]
+        return json.loads(data[offset:data.index("\n", offset)].decode("utf8"))
+
+    def fullnames(self):
+        '''
+        :returns: generator of the fullnames in the archive, in id order
+        '''
+        return (numeric_to_fullname(int(numeric_id)) for numeric_id in self.ids)
+
+    def blocks(self, start_utc=None, end_utc=None, subreddit=None):
+        '''
+        :returns: numbers of the blocks that may contain comments posted in [start_utc, end_utc), in subreddit
+        '''
+        matching = np.ones(len(self.block_positions), dtype=bool)
+        if start_utc is not None:
+            matching &= self.block_max_created >= start_utc
+        if end_utc is not None:
+            matching &= self.block_min_created < end_utc
+        return [i for i in np.flatnonzero(matching) if subreddit is None or subreddit in self.block_subreddits[i]]
+
+    def query(self, start_utc=None, end_utc=None, subreddit=None):
+        '''
+        :param start_utc: only return comments posted at or after this time
+        :param end_utc: only return comments posted before this time
+        :param subreddit: only return comments posted in this subreddit
+
+        :returns: generator of comments (dicts), in log file order
+        '''
+        for i in self.blocks(start_utc, end_utc, subreddit):
+            for line in self._block(i).splitlines():
+                comment = json.loads(line.decode("utf8"))
+                created_utc = float(comment.get("created_utc", 0))
+                if start_utc is not None and created_utc < start_utc:
+                    continue
+                if end_utc is not None and created_utc >= end_utc:
+                    continue
+                if subreddit is not None and comment.get("subreddit") != subreddit:
+                    continue
+                yield comment
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def main():
+    parser = OptionParser(usage="%prog build LOG_FILE [LOG_FILE ...]\n"
+                                "       %prog get ARCHIVE FULLNAME [FULLNAME ...]\n"
+                                "       %prog range ARCHIVE START_UTC END_UTC [-s SUBREDDIT]")
+    parser.add_option("-z", "--compression", action="store", type="string", dest="codec", default="bz2", help="codec for compressing the blocks (build)")
+    parser.add_option("-c", "--compression_level", action="store", type="int", dest="level", default=None, help="compression level (build)")
+    parser.add_option("-b", "--block_size", action="store", type="int", dest="block_size", default=BLOCK_SIZE, help="target compressed bytes per block (build)")
+    parser.add_option("-s", "--subreddit", action="store", type="string", dest="subreddit", default=None, help="only return comments posted in this subreddit (range)")
+    (options, args) = parser.parse_args()
+    if len(args) < 2 or args[0] not in ("build", "get", "range"):
+        parser.error("unknown command")
+    command, args = args[0], args[1:]
+    if command == "build":
+        for log_fpath in args:
+            print build_archive(log_fpath, options.codec, options.level, options.block_size)[0]
+        return
+    with BlockArchive(args[0]) as archive:
+        if command == "get":
+            comments = (archive.get(fullname) for fullname in args[1:])
+        else:
+            if len(args) != 3:
+                parser.error("range needs START_UTC and END_UTC")
+            comments = archive.query(float(args[1]), float(args[2]), options.subreddit)
+        for comment in comments:
+            print json.dumps(comment) if comment is not None else ""
+
+if __name__ == '__main__':
+    main()
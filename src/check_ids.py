@@ -1,26 +1,51 @@
 '''
 Created on 25/apr/2016
 
+Explore missing comment fullnames, from a list of crawled ids (ids.txt, with
+fullname, created and crawled time), or from comment log files, through their
+columnar export (see columnar).
+
+Usage: python check_ids.py [LOG_FILE ...]
+
 @author: Mattia
 '''
 
 
 import pandas as pd
-from datetime import datetime
 import matplotlib.pyplot as plt
 import numpy as np
-from praw.helpers import convert_id36_to_numeric_id, convert_numeric_id_to_id36
 import seaborn as sns
 # sns.set_palette("hls")
 sns.set_style("whitegrid", {'axes.grid' : False})
 import time
+import sys
 import praw
+from columnar import convert_logs, load_columns
+from fullnames import fullnames_to_numeric, numeric_to_fullnames
+from gap_detector import missing_intervals, expand_intervals
+
+def load_log_ids(log_fpaths):
+    '''
+    Load comment ids and creation times from comment log files, converting them to columnar files if needed
+    :param log_fpaths: comment log files
+
+    :returns: DataFrame with numeric id, fullname, and created time, in seconds
+    '''
+    columns = load_columns([log_columns for log_columns, _ in convert_logs(log_fpaths)], ["id", "created_utc"])
+    return pd.DataFrame({"num_ids": columns["id"], "created": columns["created_utc"],
+                         "id": numeric_to_fullnames(columns["id"])})
+
 if __name__ == '__main__':
     fname = "ids.txt"
-    df = pd.read_csv(fname, header = None, names = ["id", "created", "crawled"])
+    if len(sys.argv) > 1:
+        # comment logs do not record when comments were crawled: use the creation time
+        df = load_log_ids(sys.argv[1:])
+        df["crawled"] = df.created
+    else:
+        df = pd.read_csv(fname, header = None, names = ["id", "created", "crawled"])
     df.dropna(inplace=True)
-    df["created_utc"] = df.created.apply(lambda x: datetime.utcfromtimestamp(x))
-    df["crawled_utc"] = df.crawled.apply(lambda x: datetime.utcfromtimestamp(x))
+    df["created_utc"] = pd.to_datetime(df.created, unit="s")
+    df["crawled_utc"] = pd.to_datetime(df.crawled, unit="s")
     print "crawl started:", df.crawled_utc.min()
     print "crawl ended:", df.crawled_utc.max()
     print "crawl lasted for:", df.crawled_utc.max()-df.crawled_utc.min()
@@ -28,7 +53,7 @@ if __name__ == '__main__':
     print "avg comment rate: %2.4f comments per second" % (len(df)/(df.crawled_utc.max()-df.crawled_utc.min()).total_seconds())
 #     plt.show()
 #     print df.id.apply(lambda x: convert_id36_to_numeric_id(str(x[3:])))
-    df["num_ids"] = df.id.apply(lambda x: convert_id36_to_numeric_id(str(x[3:])))
+    df["num_ids"] = fullnames_to_numeric(df.id.values)
     num_ids=df["num_ids"]
 #     print df.describe()
     df.set_index("num_ids", inplace=True)
@@ -36,10 +61,12 @@ if __name__ == '__main__':
     ax=df.crawl_lag.plot(kind="area", zorder=300, alpha=.8, lw=0)
 #     plt.savefig("crawl lag in seconds.pdf")
 #     print "missing ids:", num_ids.max()-num_ids.min() - len(num_ids), "/", len(num_ids)
-    missing_ids = pd.Series(sorted(set(range(num_ids.min(), num_ids.max()+1)) - set(num_ids)))#.apply(lambda x: u"t1_"+convert_numeric_id_to_id36(int(x)))
+    # runs of missing ids, as (start, length)
+    missing_starts, missing_lengths = missing_intervals(num_ids.values)
+    print "missing ids: %d in %d runs" % (missing_lengths.sum(), len(missing_lengths))
 #     print df.index.min()
-    for i in missing_ids:
-        plt.axvline(i, color='k', alpha=.2, zorder=0)
+    ymin, ymax = ax.get_ylim()
+    ax.broken_barh(zip(missing_starts, missing_lengths), (ymin, ymax - ymin), color='k', alpha=.2, zorder=0)
 #     pd.DataFrame(data = zip(missing_ids.values, np.ones_like(missing_ids.values))).plot(ls="^")
 #     sns.despine()
     ax.grid(False)
@@ -47,7 +74,7 @@ if __name__ == '__main__':
     
     USER_AGENT = "python:automod:v0.1 (by /u/hide_ous)"
     r = praw.Reddit(USER_AGENT)
-    ids = list(missing_ids.apply(lambda x: u"t1_"+convert_numeric_id_to_id36(int(x))))
+    ids = list(numeric_to_fullnames(expand_intervals(missing_starts, missing_lengths)))
     times = []
     limit=100
     results=[]
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18/oct/2026
+
+Durable progress records for re-fetching rotated comment log files, so that a
+restarted crawler resumes the unfinished files instead of re-fetching them from the
+start, or never re-fetching them at all.
+
+Each rotated log file being re-fetched has a small json checkpoint file next to it,
+recording how many bytes of the log file have been re-fetched, how long the removed
+comment log file was at that point, and whether the file is only waiting to be
+archived. Checkpoints are replaced atomically (write to a temporary file, fsync,
+rename), and removed once the log file is archived.
+
+Log files re-fetched by the recheck scheduler are not re-fetched in file order: their
+checkpoint stays at offset 0, and comes with a snapshot of the ids of the comments
+done with (see seen_set), which a resumed re-fetch skips.
+'''
+
+import json
+import os
+from seen_set import SeenSet
+
+CHECKPOINT_SUFFIX = ".checkpoint" # suffix for the checkpoint file, appended to the rotated log file path
+DONE_SUFFIX = ".done" # suffix for the snapshot of the ids of the comments done with, appended to the checkpoint file path
+RECHECKING = "rechecking" # comments up to offset have been re-fetched
+RECHECKED = "rechecked" # all comments have been re-fetched, the files are waiting to be archived
+
+class RecheckCheckpoint(object):
+    '''
+    Re-fetch progress of a rotated comment log file
+    '''
+    def __init__(self, fpath, offset=0, removed_size=0, state=RECHECKING):
+        '''
+        :param fpath: rotated comment log file path
+        :param offset: how many (uncompressed) bytes of the log file have been re-fetched
+        :param removed_size: size of the removed comment log file, once those bytes were re-fetched
+        :param state: RECHECKING or RECHECKED
+        '''
+        self.fpath = fpath
+        self.offset = offset
+        self.removed_size = removed_size
+        self.state = state
+
+    @property
+    def checkpoint_fpath(self):
+        return self.fpath + CHECKPOINT_SUFFIX
+
+    @property
+    def done_fpath(self):
+        return self.checkpoint_fpath + DONE_SUFFIX
+
+    @classmethod
+    def load(cls, fpath):
+        '''
+        :param fpath: rotated comment log file path
+
+        :returns: the saved checkpoint for fpath, or None if there is none
+        '''
+        try:
+            with open(fpath + CHECKPOINT_SUFFIX, 'rb') as f:
+                saved = json.load(f)
+        except IOError:
+            return None
+        return cls(fpath, saved["offset"], saved["removed_size"], saved["state"])
+
+    def save(self):
+        '''
+        Atomically replace the checkpoint file
+        '''
+        tmp_fpath = self.checkpoint_fpath + ".tmp"
+        with open(tmp_fpath, 'wb') as f:
+            json.dump({"offset": self.offset, "removed_size": self.removed_size, "state": self.state}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_fpath, self.checkpoint_fpath)
+
+    def save_done(self, done):
+        '''
+        Atomically replace the snapshot of the ids of the comments done with
+        :param done: SeenSet of comment ids
+        '''
+        done.save(self.done_fpath)
+
+    def load_done(self):
+        '''
+        :returns: SeenSet of the ids of the comments done with, empty if there is no snapshot
+        '''
+        return SeenSet.load(self.done_fpath)
+
+    def remove(self):
+        for fpath in (self.done_fpath, self.checkpoint_fpath):
+            if os.path.exists(fpath):
+                os.remove(fpath)
+
+def unfinished_log_files(folder, logger_fname, ext_match):
+    '''
+    Find the rotated comment log files left by a previous run: the ones that were
+    not archived yet, and the ones whose checkpoint says they were partially archived
+    :param folder: comment log folder
+    :param logger_fname: comment log file name
+    :param ext_match: compiled regex matching the date suffix of rotated log files
+        (TimedRotatingFileHandler.extMatch)
+
+    :returns: sorted list of rotated log file paths
+    '''
+    prefix = logger_fname + "."
+    fpaths = set()
+    for fname in os.listdir(folder):
+        if not fname.startswith(prefix):
+            continue
+        if fname.endswith(CHECKPOINT_SUFFIX + DONE_SUFFIX):
+            fname = fname[:-len(CHECKPOINT_SUFFIX + DONE_SUFFIX)]
+        elif fname.endswith(CHECKPOINT_SUFFIX):
+            fname = fname[:-len(CHECKPOINT_SUFFIX)]
+        if ext_match.match(fname[len(prefix):]):
+            fpaths.add(os.path.join(folder, fname))
+    return sorted(fpaths)
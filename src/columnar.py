@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18/oct/2026
+
+Columnar export of comment log files, for analytics.
+
+Every log file (rotated, archived, or removed comment log file) is converted once
+into a typed columnar file next to it, holding one numpy array per comment field:
+ids decoded from base36 into int64 (in a single vectorized pass, see fullnames),
+timestamps as int64 seconds, counters as small ints, and the subreddit and author
+dictionary-encoded (int32 codes into a sorted array of distinct values). Columns are
+stored as a compressed .npz file, or as a Parquet file with dictionary-encoded
+columns, if pyarrow is installed.
+
+Removed comment log files in delta format (see removal_delta) are joined back with
+their main log first, so that their columns hold the whole re-fetched comments.
+
+Conversion is incremental: files whose columnar version is newer than the log file
+are skipped. load_columns concatenates the columns of many files, merging their
+dictionaries, so analyses (e.g. check_ids) run vectorized over months of data.
+
+Usage: python columnar.py [--parquet] LOG_FILE [LOG_FILE ...]
+'''
+
+import json
+import os
+import numpy as np
+from optparse import OptionParser
+from compressed_log import open_log, codec_for_path
+from fullnames import fullnames_to_numeric
+from removal_delta import read_removed, main_log_fpath, is_delta, META_FIELDS
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+COLUMNS_SUFFIX = ".columns.npz" # suffix for the columnar file, replacing the codec extension of the log file
+PARQUET_SUFFIX = ".parquet" # suffix for the Parquet file, replacing the codec extension of the log file
+REMOVED_FILE_SUFFIX = ".removed" # as in reddeat
+
+# column name -> (comment field, dtype)
+NUMERIC_COLUMNS = (
+    ("created_utc", "created_utc", np.int64),
+    ("score", "score", np.int32),
+    ("controversiality", "controversiality", np.int8),
+    ("gilded", "gilded", np.int16),
+    ("removal_reasons", "removal_reasons", np.uint32), # removed comment log files only (see removal_classifier)
+    )
+FULLNAME_COLUMNS = ( # decoded into int64 ids
+    ("id", "name"),
+    ("link_id", "link_id"),
+    ("parent_id", "parent_id"),
+    )
+DICTIONARY_COLUMNS = ("subreddit", "author")
+
+def columnar_fpath(fpath, suffix=COLUMNS_SUFFIX):
+    '''
+    :returns: path of the columnar version of a log file
+    '''
+    codec = codec_for_path(fpath)
+    if codec:
+        fpath = fpath[:-len(codec.extension)]
+    return fpath + suffix
+
+def dictionary_encode(values):
+    '''
+    :param values: sequence of strings
+
+    :returns: (int32 codes, sorted array of distinct values)
+    '''
+    dictionary, codes = np.unique(np.asarray(values, dtype=np.unicode_), return_inverse=True)
+    return codes.astype(np.int32), dictionary
+
+def is_removed_fpath(fpath, removed_fsuffix=REMOVED_FILE_SUFFIX):
+    '''
+    :returns: whether a log file is a removed comment log file
+    '''
+    codec = codec_for_path(fpath)
+    if codec:
+        fpath = fpath[:-len(codec.extension)]
+    return fpath.endswith(removed_fsuffix)
+
+def read_comments(fpath, codec=None, removed_fsuffix=REMOVED_FILE_SUFFIX, throttle=None):
+    '''
+    :param fpath: comment log file, or removed comment log file
+    :param codec: codec name of the log file, if compressed. None to guess it from the extension
+    :param removed_fsuffix: removed comment log file suffix, appended to the log file path (before the codec extension)
+    :param throttle: function wrapping the iterator over the lines read from the file, e.g. to keep under an I/O budget. None for no throttling
+
+    :returns: iterator over the comments (dicts) of the file. The delta records of a removed comment log
+        file are joined back with their originals: they yield the re-fetched comment, or for the comments
+        Reddit did not return, the original with the removal fields of the record
+    '''
+    throttle = throttle or (lambda lines: lines)
+    if is_removed_fpath(fpath, removed_fsuffix):
+        with open_log(fpath, 'r', codec) as log_f:
+            delta = any(is_delta(json.loads(line)) for line in throttle(log_f) if line.strip())
+        if delta:
+            for _, original, after, record in read_removed(fpath, main_log_fpath(fpath, removed_fsuffix), codec):
+                if after is None:
+                    after = dict(original or {})
+                    after.update((k, v) for k, v in record.iteritems() if k in META_FIELDS)
+                yield after
+            return
+    with open_log(fpath, 'r', codec) as log_f:
+        for line in throttle(log_f):
+            if line.strip():
+                yield json.loads(line)
+
+def read_columns(fpath, codec=None, removed_fsuffix=REMOVED_FILE_SUFFIX, throttle=None):
+    '''
+    Parse a comment log file into columns
+    :param fpath: comment log file. comments are json entries, one per line
+    :param codec: codec name of the log file, if compressed. None to guess it from the extension
+    :param removed_fsuffix: removed comment log file suffix, to tell the removed comment log files to join back with their main log
+    :param throttle: function wrapping the iterator over the lines read, as for read_comments
+
+    :returns: dict of column name -> array. Dictionary-encoded columns are stored
+        as name_codes and name_dictionary
+    '''
+    fields = dict((field, []) for field in
+                  [field for _, field, _ in NUMERIC_COLUMNS] + [field for _, field in FULLNAME_COLUMNS] + list(DICTIONARY_COLUMNS) + ["body"])
+    for comment in read_comments(fpath, codec, removed_fsuffix, throttle):
+        for field, values in fields.iteritems():
+            values.append(comment.get(field))
+    columns = {}
+    for name, field, dtype in NUMERIC_COLUMNS:
+        columns[name] = np.array([v or 0 for v in fields[field]], dtype=np.float64).astype(dtype)
+    for name, field in FULLNAME_COLUMNS:
+        columns[name] = fullnames_to_numeric([v or "0" for v in fields[field]])
+    # parents are either comments (t1_) or the submission itself (t3_)
+    columns["parent_is_comment"] = np.array([(v or "").startswith("t1_") for v in fields["parent_id"]], dtype=bool)
+    columns["body_length"] = np.array([len(v or "") for v in fields["body"]], dtype=np.int32)
+    for name in DICTIONARY_COLUMNS:
+        columns[name + "_codes"], columns[name + "_dictionary"] = dictionary_encode([v or u"" for v in fields[name]])
+    return columns
+
+def write_parquet(columns, fpath):
+    '''
+    Write columns, as returned by read_columns, to a Parquet file with dictionary-encoded columns
+    '''
+    names, arrays = [], []
+    for name, values in sorted(columns.iteritems()):
+        if name.endswith("_dictionary"):
+            continue
+        if name.endswith("_codes"):
+            name = name[:-len("_codes")]
+            values = pyarrow.DictionaryArray.from_arrays(pyarrow.array(values), pyarrow.array(columns[name + "_dictionary"]))
+        else:
+            values = pyarrow.array(values)
+        names.append(name)
+        arrays.append(values)
+    pyarrow.parquet.write_table(pyarrow.Table.from_arrays(arrays, names), fpath)
+
+def convert_log(fpath, codec=None, parquet=False, force=False, removed_fsuffix=REMOVED_FILE_SUFFIX):
+    '''
+    Convert a comment log file to its columnar version, unless it is up to date
+    :param fpath: comment log file
+    :param codec: codec name of the log file, if compressed. None to guess it from the extension
+    :param parquet: write a Parquet file instead of a .npz file (requires pyarrow)
+    :param force: convert even if the columnar version is up to date
+    :param removed_fsuffix: removed comment log file suffix, as for read_columns
+
+    :returns: path of the columnar version
+    '''
+    dest_fpath = columnar_fpath(fpath, PARQUET_SUFFIX if parquet else COLUMNS_SUFFIX)
+    if not force and os.path.exists(dest_fpath) and os.path.getmtime(dest_fpath) >= os.path.getmtime(fpath):
+        return dest_fpath
+    columns = read_columns(fpath, codec, removed_fsuffix)
+    # write to a temporary file, so that an interrupted conversion is not mistaken for a complete one
+    tmp_fpath = dest_fpath + ".tmp"
+    if parquet:
+        if not pyarrow:
+            raise ValueError("pyarrow is not installed")
+        write_parquet(columns, tmp_fpath)
+    else:
+        with open(tmp_fpath, 'wb') as f:
+            np.savez_compressed(f, **columns)
+    os.rename(tmp_fpath, dest_fpath)
+    return dest_fpath
+
+def convert_logs(fpaths, codec=None, parquet=False, force=False, removed_fsuffix=REMOVED_FILE_SUFFIX):
+    '''
+    Convert comment log files, and their removed comment log files, if any
+    :param fpaths: comment log files
+    :param codec: codec name of the log files, if compressed. None to guess it from the extensions
+    :param parquet: write Parquet files instead of .npz files (requires pyarrow)
+    :param force: convert even if the columnar versions are up to date
+    :param removed_fsuffix: removed comment log file suffix, appended to the log file path (before the codec extension)
+
+    :returns: list of (columnar version of the log file, columnar version of the removed comment log file, or None)
+    '''
+    converted = []
+    for fpath in fpaths:
+        log_codec = codec_for_path(fpath)
+        extension = log_codec.extension if log_codec else ""
+        removed_fpath = fpath[:len(fpath)-len(extension)] + removed_fsuffix + extension
+        converted.append((convert_log(fpath, codec, parquet, force, removed_fsuffix),
+                          convert_log(removed_fpath, codec, parquet, force, removed_fsuffix) if os.path.exists(removed_fpath) else None))
+    return converted
+
+def load_columns(fpaths, names=None):
+    '''
+    Load and concatenate the columns of many .npz columnar files, merging their dictionaries
+    :param fpaths: columnar file paths, as returned by convert_log
+    :param names: column names to load (dictionary-encoded columns by their base name). None for all
+
+    :returns: dict of column name -> array. Dictionary-encoded columns are returned
+        as name_codes and name_dictionary, with codes into the merged dictionary
+    '''
+    loaded = [np.load(fpath) for fpath in fpaths]
+    if not loaded:
+        return {}
+    all_names = set(name[:-len("_codes")] if name.endswith("_codes") else name for name in loaded[0].files
+                    if not name.endswith("_dictionary"))
+    columns = {}
+    for name in (names or all_names):
+        if name in DICTIONARY_COLUMNS:
+            dictionaries = [f[name + "_dictionary"] for f in loaded]
+            dictionary = np.unique(np.concatenate(dictionaries))
+            columns[name + "_codes"] = np.concatenate([np.searchsorted(dictionary, d).astype(np.int32)[f[name + "_codes"]]
+                                                       for f, d in zip(loaded, dictionaries)])
+            columns[name + "_dictionary"] = dictionary
+        else:
+            columns[name] = np.concatenate([f[name] for f in loaded])
+    return columns
+
+def main():
+    parser = OptionParser(usage="%prog [--parquet] LOG_FILE [LOG_FILE ...]")
+    parser.add_option("--parquet", action="store_true", dest="parquet", default=False, help="write Parquet files instead of .npz files (requires pyarrow)")
+    parser.add_option("-f", "--force", action="store_true", dest="force", default=False, help="convert files whose columnar version is up to date")
+    (options, args) = parser.parse_args()
+    if not args:
+        parser.error("no log files")
+    for converted in convert_logs(args, parquet=options.parquet, force=options.force):
+        print " ".join(fpath for fpath in converted if fpath)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18/oct/2026
+
+Fast path for turning PRAW comments into the json lines stored by reddeat.
+
+Equivalent to to_json(strip_empty_fields(comment.__dict__)): private attributes are
+skipped, null/empty/zero/NaN values are dropped (recursively, for dicts), and the author
+and subreddit are stored by name. Instead of filtering every attribute of the comment,
+the serializer only looks at a fixed list of known comment fields, in a single pass.
+Every sample_every comments, it checks for fields it does not know of yet, so that
+fields added to the API are not silently dropped.
+
+The json encoding is done by orjson or ujson, when installed, or by a pre-built
+json.JSONEncoder otherwise. The fast backends write non-ASCII characters as they are,
+except for the ones that readers may take for line breaks (U+0085, U+2028, U+2029),
+which are escaped, as json does, so that a comment always takes a single line.
+'''
+
+import json
+import logging
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+# public attributes of PRAW Comment instances
+COMMENT_FIELDS = (
+    "approved_at_utc", "approved_by", "archived", "author", "author_flair_css_class", "author_flair_text",
+    "banned_at_utc", "banned_by", "body", "body_html", "can_gild", "can_mod_post", "collapsed", "collapsed_reason",
+    "controversiality", "created", "created_utc", "distinguished", "downs", "edited", "gilded", "id",
+    "is_submitter", "likes", "link_author", "link_id", "link_permalink", "link_title", "link_url", "mod_note",
+    "mod_reason_by", "mod_reason_title", "mod_reports", "name", "num_comments", "num_reports", "over_18",
+    "parent_id", "permalink", "quarantine", "removal_reason", "replies", "report_reasons", "report_reason",
+    "saved", "score", "score_hidden", "stickied", "subreddit", "subreddit_id", "subreddit_name_prefixed",
+    "subreddit_type", "ups", "user_reports",
+    )
+
+def _strip_empty_fields(d):
+    '''
+    Single-pass, numpy-free version of reddeat.strip_empty_fields for nested dicts
+    '''
+    stripped = {}
+    for k, v in d.iteritems():
+        if type(v) is dict:
+            v = _strip_empty_fields(v)
+        if v and v == v:
+            stripped[k] = v
+    return stripped
+
+def _escape_line_breaks(s):
+    '''
+    :returns: the json string s, with the unicode line and paragraph separators escaped
+    '''
+    return s.replace(u"\x85", u"\\u0085").replace(u"\u2028", u"\\u2028").replace(u"\u2029", u"\\u2029")
+
+def json_encoder(backend="auto"):
+    '''
+    :param backend: "orjson", "ujson", "json", or "auto" for the fastest one installed
+
+    :returns: (backend name, function encoding a dict as a json string)
+    '''
+    if backend == "auto":
+        backend = orjson and "orjson" or ujson and "ujson" or "json"
+    if backend == "orjson":
+        if not orjson:
+            raise ValueError("orjson is not installed")
+        return backend, lambda d: _escape_line_breaks(orjson.dumps(d).decode("utf8"))
+    if backend == "ujson":
+        if not ujson:
+            raise ValueError("ujson is not installed")
+        # ujson returns utf8-encoded str on python 2
+        return backend, lambda d: _escape_line_breaks(ujson.dumps(d, ensure_ascii=False, escape_forward_slashes=False).decode("utf8"))
+    if backend == "json":
+        return backend, json.JSONEncoder(check_circular=False).encode
+    raise ValueError("unknown json backend %s" % (backend,))
+
+class CommentSerializer(object):
+    '''
+    Serializer for PRAW comments, over a fixed list of fields
+    '''
+    def __init__(self, fields=COMMENT_FIELDS, json_backend="auto", sample_every=1000, logger_name=None):
+        '''
+        :param fields: comment fields to look at
+        :param json_backend: "orjson", "ujson", "json", or "auto" for the fastest one installed
+        :param sample_every: check a comment for unknown fields every this many comments. 0 to never check
+        :param logger_name: name of the logger to report new fields to
+        '''
+        self.fields = list(fields)
+        self.json_backend, self.dumps = json_encoder(json_backend)
+        self.sample_every = sample_every
+        self.logger_name = logger_name
+        self._countdown = 0
+
+    def strip(self, d):
+        '''
+        :param d: comment attributes (the __dict__ of a PRAW Comment)
+
+        :returns: a dict with the non-empty fields of d, with the author and subreddit stored by name
+        '''
+        if self.sample_every:
+            self._countdown -= 1
+            if self._countdown <= 0:
+                self._countdown = self.sample_every
+                self._learn_fields(d)
+        stripped = {}
+        for k in self.fields:
+            v = d.get(k)
+            if not v:
+                continue
+            t = type(v)
+            if t is float:
+                if v != v:
+                    continue
+            elif t is dict:
+                v = _strip_empty_fields(v)
+                if not v:
+                    continue
+            elif k == "author":
+                v = getattr(v, "name", v)
+            elif k == "subreddit":
+                v = getattr(v, "display_name", v)
+            stripped[k] = v
+        return stripped
+
+    def serialize(self, d):
+        '''
+        :param d: comment attributes (the __dict__ of a PRAW Comment)
+
+        :returns: (stripped dict, json-encoded stripped dict)
+        '''
+        stripped = self.strip(d)
+        return stripped, self.dumps(stripped)
+
+    def _learn_fields(self, d):
+        known = set(self.fields)
+        new_fields = sorted(k for k in d if not (k.startswith('_') or k in known))
+        if new_fields:
+            self.fields.extend(new_fields)
+            if self.logger_name:
+                logging.getLogger(self.logger_name).info("new comment fields: %s" % (", ".join(new_fields),))
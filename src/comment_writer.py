@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18/oct/2026
+
+Background writer for the comment log, decoupling the thread polling Reddit from disk
+writes. The ingest loop puts serialized comments in a bounded in-memory queue; a
+writer thread takes them out in large batches, and logs each batch as a single record,
+so the logging lock, the handler formatting and the file write are paid once per batch.
+
+When the queue is full, put applies a backpressure policy:
+- block: wait for the writer to make room (no comment is lost, but ingest stalls)
+- drop_oldest: discard the oldest queued comment (ingest never stalls)
+- spill: append the comment to a spill file, replayed by the writer once the queue
+  drains (ingest never stalls, at the cost of a plain file write)
+
+Each queued item carries an extra json-serializable value, handed with the comment
+to a callback once the batch is on disk. A batch whose write or callback fails is
+logged to the error logger, and the writer goes on with the next one.
+'''
+
+import codecs
+import collections
+import json
+import logging
+import os
+import threading
+import time
+
+BLOCK, DROP_OLDEST, SPILL = "block", "drop_oldest", "spill"
+POLICIES = (BLOCK, DROP_OLDEST, SPILL)
+
+class BatchedLogWriter(object):
+    '''
+    Bounded queue of log lines, written in batches by a background thread
+    '''
+    def __init__(self, logger, max_queue=10000, batch_size=1000, policy=BLOCK, spill_fpath=None, on_written=None,
+                 error_logger_name="comment_writer"):
+        '''
+        :param logger: logging.Logger the lines are written to
+        :param max_queue: maximum number of queued lines
+        :param batch_size: maximum number of lines written as a single log record
+        :param policy: what put does when the queue is full: block, drop_oldest, or spill
+        :param spill_fpath: spill file path, needed by the spill policy
+        :param on_written: function called by the writer thread with the list of (line, extra)
+            tuples of each batch, after the batch has been logged
+        :param error_logger_name: logger for the batches whose write or callback failed, which do not stop the writer
+        '''
+        if policy not in POLICIES:
+            raise ValueError("unknown backpressure policy %s (available: %s)" % (policy, ", ".join(POLICIES)))
+        if policy == SPILL and not spill_fpath:
+            raise ValueError("the spill policy needs a spill file")
+        self.logger = logger
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.policy = policy
+        self.spill_fpath = spill_fpath
+        self.on_written = on_written
+        self.error_logger = logging.getLogger(error_logger_name)
+        # counters
+        self.queued, self.written, self.dropped, self.spilled, self.batches, self.errors = 0, 0, 0, 0, 0, 0
+        self.max_queue_depth = 0
+        self.blocked_time = 0.
+        self.total_write_latency, self.max_write_latency = 0., 0.
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._spill_f = None
+        self._spill_pending = False
+        self._stopping = False
+        self._thread = threading.Thread(target=self._work, name="comment_writer")
+        self._thread.setDaemon(True)
+
+    def start(self):
+        # replay comments spilled before a restart
+        with self._cond:
+            self._spill_pending = bool(self.spill_fpath) and os.path.exists(self.spill_fpath)
+        self._thread.start()
+        return self
+
+    def put(self, line, extra=None):
+        '''
+        Queue a line for writing, applying the backpressure policy if the queue is full
+        :param line: log line
+        :param extra: json-serializable value, passed to on_written with the line
+        '''
+        with self._cond:
+            self.queued += 1
+            if len(self._queue) >= self.max_queue:
+                if self.policy == BLOCK:
+                    start_time = time.time()
+                    while len(self._queue) >= self.max_queue:
+                        self._cond.wait()
+                    self.blocked_time += time.time() - start_time
+                elif self.policy == DROP_OLDEST:
+                    self._queue.popleft()
+                    self.dropped += 1
+                else:
+                    if self._spill_f is None:
+                        self._spill_f = codecs.open(self.spill_fpath, "a", encoding="utf8")
+                    self._spill_f.write(json.dumps([line, extra]) + u"\n")
+                    self._spill_f.flush()
+                    self.spilled += 1
+                    self._spill_pending = True
+                    return
+            self._queue.append((line, extra))
+            self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+            if len(self._queue) == 1:
+                self._cond.notify_all()
+
+    def stop(self):
+        '''
+        Write out all queued and spilled lines, and stop the writer thread
+        '''
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def stats(self):
+        '''
+        :returns: dict of counters: queue depth and its high-water mark, lines written/dropped/spilled,
+            time spent blocked by put, write latency per batch, and failed batches
+        '''
+        with self._cond:
+            return {'queue_depth': len(self._queue), 'max_queue_depth': self.max_queue_depth,
+                    'queued': self.queued, 'written': self.written, 'dropped': self.dropped,
+                    'spilled': self.spilled, 'blocked_time': self.blocked_time, 'batches': self.batches, 'errors': self.errors,
+                    'mean_write_latency': self.total_write_latency / self.batches if self.batches else 0.,
+                    'max_write_latency': self.max_write_latency}
+
+    def _next_batch(self):
+        '''
+        :returns: the next batch to write, or None if the writer should stop
+        '''
+        with self._cond:
+            while not self._queue:
+                if self._spill_pending:
+                    return self._take_spilled()
+                if self._stopping:
+                    return None
+                self._cond.wait()
+            batch = [self._queue.popleft() for _ in xrange(min(self.batch_size, len(self._queue)))]
+            # wake up producers blocked on a full queue
+            self._cond.notify_all()
+            return batch
+
+    def _take_spilled(self):
+        '''
+        Move the spill file out of the way, and return its contents. Called with the lock held
+        '''
+        # a failing replay is not retried: the spill file is left in place
+        self._spill_pending = False
+        if self._spill_f is not None:
+            self._spill_f.close()
+            self._spill_f = None
+        replay_fpath = self.spill_fpath + ".replay"
+        os.rename(self.spill_fpath, replay_fpath)
+        batch = []
+        with codecs.open(replay_fpath, "r", encoding="utf8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    batch.append(tuple(json.loads(line)))
+                except ValueError:
+                    # e.g. the last line, cut by a crash while spilling
+                    self.errors += 1
+                    self.error_logger.error("unreadable spilled line dropped: %r" % (line[:100],))
+        os.remove(replay_fpath)
+        return batch
+
+    def _work(self):
+        while True:
+            try:
+                batch = self._next_batch()
+            except Exception:
+                self._failed("replaying the spilled lines failed")
+                continue
+            if batch is None:
+                break
+            for i in xrange(0, len(batch), self.batch_size):
+                try:
+                    self._write(batch[i:i+self.batch_size])
+                except Exception:
+                    # a failing batch loses its lines, or their callback, not the writer
+                    self._failed("writing a batch of %d lines failed" % (len(batch[i:i+self.batch_size]),))
+
+    def _failed(self, message):
+        with self._cond:
+            self.errors += 1
+        self.error_logger.exception(message)
+
+    def _write(self, batch):
+        start_time = time.time()
+        self.logger.info(u"\n".join(line for line, _ in batch))
+        latency = time.time() - start_time
+        with self._cond:
+            self.written += len(batch)
+            self.batches += 1
+            self.total_write_latency += latency
+            self.max_write_latency = max(self.max_write_latency, latency)
+        if self.on_written:
+            self.on_written(batch)
@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18/oct/2026
+
+Compressed-on-write log files.
+
+Log lines are buffered in memory, and written to file as independent compressed
+frames (complete bz2/gzip/xz/zstd streams) once the buffer exceeds a frame size, or
+once a frame has been open for a while. Concatenated frames are still valid archives
+for the standard tools (bzip2 -d, gunzip, xz -d, zstd -d), a crash loses at most the
+frame being buffered, and a rotated log file is already its final archive: it only
+needs to be renamed with the codec extension.
+
+The available codecs are bz2 and gzip, xz if the lzma module (or backports.lzma) is
+installed, and zstd if the zstandard module is installed.
+
+Both rotating handlers hand the path of every rotated log file to a callback right
+after the rollover (see PublishingTimedRotatingFileHandler), so that no file system
+monitor is needed to find out about rotations.
+'''
+
+import bz2
+import codecs
+import io
+import os
+import threading
+import time
+import zlib
+from logging.handlers import TimedRotatingFileHandler
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+FRAME_SIZE = 1024*1024 # uncompressed bytes buffered before a frame is written
+FRAME_INTERVAL = 60 # seconds after which a non-empty frame is written anyway
+
+class Codec(object):
+    '''
+    A compression format: how to compress a frame, how to decompress a stream of frames
+    '''
+    def __init__(self, name, extension, default_level, compress_frame, decompressor):
+        '''
+        :param name: codec name
+        :param extension: file extension, including the dot
+        :param default_level: compression level used if none is given
+        :param compress_frame: function (data, level) -> a complete compressed stream
+        :param decompressor: function returning a new decompressor object, exposing
+            decompress(data) and unused_data, for a single compressed stream
+        '''
+        self.name = name
+        self.extension = extension
+        self.default_level = default_level
+        self.compress_frame = compress_frame
+        self.decompressor = decompressor
+
+def _gzip_frame(data, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16+zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+CODECS = {
+    "bz2": Codec("bz2", ".bz2", 9, lambda data, level: bz2.compress(data, level), bz2.BZ2Decompressor),
+    "gzip": Codec("gzip", ".gz", 6, _gzip_frame, lambda: zlib.decompressobj(16+zlib.MAX_WBITS)),
+    }
+if lzma:
+    CODECS["xz"] = Codec("xz", ".xz", 6, lambda data, level: lzma.compress(data, preset=level), lzma.LZMADecompressor)
+if zstandard:
+    CODECS["zstd"] = Codec("zstd", ".zst", 3, lambda data, level: zstandard.ZstdCompressor(level=level).compress(data),
+                           lambda: zstandard.ZstdDecompressor().decompressobj())
+
+def get_codec(name):
+    '''
+    :param name: codec name, one of CODECS
+
+    :returns: the Codec
+    '''
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError("unknown or unavailable compression codec %s (available: %s)" % (name, ", ".join(sorted(CODECS))))
+
+def codec_for_path(fpath):
+    '''
+    :param fpath: file path
+
+    :returns: the Codec matching the file extension, or None
+    '''
+    for codec in CODECS.itervalues():
+        if fpath.endswith(codec.extension):
+            return codec
+    return None
+
+class CompressionStats(object):
+    '''
+    Thread-safe totals of the bytes compressed, and of the time spent compressing them
+    '''
+    def __init__(self):
+        self.bytes_in, self.bytes_out, self.seconds = 0, 0, 0.
+        self._lock = threading.Lock()
+
+    def add(self, bytes_in, bytes_out, seconds):
+        with self._lock:
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.seconds += seconds
+
+    def as_dict(self):
+        '''
+        :returns: dict with the totals, the compression ratio, and the throughput in uncompressed bytes/s
+        '''
+        with self._lock:
+            return {'bytes_in': self.bytes_in, 'bytes_out': self.bytes_out, 'seconds': self.seconds,
+                    'ratio': float(self.bytes_in) / self.bytes_out if self.bytes_out else None,
+                    'throughput': self.bytes_in / self.seconds if self.seconds else None}
+
+class CompressedStream(object):
+    '''
+    Text file-like object, writing utf8-encoded lines as compressed frames
+    '''
+    def __init__(self, fpath, codec, level=None, frame_size=FRAME_SIZE, frame_interval=FRAME_INTERVAL, mode='ab', stats=None):
+        '''
+        :param fpath: file path. Frames are appended to existing files
+        :param codec: Codec, or codec name
+        :param level: compression level. None for the codec's default
+        :param frame_size: uncompressed bytes buffered before a frame is written
+        :param frame_interval: seconds after which a non-empty frame is written anyway
+        :param mode: file mode
+        :param stats: CompressionStats to add the compressed frames to, or None
+        '''
+        self.codec = codec if isinstance(codec, Codec) else get_codec(codec)
+        self.level = self.codec.default_level if level is None else level
+        self.frame_size = frame_size
+        self.frame_interval = frame_interval
+        self.name = fpath
+        self.bytes_in, self.bytes_out = 0, 0
+        self.stats = stats
+        self._f = open(fpath, mode)
+        self._buffer = []
+        self._buffered = 0
+        self._frame_start = None
+
+    def write(self, s):
+        if isinstance(s, unicode):
+            s = s.encode('utf8')
+        if not self._buffer:
+            self._frame_start = time.time()
+        self._buffer.append(s)
+        self._buffered += len(s)
+        if self._buffered >= self.frame_size or time.time() - self._frame_start >= self.frame_interval:
+            self.flush_frame()
+
+    def flush_frame(self):
+        '''
+        Compress the buffered data as a frame, and write it to file
+        '''
+        if not self._buffer:
+            return
+        data = "".join(self._buffer)
+        start_time = time.time()
+        frame = self.codec.compress_frame(data, self.level)
+        if self.stats is not None:
+            self.stats.add(len(data), len(frame), time.time() - start_time)
+        self._f.write(frame)
+        self._f.flush()
+        self.bytes_in += len(data)
+        self.bytes_out += len(frame)
+        self._buffer, self._buffered = [], 0
+
+    def flush(self):
+        # logging flushes after every record: frames are only written by flush_frame
+        pass
+
+    def close(self):
+        if not self._f.closed:
+            self.flush_frame()
+            self._f.close()
+
+    @property
+    def closed(self):
+        return self._f.closed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class PublishingTimedRotatingFileHandler(TimedRotatingFileHandler):
+    '''
+    TimedRotatingFileHandler calling a function with the rotated log file path after every rollover
+    '''
+    def __init__(self, filename, on_rotated=None, **kwargs):
+        '''
+        :param filename: log file path
+        :param on_rotated: function called with the rotated log file path, from the thread that
+            logged the record triggering the rollover. It should return quickly. None for no callback
+        :param kwargs: TimedRotatingFileHandler arguments
+        '''
+        self.on_rotated = on_rotated
+        TimedRotatingFileHandler.__init__(self, filename, **kwargs)
+
+    def rotated_fpath(self):
+        '''
+        :returns: the path the log file is renamed to by the next rollover, as in TimedRotatingFileHandler.doRollover
+        '''
+        t = self.rolloverAt - self.interval
+        if self.utc:
+            time_tuple = time.gmtime(t)
+        else:
+            time_tuple = time.localtime(t)
+            dst_now, dst_then = time.localtime(time.time())[-1], time_tuple[-1]
+            if dst_now != dst_then:
+                time_tuple = time.localtime(t + (3600 if dst_now else -3600))
+        return self.baseFilename + "." + time.strftime(self.suffix, time_tuple)
+
+    def doRollover(self):
+        rotated_fpath = self.rotated_fpath()
+        TimedRotatingFileHandler.doRollover(self)
+        # nothing is rotated if nothing was logged since the last rollover, with delay=True
+        if self.on_rotated and os.path.exists(rotated_fpath):
+            self.on_rotated(rotated_fpath)
+
+class CompressedTimedRotatingFileHandler(PublishingTimedRotatingFileHandler):
+    '''
+    PublishingTimedRotatingFileHandler writing compressed frames instead of plain text
+    '''
+    def __init__(self, filename, codec="bz2", level=None, frame_size=FRAME_SIZE, frame_interval=FRAME_INTERVAL, **kwargs):
+        '''
+        :param filename: log file path
+        :param codec: codec name, one of CODECS
+        :param level: compression level. None for the codec's default
+        :param frame_size: uncompressed bytes buffered before a frame is written
+        :param frame_interval: seconds after which a non-empty frame is written anyway
+        :param kwargs: PublishingTimedRotatingFileHandler arguments. encoding is ignored: lines are stored as utf8
+        '''
+        self.codec = get_codec(codec)
+        self.compress_level = level # self.level is the logging level
+        self.frame_size = frame_size
+        self.frame_interval = frame_interval
+        self.compression_stats = CompressionStats() # totals across rotations
+        kwargs.pop("encoding", None)
+        PublishingTimedRotatingFileHandler.__init__(self, filename, **kwargs)
+
+    def _open(self):
+        return CompressedStream(self.baseFilename, self.codec, self.compress_level, self.frame_size, self.frame_interval,
+                                stats=self.compression_stats)
+
+    def flush_frame(self):
+        '''
+        Write out the lines buffered so far as a frame, e.g. before recording them as stored
+        '''
+        self.acquire()
+        try:
+            if self.stream:
+                self.stream.flush_frame()
+        finally:
+            self.release()
+
+def open_log(fpath, mode='r', codec=None, level=None):
+    '''
+    Open a log file for reading or appending lines, compressed or not
+    :param fpath: file path
+    :param mode: 'r', 'w', or 'a'
+    :param codec: Codec or codec name. If None, guessed from the file extension
+
+    :returns: a file-like object. When reading, iterating over it yields unicode lines
+    '''
+    codec = get_codec(codec) if isinstance(codec, basestring) else (codec or codec_for_path(fpath))
+    if 'r' in mode:
+        # lines are split on "\n" only, as by _CompressedReader: codecs.open would also split them on U+2028 and the like
+        return _CompressedReader(fpath, codec) if codec else io.open(fpath, 'r', encoding='utf8', newline='\n')
+    if codec:
+        return CompressedStream(fpath, codec, level, mode=mode[0]+'b')
+    return codecs.open(fpath, mode, encoding='utf8')
+
+class _CompressedReader(object):
+    '''
+    Iterate over the lines of a file made of one or more compressed frames
+    '''
+    def __init__(self, fpath, codec, chunk_size=1024*1024):
+        self.codec = codec
+        self.chunk_size = chunk_size
+        self._f = open(fpath, 'rb')
+
+    def __iter__(self):
+        decoder = codecs.getincrementaldecoder('utf8')()
+        partial_line = u""
+        for data in self._iter_decompressed():
+            lines = (partial_line + decoder.decode(data)).split(u"\n")
+            partial_line = lines.pop()
+            for line in lines:
+                yield line + u"\n"
+        partial_line += decoder.decode("", final=True)
+        if partial_line:
+            yield partial_line
+
+    def _iter_decompressed(self):
+        decompressor = self.codec.decompressor()
+        data = self._f.read(self.chunk_size)
+        while data:
+            try:
+                yield decompressor.decompress(data)
+            except EOFError:
+                # the previous frame ended exactly at the end of the last chunk
+                decompressor = self.codec.decompressor()
+                continue
+            # a frame ended: decompress the following ones with a new decompressor
+            unused_data = getattr(decompressor, 'unused_data', "")
+            if unused_data:
+                decompressor = self.codec.decompressor()
+                data = unused_data
+            else:
+                data = self._f.read(self.chunk_size)
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
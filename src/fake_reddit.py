@@ -0,0 +1,400 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18/oct/2026
+
+A local fake of Reddit's info endpoint and comment listing, for exercising the
+ingest and re-fetch code without touching the real API. The server answers
+GET /api/info?id=t1_a,t1_b,... with a Listing of the requested comments, and
+GET /r/all/comments?limit=..&before=.. with a Listing of the newest comments, out of an
+in-memory corpus, and enforces a fixed-window rate limit, reporting it through the
+X-Ratelimit-* headers and answering 429 once the budget of the window is spent.
+
+Comments only exist once their created_utc is past, so a corpus generated with
+synthetic_comments(start_time=time.time()) arrives at a steady rate. A recorded comment
+log can be replayed the same way (recorded_comments). Like Reddit's, the comment listing
+only reaches back listing_depth comments, and leaves out some comments (listing_hidden),
+which can still be fetched by fullname.
+
+Comments can be removed over time (see removal_times): from their removal time on, the
+info endpoint answers with the removed version of the comment. A share of the requests
+can be answered with a 429 regardless of the rate limit (error_rate), and answers can be
+delayed (latency). Random choices are seeded, so that runs can be replayed.
+
+FakeRedditClient stands in for reddit_client.RedditClient, so that reddeat's whole
+pipeline can run against the fake server (see bench_pipeline).
+
+Usage:
+    server = FakeRedditServer(corpus).start()
+    fetch = http_info_fetcher(server.url)
+    things, rate_limit = fetch(["t1_a", "t1_b"])
+    newest_things, rate_limit = http_listing_fetcher(server.url)(limit=100)
+    server.stop()
+'''
+
+import bisect
+import collections
+import json
+import math
+import random
+import threading
+import time
+import urllib2
+import urlparse
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from refetch_pool import RateLimited
+from fullnames import numeric_to_id36, fullname_to_numeric
+from compressed_log import open_log
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class _FakeRedditRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        fake = self.server.fake
+        url = urlparse.urlparse(self.path)
+        remaining, reset_in = fake.take_request()
+        headers = {"X-Ratelimit-Remaining": "%d" % max(remaining, 0), "X-Ratelimit-Reset": "%d" % reset_in,
+                   "X-Ratelimit-Used": "%d" % (fake.requests_per_window - max(remaining, 0))}
+        if remaining < 0:
+            self._reply(429, {"message": "Too Many Requests", "error": 429}, headers)
+        elif fake.inject_error():
+            headers["X-Ratelimit-Reset"] = "1"
+            self._reply(429, {"message": "Too Many Requests", "error": 429}, headers)
+        elif url.path.rstrip("/") == "/api/info":
+            fullnames = [i for i in urlparse.parse_qs(url.query).get("id", [""])[0].split(",") if i]
+            self._reply(200, fake.info(fullnames), headers)
+        elif url.path.rstrip("/") == "/r/all/comments":
+            query = urlparse.parse_qs(url.query)
+            self._reply(200, fake.listing(int(query.get("limit", ["25"])[0]), query.get("before", [None])[0]), headers)
+        else:
+            self._reply(404, {"message": "Not Found", "error": 404}, headers)
+
+    def _reply(self, code, payload, headers):
+        body = json.dumps(payload)
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in headers.iteritems():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class FakeRedditServer(object):
+    '''
+    Fake info endpoint and comment listing, served from a background thread on localhost
+    '''
+    def __init__(self, corpus, requests_per_window=600, window=600, latency=0, port=0, listing_depth=1000, listing_hidden=0.,
+                 error_rate=0., removals=None, seed=0):
+        '''
+        :param corpus: dict of fullname -> comment (dict), as returned by the info endpoint
+        :param requests_per_window: requests allowed per rate limit window
+        :param window: rate limit window length, in seconds
+        :param latency: seconds to wait before answering each request
+        :param port: port to listen on. 0 picks a free one
+        :param listing_depth: how many of the newest comments the comment listing reaches
+        :param listing_hidden: fraction of the comments left out of the comment listing
+        :param error_rate: fraction of the requests answered with a 429, within the rate limit
+        :param removals: dict of fullname -> removal time (UTC timestamp), see removal_times. None for no removals
+        :param seed: random seed for the injected errors
+        '''
+        self.corpus = corpus
+        self.removals = removals or {}
+        self.error_rate = error_rate
+        self.n_errors = 0
+        self._rnd = random.Random(seed)
+        self.listing_depth = listing_depth
+        self.listing_hidden = listing_hidden
+        # comments shown in the listing, by id
+        listed = sorted((fullname_to_numeric(fullname), c.get("created_utc", 0), fullname) for fullname, c in corpus.iteritems()
+                        if fullname.startswith("t1_") and not self.is_hidden(fullname))
+        self._listed_created = [created_utc for _, created_utc, _ in listed]
+        self._listed_fullnames = [fullname for _, _, fullname in listed]
+        self._listed_index = {fullname: i for i, fullname in enumerate(self._listed_fullnames)}
+        self.requests_per_window = requests_per_window
+        self.window = window
+        self.latency = latency
+        self.n_requests = 0
+        self.n_rate_limited = 0
+        self._window_start = time.time()
+        self._used = 0
+        self._lock = threading.Lock()
+        self._server = _ThreadingHTTPServer(("127.0.0.1", port), _FakeRedditRequestHandler)
+        self._server.fake = self
+
+    @property
+    def url(self):
+        return "http://%s:%d" % self._server.server_address
+
+    def start(self):
+        thread = threading.Thread(target=self._server.serve_forever, name="fake_reddit")
+        thread.setDaemon(True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def take_request(self):
+        '''
+        Account for a request against the rate limit
+
+        :returns: (remaining, reset_in). remaining is negative if the request is over budget
+        '''
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            now = time.time()
+            if now - self._window_start >= self.window:
+                self._window_start, self._used = now, 0
+            self._used += 1
+            self.n_requests += 1
+            remaining = self.requests_per_window - self._used
+            if remaining < 0:
+                self.n_rate_limited += 1
+            return remaining, self._window_start + self.window - now
+
+    def inject_error(self):
+        '''
+        :returns: True if the request should fail, according to error_rate
+        '''
+        with self._lock:
+            if self.error_rate and self._rnd.random() < self.error_rate:
+                self.n_errors += 1
+                return True
+        return False
+
+    def info(self, fullnames):
+        '''
+        :param fullnames: requested fullnames
+
+        :returns: a Listing of the requested things that are in the corpus, in their removed
+            version for the comments past their removal time
+        '''
+        now = time.time()
+        children = [{"kind": fullname.split("_", 1)[0], "data": self.thing(fullname, now)} for fullname in fullnames[:100]
+                    if fullname in self.corpus and self.corpus[fullname].get("created_utc", 0) <= now]
+        return {"kind": "Listing", "data": {"children": children, "after": None, "before": None}}
+
+    def thing(self, fullname, now):
+        '''
+        :returns: a thing of the corpus, as shown at time now
+        '''
+        thing = self.corpus[fullname]
+        if self.removals.get(fullname, now + 1) <= now:
+            # as shown after a moderator removal
+            thing = dict(thing, body="[removed]", author="[deleted]")
+        return thing
+
+    def is_hidden(self, fullname):
+        '''
+        :returns: True if the comment is left out of the comment listing
+        '''
+        return (fullname_to_numeric(fullname) * 2654435761) % 1000 < self.listing_hidden * 1000
+
+    def listing(self, limit=25, before=None):
+        '''
+        :param limit: maximum number of comments, up to 100
+        :param before: if given, only return the comments following this fullname
+
+        :returns: a Listing of the newest comments, newest first
+        '''
+        n_visible = bisect.bisect_right(self._listed_created, time.time())
+        oldest = max(0, n_visible - self.listing_depth)
+        limit = min(limit, 100)
+        if before is None:
+            first = max(oldest, n_visible - limit)
+        elif oldest <= self._listed_index.get(before, -1) < n_visible:
+            first = self._listed_index[before] + 1
+        else:
+            # like Reddit, an unknown (or too old) before gives an empty listing
+            first = n_visible
+        children = [{"kind": "t1", "data": self.corpus[fullname]} for fullname in reversed(self._listed_fullnames[first:min(first + limit, n_visible)])]
+        return {"kind": "Listing", "data": {"children": children, "after": None, "before": None}}
+
+_WORDS = ("the", "a", "reddit", "comment", "this", "is", "why", "we", "can't", "have", "nice", "things",
+          "lol", "source", "edit", "thanks", "for", "gold", "kind", "stranger", "upvote", "deleted")
+_SUBREDDITS = ("AskReddit", "funny", "pics", "worldnews", "gaming", "todayilearned", "politics", "news", "aww", "movies")
+
+def synthetic_comments(n, first_id=36**6, start_time=None, rate=30., seed=0):
+    '''
+    Generate comments shaped like the ones stored by reddeat (empty fields stripped)
+    :param n: how many comments to generate
+    :param first_id: numeric id of the first comment. Ids are consecutive
+    :param start_time: creation time of the first comment (UTC timestamp). Defaults to now
+    :param rate: comments per second
+    :param seed: random seed
+
+    :returns: generator of comment dicts
+    '''
+    rnd = random.Random(seed)
+    start_time = time.time() if start_time is None else start_time
+    for i in xrange(n):
+        id36 = numeric_to_id36(first_id + i)
+        created_utc = int(start_time + i / rate)
+        yield {"id": id36, "name": "t1_" + id36, "created_utc": created_utc, "created": created_utc + 8*3600,
+               "author": "user_%d" % rnd.randint(0, 10**6), "subreddit": rnd.choice(_SUBREDDITS),
+               "subreddit_id": "t5_2qh%d" % rnd.randint(0, 99), "link_id": "t3_%s" % numeric_to_id36(first_id // 100 + rnd.randint(0, 10**4)),
+               "parent_id": "t1_%s" % numeric_to_id36(first_id + rnd.randint(0, i + 1)),
+               "body": " ".join(rnd.choice(_WORDS) for _ in range(rnd.randint(3, 60))),
+               "score": rnd.randint(1, 5), "ups": rnd.randint(1, 5), "controversiality": 0, "gilded": 0,
+               "score_hidden": True, "subreddit_type": "public", "permalink": "/r/x/comments/%s/" % id36}
+
+def recorded_comments(fpath, start_time=None, rate=30.):
+    '''
+    Replay the comments of a comment log file, in fullname order, at a steady rate
+    :param fpath: comment log file, possibly compressed
+    :param start_time: new creation time of the first comment (UTC timestamp). Defaults to now
+    :param rate: comments per second
+
+    :returns: list of comment dicts, with their creation times shifted
+    '''
+    start_time = time.time() if start_time is None else start_time
+    with open_log(fpath, 'r') as log_f:
+        comments = [json.loads(line) for line in log_f if line.strip()]
+    comments.sort(key=lambda c: fullname_to_numeric(c["name"]))
+    for i, comment in enumerate(comments):
+        shift = int(start_time + i / rate) - comment["created_utc"]
+        comment["created_utc"] += shift
+        if "created" in comment:
+            comment["created"] += shift
+    return comments
+
+def removal_times(comments, share=.05, mean_delay=7*3600, sigma=1., seed=0):
+    '''
+    Pick the comments removed by moderators, and when
+    :param comments: iterable of comment dicts
+    :param share: fraction of the comments that get removed
+    :param mean_delay: mean time between posting and removal, in seconds. Delays are log-normally distributed
+    :param sigma: standard deviation of the logarithm of the delays
+    :param seed: random seed
+
+    :returns: dict of fullname -> removal time (UTC timestamp)
+    '''
+    rnd = random.Random(seed)
+    mu = math.log(mean_delay) - sigma ** 2 / 2
+    return dict((c["name"], c["created_utc"] + rnd.lognormvariate(mu, sigma))
+                for c in comments if rnd.random() < share)
+
+def listing_stream(fetch_listing, limiter, max_pause=16):
+    '''
+    Port of PRAW's stream_generator, as used by stream.comments()
+    :param fetch_listing: function taking limit and before arguments, and returning (things, rate_limit)
+    :param limiter: TokenBucketLimiter for the requests
+    :param max_pause: maximum pause between requests that return no new comments, in seconds
+    '''
+    before_fullname = None
+    pause = 1
+    seen_fullnames = collections.deque(maxlen=301)
+    seen_set = set()
+    without_before_counter = 0
+    while True:
+        found = False
+        newest_fullname = None
+        limit = 100
+        if before_fullname is None:
+            limit -= without_before_counter
+            without_before_counter = (without_before_counter + 1) % 30
+        limiter.acquire()
+        things, rate_limit = fetch_listing(limit=limit, before=before_fullname)
+        limiter.update(*rate_limit)
+        for item in reversed(things):
+            if item["name"] in seen_set:
+                continue
+            found = True
+            if len(seen_fullnames) == seen_fullnames.maxlen:
+                seen_set.discard(seen_fullnames[0])
+            seen_fullnames.append(item["name"])
+            seen_set.add(item["name"])
+            newest_fullname = item["name"]
+            yield item
+        before_fullname = newest_fullname
+        if found:
+            pause = 1
+        else:
+            time.sleep(pause)
+            pause = min(2 * pause, max_pause)
+
+def _http_get(url, timeout):
+    try:
+        response = urllib2.urlopen(url, timeout=timeout)
+    except urllib2.HTTPError, e:
+        if e.code == 429:
+            raise RateLimited(float(e.headers.get("x-ratelimit-reset", 1)))
+        raise
+    listing = json.load(response)
+    rate_limit = (response.headers.get("x-ratelimit-remaining"), response.headers.get("x-ratelimit-reset"))
+    return [child["data"] for child in listing["data"]["children"]], rate_limit
+
+def http_listing_fetcher(base_url, timeout=30):
+    '''
+    Build a function that fetches the newest comments over plain HTTP
+    :param base_url: fake server base url, e.g. FakeRedditServer.url
+    :param timeout: request timeout, in seconds
+
+    :returns: function taking limit and before arguments, and returning
+        (list of comment dicts, newest first, (remaining, reset_in))
+    '''
+    def fetch(limit=100, before=None):
+        return _http_get("%s/r/all/comments?limit=%d%s" % (base_url, limit, "&before=%s" % before if before else ""), timeout)
+    return fetch
+
+def http_info_fetcher(base_url, timeout=30):
+    '''
+    Build a RefetchPool fetch function that queries an info endpoint over plain HTTP
+    :param base_url: endpoint base url, e.g. FakeRedditServer.url
+    :param timeout: request timeout, in seconds
+
+    :returns: function taking a list of fullnames, and returning (list of comment dicts, (remaining, reset_in))
+    '''
+    def fetch(fullnames):
+        return _http_get("%s/api/info?id=%s" % (base_url, ",".join(fullnames)), timeout)
+    return fetch
+
+class Thing(object):
+    '''
+    Attribute access to the data of a thing, as PRAW's objects
+    '''
+    def __init__(self, data):
+        self.__dict__.update(data)
+
+class FakeRedditClient(object):
+    '''
+    Stand-in for reddit_client.RedditClient, querying a fake server over plain HTTP
+    '''
+    def __init__(self, base_url, listing_limiter, timeout=30):
+        '''
+        :param base_url: fake server base url, e.g. FakeRedditServer.url
+        :param listing_limiter: TokenBucketLimiter for the comment listing requests of comment_stream
+        :param timeout: request timeout, in seconds
+        '''
+        self._fetch_info = http_info_fetcher(base_url, timeout)
+        self._fetch_listing = http_listing_fetcher(base_url, timeout)
+        self.listing_limiter = listing_limiter
+        self._rate_limit = None
+
+    def set_pool_size(self, pool_size):
+        # every request opens its own connection
+        pass
+
+    def rate_limit(self):
+        return self._rate_limit
+
+    def info(self, fullnames):
+        things, self._rate_limit = self._fetch_info(fullnames)
+        return [Thing(thing) for thing in things], self._rate_limit
+
+    def newest_comment(self, subreddit='all'):
+        things, self._rate_limit = self._fetch_listing(limit=1)
+        return Thing(things[0])
+
+    def comment_stream(self, subreddit='all'):
+        return (Thing(thing) for thing in listing_stream(self._fetch_listing, self.listing_limiter))
+
+    def stats(self):
+        return {}
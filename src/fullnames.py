@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18/oct/2026
+
+Conversions between Reddit fullnames (e.g. t1_d2xy3k0), base36 ids (d2xy3k0), and the
+serial integers they encode, for single ids, and for numpy arrays of them.
+'''
+
+import numpy as np
+
+ID36_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+COMMENT_KIND = "t1"
+
+# value of every byte as a base36 digit
+_ID36_VALUES = np.zeros(256, dtype=np.int64)
+_ID36_VALUES[np.frombuffer(ID36_DIGITS, dtype=np.uint8)] = np.arange(36)
+
+def id36_to_numeric(id36):
+    '''
+    :param id36: base36-encoded id
+
+    :returns: the id, as an integer
+    '''
+    return int(id36, 36)
+
+def numeric_to_id36(n):
+    '''
+    :param n: non-negative integer id
+
+    :returns: the base36-encoded id
+    '''
+    digits = []
+    while True:
+        n, d = divmod(n, 36)
+        digits.append(ID36_DIGITS[d])
+        if not n:
+            return "".join(reversed(digits))
+
+def fullname_to_numeric(fullname):
+    '''
+    :param fullname: fullname, e.g. t1_d2xy3k0
+
+    :returns: the id, as an integer
+    '''
+    return int(fullname[fullname.index("_")+1:], 36)
+
+def numeric_to_fullname(n, kind=COMMENT_KIND):
+    '''
+    :param n: non-negative integer id
+    :param kind: thing kind prefix
+
+    :returns: the fullname, e.g. t1_d2xy3k0
+    '''
+    return kind + "_" + numeric_to_id36(n)
+
+def fullnames_to_numeric(fullnames):
+    '''
+    Vectorized fullname_to_numeric: decodes all the fullnames one digit position at a time
+    :param fullnames: sequence or array of fullnames (e.g. t1_d2xy3k0), or of base36 ids (d2xy3k0)
+
+    :returns: int64 array of ids
+    '''
+    chars = np.asarray(fullnames, dtype=np.string_)
+    if not chars.size:
+        return np.zeros(0, dtype=np.int64)
+    chars = chars.view(np.uint8).reshape(chars.size, chars.dtype.itemsize)
+    # digits are the non-padding characters after the underscore, if any
+    underscores = chars == ord("_")
+    is_digit = (chars != 0) & ~underscores & ((np.cumsum(underscores, axis=1) > 0) | ~underscores.any(axis=1)[:, None])
+    values = _ID36_VALUES[chars]
+    numeric = np.zeros(len(chars), dtype=np.int64)
+    for i in xrange(chars.shape[1]):
+        numeric = np.where(is_digit[:, i], numeric * 36 + values[:, i], numeric)
+    return numeric
+
+def numeric_to_fullnames(numeric_ids, kind=COMMENT_KIND):
+    '''
+    Vectorized numeric_to_fullname: encodes all the ids one digit position at a time
+    :param numeric_ids: sequence or array of non-negative integer ids
+    :param kind: thing kind prefix. None or empty for base36 ids without prefix
+
+    :returns: array of fullnames (numpy byte strings)
+    '''
+    numeric_ids = np.asarray(numeric_ids, dtype=np.int64)
+    prefix = kind + "_" if kind else ""
+    if not numeric_ids.size:
+        return np.zeros(0, dtype="S%d" % (len(prefix) + 1))
+    n_digits = np.ones(len(numeric_ids), dtype=np.int64)
+    width = 1
+    while (numeric_ids >= 36**width).any():
+        n_digits += numeric_ids >= 36**width
+        width += 1
+    # digits, most significant first, right-aligned
+    chars = np.empty((len(numeric_ids), width), dtype=np.uint8)
+    digits = np.frombuffer(ID36_DIGITS, dtype=np.uint8)
+    remainder = numeric_ids.copy()
+    for i in xrange(width - 1, -1, -1):
+        remainder, digit = np.divmod(remainder, 36)
+        chars[:, i] = digits[digit]
+    # left-align, padding with zeros
+    columns = np.arange(width) + (width - n_digits)[:, None]
+    chars = np.where(columns < width, chars[np.arange(len(chars))[:, None], np.minimum(columns, width - 1)], 0).astype(np.uint8)
+    encoded = np.empty((len(chars), len(prefix) + width), dtype=np.uint8)
+    encoded[:, :len(prefix)] = np.frombuffer(prefix, dtype=np.uint8)
+    encoded[:, len(prefix):] = chars
+    return encoded.view("S%d" % (len(prefix) + width)).ravel()
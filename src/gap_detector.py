@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18/oct/2026
+
+Online detection of the comment fullnames missed by the ingest stream.
+
+Comment ids are serial integers, so every id between the lowest and the highest one
+seen should eventually show up. The GapDetector keeps a sliding bitmap of the recent ids,
+starting at the watermark: every id below the watermark has either been seen, or handed
+out as a hole for backfilling. Ids that are still missing once the stream has moved past
+them by `lag` ids are holes; they are handed out in batches, to be re-fetched by
+fullname through the info endpoint.
+
+Ids falling out of the bitmap window before being seen or handed out are counted as lost.
+
+For offline analysis of the ids collected over a whole crawl, missing_intervals finds
+the missing ids as run-length intervals, with numpy, without materializing the id span.
+'''
+
+import threading
+import time
+import numpy as np
+
+class GapDetector(object):
+    '''
+    Sliding bitmap of recently seen comment ids
+    '''
+    def __init__(self, window=2**20, lag=1000):
+        '''
+        :param window: how many ids above the watermark are tracked (bits of the bitmap)
+        :param lag: how far behind the highest id seen a missing id must be, to be considered a hole
+        '''
+        self.window = window - window % 8
+        self.lag = lag
+        self.watermark = None # every id below this has been seen, or handed out as a hole
+        self.max_seen = None
+        self.n_seen, self.n_holes, self.n_lost = 0, 0, 0
+        self._base = None # id of the first bit in the bitmap, multiple of 8
+        self._bitmap = bytearray(self.window // 8)
+        self._cond = threading.Condition()
+
+    def _test(self, i):
+        i -= self._base
+        return self._bitmap[i >> 3] & (1 << (i & 7))
+
+    def _set(self, i):
+        i -= self._base
+        self._bitmap[i >> 3] |= (1 << (i & 7))
+
+    def _advance(self):
+        # skip full bytes first
+        i = self.watermark - self._base
+        end = self.max_seen - self._base
+        while i <= end:
+            if not (i & 7) and self._bitmap[i >> 3] == 0xff:
+                i += 8
+            elif self._bitmap[i >> 3] & (1 << (i & 7)):
+                i += 1
+            else:
+                break
+        self.watermark = self._base + i
+
+    def _slide(self, numeric_id):
+        '''
+        Move the bitmap window so that numeric_id fits in it, losing the ids falling out of it
+        '''
+        new_base = numeric_id - self.window + 1
+        new_base += (-new_base) % 8
+        if new_base > self.watermark:
+            for i in xrange(self.watermark, min(new_base, self.max_seen + 1)):
+                if not self._test(i):
+                    self.n_lost += 1
+            self.watermark = new_base
+        shift = (new_base - self._base) // 8
+        if shift >= len(self._bitmap):
+            self._bitmap = bytearray(len(self._bitmap))
+        else:
+            self._bitmap = self._bitmap[shift:] + bytearray(shift)
+        self._base = new_base
+        self.max_seen = max(self.max_seen, new_base - 1)
+
+    def add(self, numeric_id):
+        '''
+        Record an id seen in the stream
+        :param numeric_id: comment id, as an integer
+
+        :returns: False if the id was already seen, or handed out as a hole
+        '''
+        with self._cond:
+            if self._base is None:
+                self._base = numeric_id - numeric_id % 8
+                self.watermark = self.max_seen = numeric_id
+            if numeric_id < self.watermark:
+                return False
+            if numeric_id >= self._base + self.window:
+                self._slide(numeric_id)
+            if self._test(numeric_id):
+                return False
+            self._set(numeric_id)
+            self.n_seen += 1
+            if numeric_id > self.max_seen:
+                self.max_seen = numeric_id
+                if self.max_seen - self.watermark >= self.lag:
+                    self._cond.notify()
+            if numeric_id == self.watermark:
+                self._advance()
+            return True
+
+    def _holes(self, max_n, take=True):
+        holes = []
+        i = self.watermark
+        end = self.max_seen - self.lag
+        while i < end and len(holes) < max_n:
+            if not (i - self._base) & 7 and self._bitmap[(i - self._base) >> 3] == 0xff:
+                i += 8
+                continue
+            if not self._test(i):
+                holes.append(i)
+            i += 1
+        if take:
+            for i in holes:
+                self._set(i)
+            self.n_holes += len(holes)
+            self._advance()
+        return holes
+
+    def holes(self, max_n=100):
+        '''
+        Hand out the ids missing from the stream, that the stream has moved past by lag ids
+        :param max_n: maximum number of ids to return
+
+        :returns: list of comment ids, as integers
+        '''
+        with self._cond:
+            if self._base is None:
+                return []
+            return self._holes(max_n)
+
+    def wait_for_holes(self, n=100, timeout=None):
+        '''
+        Block until n holes are available, or timeout seconds passed, and hand them out
+        :param n: how many holes to wait for
+        :param timeout: maximum wait, in seconds
+
+        :returns: list of at most n comment ids, as integers
+        '''
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._base is None or len(self._holes(n, take=False)) < n:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            if self._base is None:
+                return []
+            return self._holes(n)
+
+    def stats(self):
+        '''
+        :returns: dict with the watermark, the highest id seen, and counters of seen, backfilled and lost ids
+        '''
+        with self._cond:
+            return {'watermark': self.watermark, 'max_seen': self.max_seen, 'seen': self.n_seen,
+                    'holes': self.n_holes, 'lost': self.n_lost}
+
+def missing_intervals(numeric_ids):
+    '''
+    Find the ids missing between the lowest and the highest of the given ones
+    :param numeric_ids: sequence or array of comment ids, as integers, in any order, possibly repeated
+
+    :returns: (starts, lengths) int64 arrays: the runs of missing ids start[i], ..., start[i]+length[i]-1
+    '''
+    numeric_ids = np.asarray(numeric_ids, dtype=np.int64)
+    steps = np.diff(numeric_ids)
+    if (steps < 0).any():
+        numeric_ids = np.sort(numeric_ids)
+        steps = np.diff(numeric_ids)
+    gaps = np.flatnonzero(steps > 1)
+    return numeric_ids[gaps] + 1, steps[gaps] - 1
+
+def expand_intervals(starts, lengths):
+    '''
+    :param starts: int64 array of interval starts, as returned by missing_intervals
+    :param lengths: int64 array of interval lengths
+
+    :returns: int64 array of all the ids in the intervals
+    '''
+    starts, lengths = np.asarray(starts, dtype=np.int64), np.asarray(lengths, dtype=np.int64)
+    if not lengths.sum():
+        return np.zeros(0, dtype=np.int64)
+    # offset of every id within its interval
+    ends = np.cumsum(lengths)
+    offsets = np.arange(ends[-1], dtype=np.int64) - np.repeat(ends - lengths, lengths)
+    return np.repeat(starts, lengths) + offsets
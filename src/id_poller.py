@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18/oct/2026
+
+Ingest engine walking the comment id space through the API's info endpoint, as an
+alternative to PRAW's stream.comments(), which polls the /r/all/comments listing.
+
+Comment fullnames are base36-encoded serial integers, so the IdPoller asks for the
+next 100 ids after the highest one found so far. Ids that are not found, but are
+lower than an id that was found, are not visible yet (or were never shown in the
+listing): they are retried a few times, filling up the following requests. Ids above
+the highest one found do not exist yet: they are asked again with the next request.
+A stride of ids none of which shows up (deleted or private comments) would stall the
+poller: after max_empty_polls empty requests, the poller asks for the newest comment id,
+and moves past the stride if it is higher. The skipped ids are left to the gap detector.
+
+The poller adapts its speed to keep up with the head of the sequence: while it is
+behind, requests are issued as fast as the rate limiter allows; once it catches up,
+it waits for about a request's worth of new comments, according to the estimated
+comment rate.
+
+Several pollers, each with its own API credentials, can share the id space: with
+stripes=n, the ids are split in blocks of stride ids, dealt round-robin to the n
+pollers, and poller stripe only asks for the ids of its own blocks (see shard_coordinator).
+'''
+
+import collections
+import time
+from fullnames import fullname_to_numeric, numeric_to_fullname
+
+class IdPoller(object):
+    '''
+    Generator of new comments, fetched by walking the comment ids forward
+    '''
+    def __init__(self, fetch_func, start_id, limiter=None, stride=100, max_retries=3, retry_delay=10.,
+                 fill_target=.9, max_wait=10., fullname_of=lambda thing: thing.name, clock=time.time, sleep=time.sleep,
+                 stripe=0, stripes=1, newest_id_func=None, max_empty_polls=3, on_skip=None):
+        '''
+        :param fetch_func: function taking a list of fullnames, and returning a tuple
+            (things, rate_limit), where rate_limit is a (remaining, reset_in) tuple, or None
+        :param start_id: first comment id to fetch, as an integer
+        :param limiter: TokenBucketLimiter for the requests, or None for no rate limiting
+        :param stride: how many ids to ask per request (up to 100)
+        :param max_retries: how many more times an id is asked, if not found while a higher id was
+        :param retry_delay: seconds between retries of an id
+        :param fill_target: once at the head of the sequence, wait for this fraction of a stride of new comments
+        :param max_wait: maximum wait at the head of the sequence, in seconds
+        :param fullname_of: function returning the fullname of a fetched thing
+        :param clock: clock function
+        :param sleep: sleep function
+        :param stripe: index of the blocks of stride ids this poller asks for, between 0 and stripes-1
+        :param stripes: how many pollers share the id space
+        :param newest_id_func: function returning the newest comment id, as an integer, to tell a stride
+            of missing comments from the head of the sequence. If None, empty strides are never skipped
+        :param max_empty_polls: how many requests a stride stays empty before checking the newest comment id
+        :param on_skip: function called with the first and the last id of every stride skipped
+        '''
+        self.fetch_func = fetch_func
+        self.limiter = limiter
+        self.stride = stride
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.fill_target = fill_target
+        self.max_wait = max_wait
+        self.fullname_of = fullname_of
+        self.stripe, self.stripes = stripe, stripes
+        self.newest_id_func = newest_id_func
+        self.max_empty_polls = max_empty_polls
+        self.on_skip = on_skip
+        self.next_id = start_id # lowest id never asked for
+        self.n_advanced = 0 # how many fresh ids the last request moved past
+        self.rate = None # estimated comments per second, at the head of the sequence
+        self.n_requests, self.n_found, self.n_retried, self.n_given_up, self.n_skipped = 0, 0, 0, 0, 0
+        self._empty_polls = 0 # requests in a row without any fresh id found
+        self._retries = collections.deque() # (due time, id, attempts), in due time order
+        self._head_time = None # when the head of the sequence was last seen move
+        self._head_id = None
+        self._clock = clock
+        self._sleep = sleep
+
+    def stats(self):
+        '''
+        :returns: dict with request and comment counters, the next id, and the estimated comment rate
+        '''
+        return {'requests': self.n_requests, 'found': self.n_found, 'retried': self.n_retried,
+                'given_up': self.n_given_up, 'skipped': self.n_skipped, 'next_id': self.next_id, 'pending_retries': len(self._retries),
+                'rate': self.rate}
+
+    def _next_ids(self, now):
+        '''
+        :returns: (retried ids with their attempts, fresh ids) for the next request
+        '''
+        retried = []
+        while self._retries and self._retries[0][0] <= now and len(retried) < self.stride:
+            _, numeric_id, attempts = self._retries.popleft()
+            retried.append((numeric_id, attempts))
+        return retried, self._fresh_ids(self.stride - len(retried))
+
+    def _fresh_ids(self, n):
+        '''
+        :returns: the first n ids of this poller's stripe, from next_id on
+        '''
+        if self.stripes == 1:
+            return range(self.next_id, self.next_id + n)
+        fresh, i = [], self.next_id
+        while len(fresh) < n:
+            block = i // self.stride
+            skip = (self.stripe - block) % self.stripes
+            if skip:
+                # jump to the start of the next block of this stripe
+                block += skip
+                i = block * self.stride
+            block_end = (block + 1) * self.stride
+            fresh.extend(range(i, min(block_end, i + n - len(fresh))))
+            i = block_end
+        return fresh
+
+    def _update_rate(self, max_found, now):
+        if self._head_id is not None and max_found > self._head_id and now > self._head_time:
+            rate = (max_found - self._head_id) / (now - self._head_time)
+            self.rate = rate if self.rate is None else .8 * self.rate + .2 * rate
+        if self._head_id is None or max_found > self._head_id:
+            self._head_id, self._head_time = max_found, now
+
+    def poll(self):
+        '''
+        Issue one request
+
+        :returns: list of found things, in id order
+        '''
+        now = self._clock()
+        retried, fresh = self._next_ids(now)
+        if self.limiter:
+            self.limiter.acquire()
+        things, rate_limit = self.fetch_func([numeric_to_fullname(i) for i, _ in retried] + [numeric_to_fullname(i) for i in fresh])
+        if self.limiter and rate_limit:
+            self.limiter.update(*rate_limit)
+        self.n_requests += 1
+        now = self._clock()
+        found = {fullname_to_numeric(self.fullname_of(thing)): thing for thing in things}
+        self.n_found += len(found)
+        # retried ids
+        for numeric_id, attempts in retried:
+            if numeric_id not in found:
+                if attempts < self.max_retries:
+                    self._retries.append((now + self.retry_delay, numeric_id, attempts + 1))
+                else:
+                    self.n_given_up += 1
+        # fresh ids: the ones below the highest found are retried, the others are not there yet
+        found_fresh = [i for i in fresh if i in found]
+        self.n_advanced = 0
+        if found_fresh:
+            self._empty_polls = 0
+            max_found = found_fresh[-1]
+            self.n_advanced = fresh.index(max_found) + 1
+            for numeric_id in fresh:
+                if numeric_id > max_found:
+                    break
+                if numeric_id not in found:
+                    self.n_retried += 1
+                    self._retries.append((now + self.retry_delay, numeric_id, 1))
+            self.next_id = max_found + 1
+            self._update_rate(max_found, now)
+        elif fresh and self.newest_id_func:
+            self._empty_polls += 1
+            if self._empty_polls >= self.max_empty_polls:
+                self._empty_polls = 0
+                self._skip_empty(fresh)
+        return [found[i] for i in sorted(found)]
+
+    def _skip_empty(self, fresh):
+        '''
+        Move past fresh ids that stayed empty for max_empty_polls requests, if a higher comment id exists
+        :param fresh: the fresh ids of the last request
+        '''
+        if self.limiter:
+            self.limiter.acquire()
+        if self.newest_id_func() <= fresh[-1]:
+            # at the head of the sequence
+            return
+        self.n_skipped += len(fresh)
+        self.next_id = fresh[-1] + 1
+        if self.on_skip:
+            self.on_skip(fresh[0], fresh[-1])
+
+    def _wait(self, n_fresh_found):
+        '''
+        Wait at the head of the sequence, for about fill_target of a stride of new comments
+        :param n_fresh_found: how far the head moved, in ids of this poller's stripe
+        '''
+        target = self.fill_target * self.stride
+        if n_fresh_found >= target:
+            # behind the head: keep going, at the rate limiter's pace
+            return
+        # only one id in stripes is this poller's
+        wait = self.max_wait if not self.rate else min(self.max_wait, (target - n_fresh_found) * self.stripes / self.rate)
+        if self._retries:
+            # retries may come due before
+            wait = min(wait, max(0, self._retries[0][0] - self._clock()))
+        if wait > 0:
+            self._sleep(wait)
+
+    def comments(self):
+        '''
+        Generator of new comments, in id order within each request, never ending
+        '''
+        while True:
+            things = self.poll()
+            for thing in things:
+                yield thing
+            self._wait(self.n_advanced)
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18/oct/2026
+
+Merge step of sharded ingest (see shard_coordinator): merges the archived log files of
+all the shards into a single log, split in files of a fixed period, deduplicated by
+fullname, and ordered by time.
+
+The shard files are read in rotation time order. Each comment goes to the output file
+of the period it was created in (removed comments: of the period they were re-fetched
+in), and a period is written out once the files left to read were all rotated more than
+slack seconds after its end, so that only a few periods are held in memory. Comments
+logged by several shards, or by the same shard twice (e.g. after a restart), are kept
+once: removed comments in their first detected version, even when detected in another
+period. The ids of the comments written out are kept in a SeenSet, so that a comment
+showing up again after its period was written out is dropped too. A comment of a period
+written out already, showing up in a file rotated more than slack seconds after the period
+end, is appended to the period file, after the lines written before, and counted as late.
+Removed comment files in delta format are joined back with their shard logs first, and
+merged in full format.
+
+Output files are named like rotated log files (OUTPUT.%Y-%m-%d_%H-%M, plus the codec
+extension), so that the rest of the tools can read them as archived log files.
+
+Usage: python merge_shards.py [options] DIR_OR_GLOB [DIR_OR_GLOB ...]
+'''
+
+import calendar
+import collections
+import glob
+import json
+import os
+import re
+import time
+from optparse import OptionParser
+from compressed_log import open_log, codec_for_path, get_codec
+from fullnames import fullname_to_numeric
+from pending_store import scan_comment_line
+from removal_delta import read_removed
+from seen_set import SeenSet
+from reprocess import find_log_files
+
+REMOVED_FILE_SUFFIX = ".removed" # as in reddeat
+ROTATION_SUFFIX = re.compile(r"\.(\d{4}-\d{2}-\d{2}(?:_\d{2}(?:-\d{2}){0,2})?)(?=\.|$)") # as appended by TimedRotatingFileHandler
+ROTATION_FORMATS = {10: "%Y-%m-%d", 13: "%Y-%m-%d_%H", 16: "%Y-%m-%d_%H-%M", 19: "%Y-%m-%d_%H-%M-%S"} # suffix length -> format
+OUTPUT_FORMAT = "%Y-%m-%d_%H-%M"
+
+def rotation_time(fpath):
+    '''
+    :returns: rotation time of a rotated log file (UTC timestamp), from its name, or None
+    '''
+    match = ROTATION_SUFFIX.search(os.path.basename(fpath))
+    if not match:
+        return None
+    suffix = match.group(1)
+    return calendar.timegm(time.strptime(suffix, ROTATION_FORMATS[len(suffix)]))
+
+def find_removed_files(patterns, removed_fsuffix=REMOVED_FILE_SUFFIX):
+    '''
+    :returns: sorted list of the archived removed comment log files
+    '''
+    fpaths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "*")
+        for fpath in glob.glob(pattern):
+            codec = codec_for_path(fpath)
+            if codec and os.path.isfile(fpath) and fpath[:-len(codec.extension)].endswith(removed_fsuffix):
+                fpaths.add(fpath)
+    return sorted(fpaths)
+
+def comment_lines(fpath):
+    '''
+    :returns: iterator over (fullname, created_utc, line) of a comment log file
+    '''
+    with open_log(fpath, 'r') as log_f:
+        for line in log_f:
+            if line.strip():
+                fullname, created_utc, _ = scan_comment_line(line)
+                yield fullname, created_utc, line.rstrip("\n")
+
+def removed_lines(fpath):
+    '''
+    :returns: iterator over (fullname, refetched_utc, line) of a removed comment log file, in full format
+    '''
+    for fullname, _, after, record in read_removed(fpath):
+        yield fullname, record.get("refetched_utc", 0), json.dumps(after or record)
+
+class ShardMerger(object):
+    '''
+    Merges lines from shard files into period files, deduplicated by fullname, and in time order
+    '''
+    def __init__(self, output, period, slack, codec=None, suffix=""):
+        '''
+        :param output: output file path prefix
+        :param period: seconds covered by each output file
+        :param slack: how long after the end of a period comments of the period can still be rotated in
+            a shard file, in seconds: the longest ingest delay (e.g. backfilling), plus a rotation interval
+        :param codec: codec name of the output files. None for plain text
+        :param suffix: suffix of the output files, before the codec extension (e.g. .removed)
+        '''
+        self.output, self.period, self.slack, self.suffix = output, period, slack, suffix
+        self.codec = get_codec(codec) if codec else None
+        self.n_read, self.n_duplicates, self.n_written, self.n_late = 0, 0, 0, 0
+        self.output_fpaths = []
+        self._periods = collections.defaultdict(dict) # period start -> fullname -> (time, line)
+        self._period_of = {} # fullname -> period start, for the lines not written out yet
+        self._written = SeenSet(max_chunks=1 << 16) # ids of the lines written out
+        self._flushed = set() # starts of the periods written out
+
+    def add(self, lines, rotated_at=None):
+        '''
+        Add the lines of a shard file, and write out the periods no later file can add to
+        :param lines: iterator over (fullname, time, line)
+        :param rotated_at: rotation time of the file, or None if unknown
+        '''
+        if rotated_at is not None:
+            for start in sorted(self._periods):
+                if start + self.period + self.slack <= rotated_at:
+                    self.flush(start)
+        for fullname, t, line in lines:
+            self.n_read += 1
+            if fullname_to_numeric(fullname) in self._written:
+                self.n_duplicates += 1
+                continue
+            previous = self._period_of.get(fullname)
+            if previous is not None:
+                self.n_duplicates += 1
+                if t >= self._periods[previous][fullname][0]:
+                    continue
+                # an earlier version, possibly of an earlier period
+                del self._periods[previous][fullname]
+                if not self._periods[previous]:
+                    del self._periods[previous]
+            start = int(t // self.period * self.period)
+            self._period_of[fullname] = start
+            self._periods[start][fullname] = (t, line)
+
+    def flush(self, start):
+        '''
+        Write out a period, in time order (fullname order, for the same time). The late lines of a
+        period written out already are appended to its file
+        '''
+        lines_by_fullname = self._periods.pop(start)
+        for fullname in lines_by_fullname:
+            del self._period_of[fullname]
+            self._written.add(fullname_to_numeric(fullname))
+        fpath = "%s.%s%s%s" % (self.output, time.strftime(OUTPUT_FORMAT, time.gmtime(start)), self.suffix,
+                               self.codec.extension if self.codec else "")
+        late = start in self._flushed
+        with open_log(fpath, 'a' if late else 'w', self.codec) as out_f:
+            for _, _, line in sorted((t, fullname_to_numeric(fullname), line) for fullname, (t, line) in lines_by_fullname.iteritems()):
+                out_f.write(line + u"\n")
+        self.n_written += len(lines_by_fullname)
+        if late:
+            self.n_late += len(lines_by_fullname)
+            print "%s: %d lines showed up later than %d seconds after the end of their period" % (fpath, len(lines_by_fullname), self.slack)
+        else:
+            self._flushed.add(start)
+            self.output_fpaths.append(fpath)
+
+    def close(self):
+        for start in sorted(self._periods):
+            self.flush(start)
+
+def merge(fpaths, merger, read_lines):
+    '''
+    :param fpaths: shard files
+    :param merger: ShardMerger
+    :param read_lines: function returning an iterator over (fullname, time, line) of a file
+    '''
+    for fpath in sorted(fpaths, key=lambda fpath: (rotation_time(fpath), fpath)):
+        merger.add(read_lines(fpath), rotation_time(fpath))
+    merger.close()
+    print "%s: %d lines read, %d duplicates dropped, %d lines written to %d files (%d late)" % (
+        merger.output + merger.suffix, merger.n_read, merger.n_duplicates, merger.n_written, len(merger.output_fpaths), merger.n_late)
+
+def main():
+    parser = OptionParser(usage="%prog [options] DIR_OR_GLOB [DIR_OR_GLOB ...]")
+    parser.add_option("-o", "--output", action="store", type="string", dest="output", default="merged/reddeat", help="output file path prefix")
+    parser.add_option("-p", "--period", action="store", type="int", dest="period", default=3600, help="seconds covered by each output file")
+    parser.add_option("-s", "--slack", action="store", type="int", dest="slack", default=3600, help="how long after the end of a period its comments can still show up in shard files, in seconds")
+    parser.add_option("-z", "--compression", action="store", type="string", dest="codec", default="bz2", help="codec of the output files (bz2, gzip, xz, zstd)")
+    (options, args) = parser.parse_args()
+    if not args:
+        parser.error("no shard log files")
+    if os.path.dirname(options.output) and not os.path.isdir(os.path.dirname(options.output)):
+        os.makedirs(os.path.dirname(options.output))
+    merge(find_log_files(args), ShardMerger(options.output, options.period, options.slack, options.codec), comment_lines)
+    merge(find_removed_files(args), ShardMerger(options.output, options.period, options.slack, options.codec, REMOVED_FILE_SUFFIX), removed_lines)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18/oct/2026
+
+Low-overhead metrics for the crawler, exposed in the Prometheus text format.
+
+Hot paths only touch Counter and Histogram instances: an increment, or a bucket lookup
+and an increment, under a lock. Everything that already has its own statistics (queue
+depths, rate limits, latency histograms kept by other objects) is read only when the
+metrics are collected, through functions registered with Metrics.gauge and
+Metrics.histograms, so it costs nothing in between.
+
+A MetricsServer serves the metrics of a registry over HTTP (GET /metrics), from a
+daemon thread. A MetricsDumper logs a json snapshot of them periodically, including the
+per-second rate of every counter since the previous dump.
+'''
+
+import bisect
+import json
+import logging
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8" # Prometheus text exposition format
+DURATION_BUCKETS = (1e-6, 5e-6, 1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 1e-2, .1, 1.) # upper bounds of the buckets for timing short operations, in seconds
+
+class Counter(object):
+    '''
+    Thread-safe monotonic counter
+    '''
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self._lock:
+            self.value += n
+
+class Histogram(object):
+    '''
+    Thread-safe histogram of observed values, with fixed buckets
+    '''
+    def __init__(self, buckets=DURATION_BUCKETS):
+        '''
+        :param buckets: increasing upper bounds of the buckets
+        '''
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1) # the last bucket counts the values above all bounds
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.total += value
+            self.max = max(self.max, value)
+
+    def quantile(self, q):
+        '''
+        :param q: quantile, between 0 and 1
+
+        :returns: upper bound of the bucket holding the q-quantile (inf if above all bounds), or None if empty
+        '''
+        with self._lock:
+            if not self.count:
+                return None
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+                cumulative += count
+                if cumulative >= q * self.count:
+                    return bound
+
+    def as_dict(self):
+        '''
+        :returns: dict with the count, mean, max, median and 99th percentile bucket bounds,
+            and the cumulative counts of values at most as large as each bucket bound
+        '''
+        p50, p99 = self.quantile(.5), self.quantile(.99)
+        with self._lock:
+            cumulative, buckets = 0, []
+            for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+                cumulative += count
+                buckets.append((bound, cumulative))
+            return {'count': self.count, 'mean': self.total / self.count if self.count else 0.,
+                    'max': self.max, 'p50': p50, 'p99': p99, 'buckets': buckets}
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{%s}" % (",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                              for k, v in sorted(labels.items())),)
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+class Metrics(object):
+    '''
+    Registry of named metrics
+    '''
+    def __init__(self, prefix="reddeat_"):
+        '''
+        :param prefix: prefix of all the metric names
+        '''
+        self.prefix = prefix
+        self._families = [] # (name, type, help, function returning {label tuple: value or Histogram})
+        self._lock = threading.Lock()
+
+    def _add(self, name, metric_type, help, collect):
+        with self._lock:
+            self._families.append((self.prefix + name, metric_type, help, collect))
+
+    def counter(self, name, help):
+        '''
+        :returns: a new Counter, exposed as name
+        '''
+        counter = Counter()
+        self._add(name, "counter", help, lambda: {(): counter.value})
+        return counter
+
+    def histogram(self, name, help, buckets=DURATION_BUCKETS):
+        '''
+        :returns: a new Histogram, exposed as name
+        '''
+        histogram = Histogram(buckets)
+        self._add(name, "histogram", help, lambda: {(): histogram})
+        return histogram
+
+    def gauge(self, name, help, func, label=None, metric_type="gauge"):
+        '''
+        Expose a value computed at collection time
+        :param func: function returning the value (None to skip it), or, if label is given,
+            a dict of label value -> value
+        :param label: label name, for functions returning dicts
+        :param metric_type: gauge, or counter for monotonic totals kept elsewhere
+        '''
+        if label is None:
+            collect = lambda: {(): func()}
+        else:
+            collect = lambda: dict((((label, k),), v) for k, v in func().items())
+        self._add(name, metric_type, help, collect)
+
+    def histograms(self, name, help, func, label):
+        '''
+        Expose histograms kept elsewhere, e.g. the latency histograms of an API client
+        :param func: function returning a dict of label value -> Histogram (or any object with
+            the buckets, counts, count and total attributes of Histogram)
+        :param label: label name
+        '''
+        self._add(name, "histogram", help, lambda: dict((((label, k),), v) for k, v in func().items()))
+
+    def _collect(self):
+        with self._lock:
+            families = list(self._families)
+        for name, metric_type, help, collect in families:
+            try:
+                samples = collect()
+            except Exception:
+                # a failing collector must not break the others
+                continue
+            yield name, metric_type, help, sorted((labels, value) for labels, value in samples.items() if value is not None)
+
+    def render(self):
+        '''
+        :returns: the metrics in the Prometheus text format
+        '''
+        lines = []
+        for name, metric_type, help, samples in self._collect():
+            lines.append("# HELP %s %s" % (name, help))
+            lines.append("# TYPE %s %s" % (name, metric_type))
+            for labels, value in samples:
+                labels = dict(labels)
+                if metric_type != "histogram":
+                    lines.append("%s%s %s" % (name, _format_labels(labels), _format_value(value)))
+                    continue
+                cumulative = 0
+                for bound, count in zip(value.buckets + (float("inf"),), list(value.counts)):
+                    cumulative += count
+                    labels["le"] = _format_value(bound)
+                    lines.append("%s_bucket%s %d" % (name, _format_labels(labels), cumulative))
+                labels.pop("le")
+                lines.append("%s_sum%s %s" % (name, _format_labels(labels), _format_value(value.total)))
+                lines.append("%s_count%s %d" % (name, _format_labels(labels), value.count))
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        '''
+        :returns: dict of metric name (with its labels, if any) -> value. Histograms are
+            summarized by count, mean, max, median and 99th percentile
+        '''
+        snapshot = {}
+        for name, metric_type, _, samples in self._collect():
+            for labels, value in samples:
+                key = name + _format_labels(dict(labels))
+                if metric_type == "histogram":
+                    summary = value.as_dict()
+                    summary.pop("buckets")
+                    value = summary
+                snapshot[key] = value
+        return snapshot
+
+class MetricsServer(object):
+    '''
+    HTTP server exposing the metrics of a registry at /metrics, from a daemon thread
+    '''
+    def __init__(self, metrics, port, host="127.0.0.1"):
+        '''
+        :param metrics: Metrics registry
+        :param port: port to listen to. 0 for any free port (see port)
+        :param host: address to listen to. Defaults to local connections only
+        '''
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                # scrapes are not worth logging
+                pass
+        self._server = HTTPServer((host, port), Handler)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics_server")
+        self._thread.setDaemon(True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+class MetricsDumper(object):
+    '''
+    Daemon thread logging a json snapshot of a registry periodically
+    '''
+    def __init__(self, metrics, interval, logger_name):
+        '''
+        :param metrics: Metrics registry
+        :param interval: seconds between two snapshots
+        :param logger_name: logger to log the snapshots to, at debug level
+        '''
+        self.metrics = metrics
+        self.interval = interval
+        self.logger_name = logger_name
+        self._stopped = threading.Event()
+        self._last = None # (time, snapshot) of the previous dump
+        self._thread = threading.Thread(target=self._run, name="metrics_dumper")
+        self._thread.setDaemon(True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def dump(self):
+        '''
+        Log a snapshot of the metrics, with the per-second rate of the counters since the previous dump
+        '''
+        now, snapshot = time.time(), self.metrics.snapshot()
+        if self._last is not None:
+            last_time, last_snapshot = self._last
+            for key, value in last_snapshot.items():
+                if key.endswith("_total") and isinstance(snapshot.get(key), (int, long, float)):
+                    snapshot[key[:-len("_total")] + "_per_second"] = (snapshot[key] - value) / max(now - last_time, 1e-9)
+        self._last = now, dict((k, v) for k, v in snapshot.items() if k.endswith("_total"))
+        logging.getLogger(self.logger_name).debug("metrics: %s" % (json.dumps(snapshot, sort_keys=True),))
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.dump()
+
+    def stop(self):
+        self._stopped.set()
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18/oct/2026
+
+Compact storage for the comments waiting to be re-fetched.
+
+A pending comment only needs its numeric id, its creation time, the log file segment
+it belongs to, the recheck horizon it is waiting for, and whether the original comment
+had any of the fields that make check_comment_removed report it as removed. These are
+packed in 16-byte records (RECORD_DTYPE), stored in fixed-size numpy chunks: a
+RecordQueue holds tens of millions of pending comments in a few hundred MB, in memory,
+or in memory-mapped chunk files, which the OS can page out.
+
+scan_comment_line extracts the same information from a stored json line without
+parsing it, so that log files are re-fetched without turning every comment into a dict.
+'''
+
+import itertools
+import json
+import math
+import os
+import re
+import numpy as np
+
+EPOCH = 1104537600 # 2005-01-01 UTC: creation times are stored as int32 seconds since then, rounded up
+FLAGGED = 1 # flag bit: the original comment had some of the removal check fields set
+RECORD_DTYPE = np.dtype([("id", "<i8"), ("created", "<i4"), ("segment", "<u2"), ("horizon", "u1"), ("flags", "u1")])
+CHUNK_SIZE = 1 << 16 # records per chunk (1 MB)
+
+class RecordQueue(object):
+    '''
+    FIFO of pending comment records, in fixed-size chunks, in memory or memory-mapped
+    '''
+    _ids = itertools.count()
+
+    def __init__(self, folder=None, chunk_size=CHUNK_SIZE):
+        '''
+        :param folder: folder for the memory-mapped chunk files. None to keep chunks in memory
+        :param chunk_size: records per chunk
+        '''
+        self.folder = folder
+        self.chunk_size = chunk_size
+        self._name = "pending-%d-%d" % (os.getpid(), next(self._ids))
+        self._chunks = [] # (chunk, file path or None)
+        self._head = 0 # first record of the first chunk
+        self._tail = chunk_size # first free record of the last chunk
+        self._n_chunks = 0
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def _new_chunk(self):
+        if self.folder is None:
+            chunk, fpath = np.zeros(self.chunk_size, dtype=RECORD_DTYPE), None
+        else:
+            fpath = os.path.join(self.folder, "%s-%d.chunk" % (self._name, self._n_chunks))
+            chunk = np.memmap(fpath, dtype=RECORD_DTYPE, mode="w+", shape=(self.chunk_size,))
+        self._n_chunks += 1
+        self._chunks.append((chunk, fpath))
+        self._tail = 0
+
+    def _drop_chunk(self):
+        chunk, fpath = self._chunks.pop(0)
+        del chunk
+        if fpath:
+            os.remove(fpath)
+        self._head = 0
+        if not self._chunks:
+            self._tail = self.chunk_size
+
+    def append(self, numeric_id, created_utc, segment, horizon, flags=0):
+        '''
+        :param numeric_id: comment id, as an integer
+        :param created_utc: comment creation time (UTC timestamp)
+        :param segment: segment number
+        :param horizon: horizon index
+        :param flags: flag bits
+        '''
+        if self._tail == self.chunk_size:
+            self._new_chunk()
+        self._chunks[-1][0][self._tail] = (numeric_id, int(math.ceil(created_utc)) - EPOCH, segment, horizon, flags)
+        self._tail += 1
+        self._len += 1
+
+    def head(self, n):
+        '''
+        :returns: a copy of the first n records (fewer, if the queue is shorter)
+        '''
+        parts = []
+        head = self._head
+        for chunk, _ in self._chunks:
+            end = self._tail if chunk is self._chunks[-1][0] else self.chunk_size
+            parts.append(chunk[head:min(end, head + n)])
+            n -= len(parts[-1])
+            head = 0
+            if n <= 0:
+                break
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=RECORD_DTYPE)
+
+    def popleft(self, n):
+        '''
+        Remove the first n records
+        '''
+        n = min(n, self._len)
+        self._len -= n
+        while n:
+            end = self._tail if len(self._chunks) == 1 else self.chunk_size
+            taken = min(n, end - self._head)
+            self._head += taken
+            n -= taken
+            if self._head == end and (len(self._chunks) > 1 or self._tail == self.chunk_size):
+                self._drop_chunk()
+        if not self._len and self._chunks:
+            # reuse the last chunk from its start
+            self._head = self._tail = 0
+
+    def close(self):
+        '''
+        Drop all records, and remove the chunk files
+        '''
+        while self._chunks:
+            self._drop_chunk()
+        self._len = 0
+
+def created_utc(records):
+    '''
+    :param records: array of RECORD_DTYPE records
+
+    :returns: float64 array of creation times (UTC timestamps)
+    '''
+    return records["created"].astype(np.float64) + EPOCH
+
+def _field_pattern(field, value):
+    # a key can only be preceded by { or , outside of a string: quotes inside strings are escaped
+    return re.compile(r'[{,]\s*"%s"\s*:\s*%s' % (re.escape(field), value))
+
+_NAME_PATTERN = _field_pattern("name", r'"([a-z0-9]+_[a-z0-9]+)"')
+_CREATED_PATTERN = _field_pattern("created_utc", r'(-?[0-9.]+(?:[eE][-+]?[0-9]+)?)')
+
+def scan_comment_line(line, flag_fields=()):
+    '''
+    Extract what is needed to re-fetch a stored comment from its json line, without parsing it
+    :param line: json-encoded comment, as stored by reddeat (empty fields are not stored)
+    :param flag_fields: fields whose presence flags the comment (see FLAGGED)
+
+    :returns: (fullname, created_utc, flagged)
+    '''
+    name, created = _NAME_PATTERN.search(line), _CREATED_PATTERN.search(line)
+    if name is None or created is None:
+        # unusual formatting: parse the whole line
+        comment = json.loads(line)
+        return comment["name"], float(comment["created_utc"]), any(comment.get(field) for field in flag_fields)
+    flagged = any(_field_pattern(field, "").search(line) for field in flag_fields if '"%s"' % field in line)
+    return name.group(1), float(created.group(1)), flagged
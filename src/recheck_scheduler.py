@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18/oct/2026
+
+Persistent scheduler for comment re-fetches.
+
+The ingest loop registers every comment it logs, keyed by its due time
+(created_utc + delay). Comments can be re-fetched at several horizons (e.g. 1h, 7h,
+24h, 7d after posting): once re-fetched, a comment is scheduled again for the next
+horizon, unless it was confirmed removed, in which case it drops out of the schedule,
+saving the API calls of the later horizons. A single worker asks for the next batch of due fullnames,
+blocking on a condition variable only until the earliest comment comes due (or
+new work arrives), instead of sleeping per log file.
+
+Comments are grouped in segments, one per log file: the segment that is currently
+being written is sealed with the rotated file path when the log rotates, and
+reported as finished once all of its comments have been re-fetched at every horizon,
+or confirmed removed. Each segment keeps the ids of its comments done with (re-fetched
+at the last horizon, or confirmed removed), for checkpointing its progress.
+
+Pending comments are kept as 16-byte records (see pending_store), in one FIFO queue
+per horizon: comments are logged about in creation order, and move on to the next
+horizon in the order they were re-fetched, so every queue is about in due order. A
+comment logged out of order (e.g. a backfilled one) is released along with the
+comments around it: late, never early. The original comment is not kept: its removal
+check fields only matter by being set, so a flag bit stands in for them.
+'''
+
+import threading
+import time
+import numpy as np
+from fullnames import fullname_to_numeric, numeric_to_fullnames
+import pending_store
+from pending_store import RecordQueue, FLAGGED
+from seen_set import SeenSet
+
+MAX_SEGMENTS = 1 << 16 # segment numbers are stored as uint16
+
+class RecheckSegment(object):
+    '''
+    Book-keeping for the comments logged to one (eventually rotated) log file
+    '''
+    __slots__ = ('number', 'fpath', 'pending', 'removed', 'done')
+
+    def __init__(self, number):
+        self.number = number # segment number, as stored in the pending comment records
+        self.fpath = None # rotated log file path, None until the segment is sealed
+        self.pending = 0 # comments scheduled, but not re-fetched yet
+        self.removed = [] # removed comments found before the segment was sealed
+        self.done = SeenSet() # ids of the comments re-fetched at the last horizon, or confirmed removed
+
+    @property
+    def sealed(self):
+        return self.fpath is not None
+
+class RecheckScheduler(object):
+    '''
+    Queue of comment fullnames, ordered by the time they should be re-fetched
+    '''
+    def __init__(self, horizons, batch_size=100, folder=None):
+        '''
+        :param horizons: how many seconds should pass between a comment's post time, and its refetch
+            time. A list of increasing delays, to re-fetch comments at several horizons
+        :param batch_size: maximum number of fullnames released in a batch
+        :param folder: folder for memory-mapping the pending comments (see RecordQueue). None to keep them in memory
+        '''
+        self.horizons = sorted(horizons) if isinstance(horizons, (list, tuple)) else [horizons]
+        self.batch_size = batch_size
+        self.n_checked = [0] * len(self.horizons) # comments re-fetched, per horizon
+        self.n_removed = [0] * len(self.horizons) # comments confirmed removed, per horizon
+        self._queues = [RecordQueue(folder) for _ in self.horizons]
+        self._cond = threading.Condition()
+        self._segments = {} # segment number -> RecheckSegment, for the segments with pending comments
+        self._segment = self._new_segment(0)
+        self._finished = []
+        self._closed = False
+
+    def __len__(self):
+        with self._cond:
+            return sum(len(queue) for queue in self._queues)
+
+    def _new_segment(self, number):
+        # after wrapping around, skip the numbers of the segments still pending
+        while number in self._segments:
+            number = (number + 1) % MAX_SEGMENTS
+        segment = self._segments[number] = RecheckSegment(number)
+        return segment
+
+    def _end_segment(self, segment):
+        del self._segments[segment.number]
+        self._finished.append(segment)
+        self._cond.notify()
+
+    def schedule(self, fullname, created_utc, flagged=False):
+        '''
+        Register a logged comment for re-fetching
+        :param fullname: comment fullname
+        :param created_utc: comment creation time (UTC timestamp)
+        :param flagged: whether the original comment had some of the fields checked for removal set
+        '''
+        with self._cond:
+            self._segment.pending += 1
+            self._push(fullname_to_numeric(fullname), created_utc, self._segment.number, 0, FLAGGED if flagged else 0)
+
+    def _push(self, numeric_id, created_utc, segment_number, horizon, flags):
+        queue = self._queues[horizon]
+        queue.append(numeric_id, created_utc, segment_number, horizon, flags)
+        # wake the worker only if the new comment may be the first to come due
+        if len(queue) == 1:
+            self._cond.notify()
+
+    def seal(self, fpath):
+        '''
+        Associate the comments logged so far with the rotated log file, and start a new segment
+        :param fpath: path of the rotated log file
+        '''
+        with self._cond:
+            segment = self._segment
+            self._segment = self._new_segment((segment.number + 1) % MAX_SEGMENTS)
+            segment.fpath = fpath
+            if not segment.pending:
+                self._end_segment(segment)
+            self._cond.notify()
+
+    def _due_records(self, current_time):
+        '''
+        :returns: (array of due records, in due order, of at most batch_size entries,
+            earliest due time of the records left, or None)
+        '''
+        heads, due_times = [], []
+        for horizon, queue in enumerate(self._queues):
+            head = queue.head(self.batch_size)
+            due_time = pending_store.created_utc(head) + self.horizons[horizon]
+            # records are taken from the front of each queue, up to the first one not due yet
+            n_due = len(due_time) if (due_time <= current_time).all() else int(np.argmax(due_time > current_time))
+            heads.append(head[:n_due])
+            due_times.append(due_time)
+        # the earliest batch_size due records: what is taken from each queue is taken from its front
+        due = np.concatenate(heads)
+        first = np.argsort(np.concatenate([d[:len(head)] for d, head in zip(due_times, heads)]), kind="mergesort")[:self.batch_size]
+        n_taken = np.bincount(due["horizon"][first], minlength=len(self._queues))
+        due = np.concatenate([head[:n] for head, n in zip(heads, n_taken)])
+        due = due[np.argsort(np.concatenate([d[:n] for d, n in zip(due_times, n_taken)]), kind="mergesort")]
+        for queue, n in zip(self._queues, n_taken):
+            queue.popleft(int(n))
+        left = [d[n] for d, n in zip(due_times, n_taken) if n < len(d)]
+        return due, min(left) if left else None
+
+    def next_batch(self, now=time.time):
+        '''
+        Block until some comments are due, or some segments are finished
+        :param now: clock function, returning the current UTC timestamp
+
+        :returns: (batch, finished) where batch is a list of (fullname, segment, flagged, horizon, created_utc)
+            tuples, of at most batch_size entries, and finished is a list of sealed segments
+            with no pending comments. Both are empty if the scheduler was closed. horizon is
+            the index of the horizon the comment is re-fetched at, flagged tells whether the
+            original comment had some of the fields checked for removal set
+        '''
+        with self._cond:
+            while True:
+                if self._closed:
+                    return [], []
+                finished, self._finished = self._finished, []
+                current_time = now()
+                due, next_due = self._due_records(current_time)
+                batch = [(fullname, self._segments[segment], bool(flags & FLAGGED), int(horizon), created)
+                         for fullname, segment, flags, horizon, created in zip(
+                             numeric_to_fullnames(due["id"]).tolist(), due["segment"], due["flags"], due["horizon"], pending_store.created_utc(due))]
+                if batch or finished:
+                    return batch, finished
+                # nothing to do: wait for the first comment to come due, or for new work
+                self._cond.wait(next_due - current_time if next_due is not None else None)
+
+    def task_done(self, batch, removed=()):
+        '''
+        Mark a batch returned by next_batch as re-fetched, and schedule the comments that
+        were not removed for the next horizon
+        :param batch: the batch
+        :param removed: fullnames of the comments of the batch confirmed removed
+        '''
+        with self._cond:
+            for fullname, segment, flagged, horizon, created in batch:
+                self.n_checked[horizon] += 1
+                if fullname in removed:
+                    self.n_removed[horizon] += 1
+                elif horizon + 1 < len(self.horizons):
+                    self._push(fullname_to_numeric(fullname), created, segment.number, horizon + 1, FLAGGED if flagged else 0)
+                    continue
+                segment.done.add(fullname_to_numeric(fullname))
+                segment.pending -= 1
+                if segment.sealed and not segment.pending:
+                    self._end_segment(segment)
+
+    def overdue(self, now=time.time):
+        '''
+        :param now: clock function, returning the current UTC timestamp
+
+        :returns: how many seconds the earliest due comment is past its due time, 0 if none is due
+        '''
+        with self._cond:
+            due_times = [pending_store.created_utc(queue.head(1))[0] + horizon
+                         for queue, horizon in zip(self._queues, self.horizons) if len(queue)]
+        return max(0, now() - min(due_times)) if due_times else 0
+
+    def stats(self):
+        '''
+        :returns: list of dicts, one per horizon, with the horizon (in seconds), how many comments
+            were re-fetched and found removed at that horizon, and re-fetches per removal
+        '''
+        with self._cond:
+            return [{'horizon': horizon, 'checked': checked, 'removed': removed,
+                     'checks_per_removal': float(checked) / removed if removed else None}
+                    for horizon, checked, removed in zip(self.horizons, self.n_checked, self.n_removed)]
+
+    def close(self):
+        '''
+        Wake up and stop the worker, and drop the pending comments
+        '''
+        with self._cond:
+            self._closed = True
+            for queue in self._queues:
+                queue.close()
+            self._cond.notify_all()
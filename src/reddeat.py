@@ -11,28 +11,52 @@ Comments are collected using the PRAW Reddit API wrapper. Authentication is perf
 through OAuth2 -- app credentials must be stored in the corresponding praw.ini file
 for this script to work. A sample praw.ini file is provided with this software, as well 
 as a script to obtain app authentication credentials from the user for the first time.
+All the threads issue their requests through a single RedditClient, which connects on
+the first request, and refreshes the access token ahead of its expiry (see reddit_client).
 
 Operation 1) is performed in the reddeat routine. Comments are fetched through a PRAW
-helper function, asking updates on the 'all' subreddit. Comments are stores as json
-objects, one per line, using the standard python logging module. Empty fields are not 
+helper function, asking updates on the 'all' subreddit, or, with the poll ingest engine, 
+by walking the comment fullnames forward through the API's info endpoint (see id_poller). Comments are stores as json
+objects, one per line, using the standard python logging module, from a background 
+writer thread fed through a bounded queue (see comment_writer). Empty fields are not 
 stored to file for space optimization, however it is easy to get a list of all returned
-json keys. The log file is periodically rotated, for resiliency and re-processing purposes. 
+json keys (see comment_serializer). The log file is periodically rotated, for resiliency and re-processing purposes. 
 It appears that PRAW's helper function is missing some comment fullnames, which should 
 be base36-encoded serial integers: manual inspection suggests those comments were 
 automatically moderated, and never exposed to the public. While this script ignores 
 these automatically moderated comments, Reddit will respond if asked the specific 
-fullnames.
+fullnames: a GapDetector tracks the fullnames seen in the stream, and the missing ones
+are backfilled through the API's info endpoint, using a share of the API rate limit.
 
-Operation 2) is carried on by the recheck_log_file function. When the current log file 
-is rotated, a file system monitor calls this function on the just-closed log file. 
-Comments are re-fetched by fullname through the API's info endpoint, in batches,
-ensuring that the desired time passed between since the first comment in the batch
-was originally posted. Pree.ch found out that on the slowest moderated subreddit in their
+Operation 2) is carried on by the recheck_due_comments worker. Every logged comment is
+registered with a RecheckScheduler, keyed by the time it should be re-fetched; the 
+worker drains due comments across all log files, re-fetching them by fullname through 
+the API's info endpoint, in batches, through a pool of workers sharing the API rate limit.
+Comments can be re-fetched at several horizons (--recheck_horizons), until found removed. When the current log file 
+is rotated, the rotating log handler itself seals the comments logged so far with the rotated 
+file path, and the ids of the comments written so far are snapshotted. The recheck_log_file function can still be used to re-process a single
+log file, ensuring that the desired time passed between since the first comment in 
+the batch was originally posted. Pree.ch found out that on the slowest moderated subreddit in their
 tests, moderators acted on average after 7 hours from the original posting time.
 If a comment meets the criteria defined in check_comment_removed, the re-fetched version 
-is stored using the same format as for operation 1), in a different log file. At the end 
+is stored using the same format as for operation 1), in a different log file, along with
+the bitmask of the removal rules it matched (see removal_classifier), or only as the fields
+that changed from the original (--removed_format delta, see removal_delta). At the end 
 of operation 2), both the original log file, and the log file for the removed comments,
-are bzipped. 
+are bzipped. Alternatively, both log files can be compressed as they are written 
+(see compressed_log), in which case archiving them only takes a rename.
+On startup, the log files left unfinished by a previous run are re-fetched, resuming
+from the checkpoint recorded after each re-fetched batch (see checkpoint), or, for the
+rotated log files of the scheduler, skipping the comments it was done with.
+Rotated log files can also be archived as indexed block archives, for random access
+by fullname, time range or subreddit (see block_archive).
+Ingest can be sharded across processes, each with its own credentials (--site_name),
+reading a group of subreddits (--subreddits), or a stripe of the comment ids
+(--id_stripe), into its own log files (see shard_coordinator, and merge_shards).
+Throughput, latency, backlog and API budget metrics are logged periodically, and can be
+scraped in the Prometheus text format from a local HTTP endpoint (--metrics_port, see metrics).
+With --tiered_storage, archived log files are kept in a fast codec while recent, then merged
+by a low-priority background compactor into day files, and later into month files (see storage_tiers).
 
 @author: Mattia
 '''
@@ -41,16 +65,12 @@ import logging
 import os
 #from future.backports.socket import errno
 from logging.handlers import TimedRotatingFileHandler
-from watchdog.observers import Observer
-from watchdog.events import PatternMatchingEventHandler
 from itertools import izip_longest
 from shutil import copyfileobj
 import bz2
 from functools import partial
-import collections
 from datetime import datetime
 import time
-import praw
 import urllib2
 import requests
 import json
@@ -58,10 +78,29 @@ from numbers import Number
 import sys
 import numpy as np
 from optparse import OptionParser
-import codecs
 from socket import errno
 import RemoteException
 from itertools import islice
+import threading
+from recheck_scheduler import RecheckScheduler
+from pending_store import scan_comment_line
+from removal_classifier import RemovalClassifier
+from removal_delta import make_delta, find_originals
+from refetch_pool import TokenBucketLimiter, Backoff
+from refetch_coalescer import RefetchCoalescer
+from reddit_client import RedditClient
+from compressed_log import PublishingTimedRotatingFileHandler, CompressedTimedRotatingFileHandler, CompressedStream, CompressionStats, open_log, get_codec
+from metrics import Metrics, MetricsServer, MetricsDumper
+from comment_serializer import CommentSerializer, json_encoder
+from comment_writer import BatchedLogWriter, POLICIES as WRITE_POLICIES
+from gap_detector import GapDetector
+from fullnames import fullname_to_numeric, numeric_to_fullname
+from id_poller import IdPoller
+from block_archive import build_archive
+from checkpoint import RecheckCheckpoint, RECHECKING, RECHECKED, unfinished_log_files
+from seen_set import SeenSet, SNAPSHOT_SUFFIX as SEEN_SET_SUFFIX
+import storage_tiers
+from storage_tiers import TieredStorage, Budget, start_compactor
 
 SECONDS = 1
 MINUTES = 60*SECONDS
@@ -72,18 +111,67 @@ RUN_FOR = None#1*HOURS # how long to run the crawler, in seconds. None or negati
 LOGGER_NAME = "reddeat" # logger for comments
 LOGGER_FOLDER = "log/" # where to store the comment logs
 REMOVED_FILE_SUFFIX = ".removed" # suffix for the file containing the re-fetched comments that were removed
-LOG_ROTATION_UNIT = "M" # as defined in watchdog
-LOG_ROTATION_INTERVAL = 1 # as defined in watchdog
+REMOVED_FORMATS = ("full", "delta")
+REMOVED_FORMAT = "full" # how removed comments are stored: full (the whole re-fetched comment), or delta (what changed from the original, see removal_delta)
+SPILL_FILE_SUFFIX = ".spill" # suffix for the file containing the comments that did not fit the write queue
+WRITE_QUEUE_SIZE = 10000 # how many comments can wait to be written to the log file
+WRITE_BATCH_SIZE = 1000 # how many comments are written to the log file at a time
+WRITE_POLICY = "block" # what to do when the write queue is full: block, drop_oldest, or spill
+LOG_ROTATION_UNIT = "M" # as defined in TimedRotatingFileHandler
+LOG_ROTATION_INTERVAL = 1 # as defined in TimedRotatingFileHandler
+LOG_COMPRESSION = None # codec for compressing comment logs as they are written (bz2, gzip, xz, zstd). None to bzip them after re-fetching
+LOG_COMPRESSION_LEVEL = None # compression level for LOG_COMPRESSION. None for the codec's default
+BLOCK_ARCHIVE = False # archive every rotated log file as an indexed block archive, instead of a compressed copy (see block_archive)
+TIERED_STORAGE = False # archive log files with HOT_CODEC, and merge them into day, then month files in the background (see storage_tiers)
+HOT_CODEC = "gzip" # codec for archiving log files with TIERED_STORAGE, unless compressed as they are written: fast to read while recent
+HOT_DAYS = storage_tiers.HOT_DAYS # days a day of log files stays in the hot tier, after it ended
+WARM_DAYS = storage_tiers.WARM_DAYS # days a month of day files stays in the warm tier, after it ended
+DEDUP_CHUNKS = 1024 # how many chunks of 65536 comment ids (8KB each) the set of logged comment ids keeps, for dropping comments logged twice. 0 to disable
 ERROR_LOGGER_NAME = LOGGER_NAME + "_error" # logger for execution errors
 ERROR_LOGGER_FOLDER = "log/" # where to store the error logs
 
 REDDIT_COMMENT_BATCH_SIZE = 100 # 100 is ok, just to play safe with API limits -- reddit's output is roughly 30 comments/s, APIs allow for 100 comments/s requests
-DEFAULT_SLEEP_TIME = 1 * MINUTES # how long to sleep if errors happen
+REDDIT_API_INTERVAL = 1 * SECONDS # time between two re-fetch requests, until the API reports its rate limit -- OAuth clients are allowed 60 requests/minute
+RECHECK_HORIZONS = None # how long after posting comments are re-fetched, e.g. [1*HOURS, 7*HOURS, 1*DAYS, 7*DAYS]. None for once, after a log rotation interval
+REFETCH_WORKERS = 4 # how many re-fetch requests can be in flight at the same time, at most: fewer while Reddit is slow or failing
+COALESCE_WAIT = 1 * SECONDS # how long a fullname to re-fetch can wait for a full request, with the fullnames from the other sources
+REFETCH_PRIORITIES = {"recheck": 0, "resume": 1, "backfill": 2} # which source fills the re-fetch requests first, lowest first
+BACKFILL_SHARE = 0.25 # share of the API rate limit used for fetching the comment fullnames missed by the stream. 0 to disable
+REMOVAL_CHECK_FIELDS = ("banned_by", "mod_reports", "user_reports", "num_reports", "removal_reason", "report_reason") # original comment fields that, if set, flag the comment as removed
+PENDING_STORE_FOLDER = None # folder for memory-mapping the comments waiting to be re-fetched. None to keep them in memory
+DEFAULT_SLEEP_TIME = 1 * MINUTES # longest wait after repeated errors
+RESUME_RETRIES = 10 # how many times a failed batch of a resumed log file is retried, before leaving the file to the next run
+BACKOFF_BASE = 1 * SECONDS # longest wait after the first error: waits double, with jitter, at every consecutive error, up to DEFAULT_SLEEP_TIME
+INGEST_ENGINES = ("stream", "poll")
+INGEST_ENGINE = "stream" # how to collect new comments: stream (PRAW's listing-based comment stream), or poll (walk comment fullnames through the info endpoint)
+SITE_NAME = "reddit" # praw.ini section holding the application credentials
+SUBREDDITS = "all" # subreddits streamed by the stream ingest engine, joined by +
+ID_STRIPE = None # (stripe, stripes): only poll the blocks of comment ids of this stripe, out of stripes. None for all the ids
+JSON_BACKEND = "auto" # json library for storing comments: orjson, ujson, json, or auto for the fastest one installed
+METRICS_PORT = None # local port serving the metrics in the Prometheus text format. None to disable
+METRICS_DUMP_INTERVAL = 5 * MINUTES # how often the metrics are logged to the error log. 0 to disable
 USER_AGENT = "automod v0.1 by /u/hide_ous" # user agent for the application
 #r = praw.Reddit(USER_AGENT)
-r = praw.Reddit('reddit', user_agent='python:automod:v0.1 (by /u/hide_ous)')
-print r.user.me() # chech that authorization succeeds
-r.read_only=True
+client = RedditClient('reddit', user_agent='python:automod:v0.1 (by /u/hide_ous)') # connects on the first request
+recheck_scheduler = None # RecheckScheduler fed by the ingest loop, set up by setup_comment_logger
+comment_serializer = CommentSerializer(logger_name=ERROR_LOGGER_NAME) # turns PRAW comments into json lines, set up again by setup_comment_logger
+comment_writer = None # BatchedLogWriter for the comment logger, set up by setup_comment_logger
+gap_detector = None # GapDetector fed by the ingest loop, set up by setup_comment_logger
+api_limiter = None # TokenBucketLimiter shared by all API requests, set up by setup_comment_logger
+refetch_coalescer = None # RefetchCoalescer packing the fullnames of all the re-fetch sources into full requests, set up by setup_comment_logger
+id_poller = None # IdPoller for the poll ingest engine, set up by new_comments
+removal_classifier = RemovalClassifier() # removal rules for re-fetched comments. New removal markers can be added with add_rule
+seen_ids = None # SeenSet of the ids of the comments logged, set up by setup_comment_logger
+written_ids = None # SeenSet of the ids of the comments written to the log file, snapshotted on rotation and on exit, set up by setup_comment_logger
+seen_ids_fpath = None # snapshot file of written_ids, loaded into both sets
+_written_ids_lock = threading.Lock() # orders the snapshots of written_ids
+metrics = Metrics() # hot path counters and histograms below, gauges registered by setup_metrics
+comments_ingested = metrics.counter("comments_ingested_total", "comments collected from Reddit")
+comments_duplicate = metrics.counter("comments_duplicate_total", "comments collected from Reddit, and dropped as already logged")
+serialization_time = metrics.histogram("serialization_seconds", "time spent turning a comment into a json line")
+recheck_lag = metrics.histogram("recheck_lag_seconds", "how long after their due time comments are handed to the re-fetch workers",
+                                buckets=(1, 5, 15, 60, 5*MINUTES, 15*MINUTES, 1*HOURS, 4*HOURS, 1*DAYS))
+archive_compression = CompressionStats() # bzipping of log files after re-fetching
     
 def to_json(praw_entity):
     '''
@@ -105,7 +193,7 @@ def _check_not_null(x):
     :param x: the item to check
     '''
     if isinstance(x, (Number, bool)):
-        return not np.isnan(x)
+        return x == x
     else:
         return x
     
@@ -117,7 +205,12 @@ def strip_empty_fields(d):
     :returns: d if d is dict, or a copy of d with empty-valued items removed
     '''
     if type(d) is dict:
-        return dict((k, strip_empty_fields(v)) for k, v in d.iteritems() if _check_not_null(v) and strip_empty_fields(v))
+        stripped = {}
+        for k, v in d.iteritems():
+            v = strip_empty_fields(v)
+            if v and _check_not_null(v):
+                stripped[k] = v
+        return stripped
     else:
         return d    
     
@@ -145,124 +238,439 @@ def check_comment_removed(old_comment_, new_comment_):
         - the body in the new version is None, or it contains [deleted] or [removed]
         - the old or the new version of the comment contain non-empty/zero/null values for fields:
             banned_by, mod_reports, user_reports, num_reports, removal_reason, report_reason
+        - a rule added to removal_classifier matches
     '''
-    
-    old_comment, new_comment = collections.defaultdict(lambda: None), collections.defaultdict(lambda: None)
-    old_comment.update(old_comment_)
-    new_comment.update(new_comment_.__dict__)
-#    for k in new_comment:
-#        if new_comment[k] == 'None': 
-#            new_comment[k] = None
-    
-    if (not new_comment["author"]) or (not hasattr(new_comment["author"], 'name')) or ("[deleted]" in new_comment["author"].name) or ("[removed]" in new_comment["author"].name): return True 
-    if (not new_comment["body"]) or ("[deleted]" in new_comment["body"]) or ("[removed]" in new_comment["body"]): return True   
-    if old_comment["banned_by"] or new_comment["banned_by"]: return True
-    if old_comment["mod_reports"] or new_comment["mod_reports"]: return True
-    if old_comment["user_reports"] or new_comment["user_reports"]: return True
-    if old_comment["num_reports"] or new_comment["num_reports"]: return True
-    if old_comment["removal_reason"] or new_comment["removal_reason"]: return True
-    if old_comment["report_reason"] or new_comment["report_reason"]: return True
-    return False
+    flagged = any(old_comment_.get(k) for k in REMOVAL_CHECK_FIELDS)
+    return bool(removal_classifier.classify([new_comment_], [flagged])[0])
 
 @RemoteException.showError
-def recheck_log_file(dest_fpath, removed_fsuffix, comment_batch_size = 100, delay = 1*DAYS):
+def recheck_log_file(dest_fpath, removed_fsuffix, comment_batch_size = 100, delay = 1*DAYS, codec = None, limiter = None, refetched = None, coalescer = None):
     '''
     Given a log file of comments, re-fetch them from reddit by comment fullname and, if deleted,
     store the re-fetched version to file. Then, bzip both the original file, and the file
     containing the removed comments.
+    Progress is recorded in a checkpoint after every re-fetched batch: if the log file was partially
+    re-fetched by a previous run, re-fetching resumes after the last completed batch, skipping
+    the comments the recheck scheduler was done with. A failed batch is retried, up to
+    RESUME_RETRIES times: then the file is left to the next run.
     
     :param dest_fpath: comment log file. comments are json entries, one per line
     :param removed_fsuffix: removed comment log file suffix, appended to dest_fpath
     :param comment_batch_size: how many comment fullnames to fetch per Reddit API call
     :param delay: how many seconds should pass between the original comment's post time, and the refetch time 
+    :param codec: compression codec name, if the log file was compressed as it was written. 
+        The removed comments are compressed as they are written, with the same codec
+    :param limiter: TokenBucketLimiter to acquire before each Reddit API call, or None
+    :param refetched: SeenSet of the ids of the comments already re-fetched, e.g. shared by the log 
+        files re-fetched one after the other. None for a new one: comments logged twice in the 
+        file are re-fetched once
+    :param coalescer: RefetchCoalescer to re-fetch the comments through, sharing requests with the other 
+        sources (limiter is not needed then), or None to issue a request per batch
     '''
     error_logger = logging.getLogger(ERROR_LOGGER_NAME)
     removed_fpath = dest_fpath+removed_fsuffix
+    refetched = SeenSet() if refetched is None else refetched
+    fetch = partial(coalescer.fetch, priority=REFETCH_PRIORITIES["resume"]) if coalescer else fetch_info
+    backoff = Backoff(BACKOFF_BASE, DEFAULT_SLEEP_TIME)
     try:
-        with codecs.open(dest_fpath, 'r', encoding='utf8') as log_f:
-            with codecs.open(removed_fpath, "w+", encoding='utf8') as f:
+        checkpoint = RecheckCheckpoint.load(dest_fpath)
+        if checkpoint is None:
+            checkpoint = RecheckCheckpoint(dest_fpath)
+            open_log(removed_fpath, "w", codec).close()
+            checkpoint.save()
+        elif checkpoint.state == RECHECKING:
+            error_logger.debug("resuming comment re-fetch of %s at byte %d" % (dest_fpath, checkpoint.offset))
+            # drop the removed comments stored after the checkpoint, and append to the ones before
+            with open(removed_fpath, "ab") as f:
+                f.truncate(checkpoint.removed_size)
+            refetched.update(checkpoint.load_done())
+        if checkpoint.state == RECHECKING:
+            with open_log(dest_fpath, 'r', codec) as log_f:
+                log_lines = skip_log_bytes(log_f, checkpoint.offset, codec)
                 # get comment_batch_size comments from the original log file
 #                for next_n_lines in izip_longest(*[log_f] * comment_batch_size):
-                next_n_lines = list(islice(log_f, comment_batch_size))
+                next_n_lines = list(islice(log_lines, comment_batch_size))
                 while next_n_lines :
-                    original_comments = [json.loads(s, encoding="utf8") for s in next_n_lines if s]
-                    n_original_comments = len(original_comments)
-                    original_comments = {s["name"]: s for s in original_comments}
-                    comment_ids = list(original_comments.keys())
-                    min_created_time_utc = np.min([np.float(s["created_utc"]) for s in original_comments.values()])
+                    # only the fullname, creation time and removal check fields are needed: skip parsing the whole comment
+                    scanned_lines = [(scan_comment_line(s, REMOVAL_CHECK_FIELDS), s) for s in next_n_lines if s.strip()]
+                    # skip the comments already re-fetched, across batches
+                    scanned_lines = [line for line in scanned_lines if refetched.add(fullname_to_numeric(line[0][0]))]
+                    min_created_time_utc = np.min([created_utc for (_, created_utc, _), _ in scanned_lines] or [time.time()])
+                    original_comments = {fullname: flagged for (fullname, _, flagged), _ in scanned_lines}
                     # wait for delay to occur before the first comment in the batch and the current time
                     needs_to_wait = delay + int((datetime.utcfromtimestamp(min_created_time_utc) - datetime.utcnow()).total_seconds())
                     if needs_to_wait > 0:
                         error_logger.debug("wait before refetching: sleeping %d seconds" %(needs_to_wait,))
                         time.sleep(needs_to_wait)
-                    try:
-                        # re-fetch them from reddit
-                        refetched_comments = r.info(fullnames=comment_ids) or []
-                        refetched_comments = {s.name: s for s in refetched_comments}
-                        removed_comments = []
-                        for c in original_comments:
-                            if c not in refetched_comments:
-                                # if the comment was not in reddit's response, add its fullname to the list
-                                removed_comments.append((original_comments[c], {"name":c}))
-                            elif check_comment_removed(original_comments[c], refetched_comments[c]):
-#                            elif check_comment_removed(original_comments[c], refetched_comments[c]):
-                                # if the comment has been removed/deleted, add it to the list
-                                removed_comments.append((original_comments[c], refetched_comments[c]))  
-                        for _, refetched_comment in removed_comments:
-                            # write removed/deleted comments to file
-                            
-                            f.write(to_json(strip_empty_fields(refetched_comment.__dict__))+'\n')
-#                            f.write(json.dumps(strip_empty_fields(refetched_comment), check_circular=False)+'\n')
-                        error_logger.debug("found %d/%d removed comments" % (len(removed_comments),n_original_comments))
-                    except urllib2.HTTPError, e:
-                        error_logger.error("Reddit is down (error %s), sleeping, and dropping refetched comments" % e.code)
-                        error_logger.critical(str(e))
-                        time.sleep(DEFAULT_SLEEP_TIME)
-                    except requests.exceptions.RequestException, e:
-                        error_logger.error("connection to Reddit is acting up. sleeping, and dropping refetched comments")
-                        error_logger.error(str(e))
-                        time.sleep(DEFAULT_SLEEP_TIME)
-                    except Exception, e:
-                        error_logger.critical("couldn't Reddit: %s. sleeping, and dropping refetched comments" % (str(e),))
-                        time.sleep(DEFAULT_SLEEP_TIME)
-                    except:
-                        error_logger.critical("unexpected error: %s. sleeping, and dropping refetched comments" % (str(sys.exc_info()),))
-                        time.sleep(DEFAULT_SLEEP_TIME)
-
-                    next_n_lines = list(islice(log_f, comment_batch_size))
+                    failures = 0
+                    while not refetch_log_batch(scanned_lines, original_comments, removed_fpath, codec, limiter, fetch):
+                        # the removed comments of the failed batch may be partially stored
+                        with open(removed_fpath, "ab") as f:
+                            f.truncate(checkpoint.removed_size)
+                        failures += 1
+                        if failures > RESUME_RETRIES:
+                            error_logger.critical("giving up re-fetching %s at byte %d, until the next run" % (dest_fpath, checkpoint.offset))
+                            return
+                        backoff.wait()
+                    backoff.reset()
+
+                    # record the completed batch
+                    checkpoint.offset += sum(len(line.encode("utf8")) for line in next_n_lines)
+                    checkpoint.removed_size = os.path.getsize(removed_fpath)
+                    checkpoint.save()
+                    next_n_lines = list(islice(log_lines, comment_batch_size))
+            checkpoint.state = RECHECKED
+            checkpoint.save()
                                                 
         error_logger.debug("comment re-fetch done")
         
         # clean up
-        error_logger.debug("compressing and archiving logs")
-        for fpath in [dest_fpath, removed_fpath]:
-            # compress the original file once done
-            with open(fpath, 'rb') as infile:
-                with bz2.BZ2File(fpath+'.bz2', 'wb', compresslevel=9) as outfile:
-                    copyfileobj(infile, outfile)
-            # remove the original file
+        archive_log_files([fpath for fpath in (dest_fpath, removed_fpath) if os.path.exists(fpath)], codec,
+                          [dest_fpath] if BLOCK_ARCHIVE else ())
+        checkpoint.remove()
+    except IOError, e:
+        error_logger.critical("File error occurred: %s" % (str(e),))
+
+def skip_log_bytes(log_f, offset, codec = None):
+    '''
+    Move a log file opened with open_log past its first offset (uncompressed) bytes
+    :param log_f: log file, opened for reading with open_log
+    :param offset: how many bytes to skip, at a line boundary
+    :param codec: compression codec name, if the log file is compressed
+
+    :returns: iterator over the following lines
+    '''
+    if offset and not codec:
+        log_f.seek(offset)
+    log_lines = iter(log_f)
+    if offset and codec:
+        # compressed frames can only be skipped by decompressing them
+        skipped = 0
+        while skipped < offset:
+            skipped += len(next(log_lines).encode("utf8"))
+    return log_lines
+
+def archive_log_files(fpaths, codec = None, block_archive_fpaths = ()):
+    '''
+    bzip the given files (compress them with HOT_CODEC, with TIERED_STORAGE), and remove the originals
+    :param fpaths: paths of the files to archive
+    :param codec: compression codec name, if the files were compressed as they were written.
+        In that case, they are just renamed with the codec's extension
+    :param block_archive_fpaths: paths of the comment log files among fpaths to store as indexed
+        block archives instead, compressed with the same codec (see block_archive)
+    '''
+    error_logger = logging.getLogger(ERROR_LOGGER_NAME)
+    error_logger.debug("compressing and archiving logs")
+    for fpath in fpaths:
+        if fpath in block_archive_fpaths:
+            start_time = time.time()
+            archive_fpath, index_fpath = build_archive(fpath, codec or (HOT_CODEC if TIERED_STORAGE else "bz2"), LOG_COMPRESSION_LEVEL, log_codec=codec)
+            if not codec:
+                archive_compression.add(os.path.getsize(fpath), os.path.getsize(archive_fpath), time.time() - start_time)
+            error_logger.debug("block archive built: %s" % (archive_fpath,))
             os.remove(fpath)
-    except IOError:  
+            continue
+        if codec:
+            os.rename(fpath, fpath+get_codec(codec).extension)
+            continue
+        # compress the original file once done
+        start_time = time.time()
+        archive_fpath = fpath+(get_codec(HOT_CODEC).extension if TIERED_STORAGE else '.bz2')
+        with open(fpath, 'rb') as infile:
+            if TIERED_STORAGE:
+                # recent files are read often: the compactor recompresses them once they get old
+                with CompressedStream(archive_fpath, HOT_CODEC, mode='wb') as outfile:
+                    copyfileobj(infile, outfile)
+            else:
+                with bz2.BZ2File(archive_fpath, 'wb', compresslevel=9) as outfile:
+                    copyfileobj(infile, outfile)
+        archive_compression.add(os.path.getsize(fpath), os.path.getsize(archive_fpath), time.time() - start_time)
+        # remove the original file
+        os.remove(fpath)
+
+def fetch_info(fullnames):
+    '''
+    Re-fetch a batch of things from reddit by fullname
+    :param fullnames: list of fullnames
+
+    :returns: (list of PRAW things, (remaining, reset_in)) where the latter is the API rate 
+        limit state after the request, or None if unknown 
+    '''
+    return client.info(fullnames)
+
+def refetch_log_batch(scanned_lines, original_comments, removed_fpath, codec = None, limiter = None, fetch = fetch_info):
+    '''
+    Re-fetch a batch of comments of a log file, and append the removed ones to the removed comment log file
+    :param scanned_lines: list of ((fullname, created_utc, flagged), json line) of the batch, as scanned by scan_comment_line
+    :param original_comments: dict of comment fullname -> whether the original comment had some of the REMOVAL_CHECK_FIELDS set
+    :param removed_fpath: removed comment log file path
+    :param codec: compression codec name of the removed comment log file
+    :param limiter: TokenBucketLimiter to acquire before the Reddit API call, or None
+    :param fetch: fetch function, as fetch_info
+
+    :returns: True if the batch was re-fetched, False if it failed (the error is logged)
+    '''
+    error_logger = logging.getLogger(ERROR_LOGGER_NAME)
+    try:
+        # re-fetch them from reddit
+        if limiter:
+            limiter.acquire()
+        removed_comments = refetch_comments(original_comments, fetch) if original_comments else []
+        if removed_comments and REMOVED_FORMAT == "delta":
+            # only the lines of the removed comments get parsed
+            original_lines = {fullname: s for (fullname, _, _), s in scanned_lines}
+            removed_comments = to_delta_records(removed_comments, 
+                                                {c: json.loads(original_lines[c]) for c, _ in removed_comments})
+        if removed_comments:
+            with open_log(removed_fpath, "a", codec) as f:
+                for _, refetched_comment in removed_comments:
+                    # write removed/deleted comments to file
+                    f.write(refetched_comment+'\n')
+        error_logger.debug("found %d/%d removed comments" % (len(removed_comments),len(scanned_lines)))
+        return True
+    except urllib2.HTTPError, e:
+        error_logger.error("Reddit is down (error %s), retrying the batch" % e.code)
+        error_logger.critical(str(e))
+    except requests.exceptions.RequestException, e:
+        error_logger.error("connection to Reddit is acting up. retrying the batch")
+        error_logger.error(str(e))
+    except Exception, e:
+        error_logger.critical("couldn't Reddit: %s. retrying the batch" % (str(e),))
+    except:
+        error_logger.critical("unexpected error: %s. retrying the batch" % (str(sys.exc_info()),))
+    return False
+
+def find_removed_comments(original_comments, refetched_comments, extra_fields=None):
+    '''
+    Compare a batch of comments with their re-fetched version, and return the removed ones,
+    along with the bitmask of the removal rules they matched (removal_reasons), and the time
+    they were re-fetched (refetched_utc)
+    :param original_comments: dict of comment fullname -> whether the original comment had
+        some of the REMOVAL_CHECK_FIELDS set
+    :param refetched_comments: list of re-fetched comments (PRAW Comment instances)
+    :param extra_fields: dict of comment fullname -> dict of fields to add to the stored removed comment, or None
+
+    :returns: list of (fullname, json-encoded re-fetched version) of the removed comments
+    '''
+    refetched_utc = int(time.time())
+    refetched_comments = {s.name: s for s in refetched_comments}
+    fullnames = list(original_comments)
+    # comments missing from reddit's response are classified as not returned
+    comments = [refetched_comments.get(c) for c in fullnames]
+    reasons = removal_classifier.classify(comments, [original_comments[c] for c in fullnames])
+    removed_comments = []
+    for i in np.flatnonzero(reasons):
+        c = fullnames[i]
+        # if the comment was not in reddit's response, store its fullname only
+        removed_comment = comment_serializer.strip(comments[i].__dict__) if comments[i] is not None else {"name": c}
+        removed_comment["removal_reasons"] = int(reasons[i])
+        removed_comment["refetched_utc"] = refetched_utc
+        if extra_fields and c in extra_fields:
+            removed_comment.update(extra_fields[c])
+        removed_comments.append((c, comment_serializer.dumps(removed_comment)))
+    return removed_comments
+
+def refetch_comments(original_comments, fetch = fetch_info):
+    '''
+    Re-fetch a batch of comments from reddit by fullname, and return the removed ones
+    :param original_comments: dict of comment fullname -> whether the original comment had
+        some of the REMOVAL_CHECK_FIELDS set
+    :param fetch: fetch function, as fetch_info
+
+    :returns: list of (fullname, json-encoded re-fetched version) of the removed comments
+    '''
+    refetched_comments, _ = fetch(list(original_comments.keys()))
+    return find_removed_comments(original_comments, refetched_comments)
+
+_removed_comments_lock = threading.Lock() # guards RecheckSegment.removed across refetch workers
+_checkpoint_lock = threading.Lock() # orders the checkpoints of the sealed segments with their archiving
+
+@RemoteException.showError
+def recheck_due_comments(scheduler, coalescer, removed_fsuffix):
+    '''
+    Dispatcher loop: hand comments to the re-fetch requests as they come due, across all 
+    log files. Once all the comments from a rotated log file are re-fetched, bzip both the 
+    log file, and the file containing the removed comments.
+    
+    :param scheduler: RecheckScheduler, fed by the ingest loop
+    :param coalescer: RefetchCoalescer, calling store_removed_comments and drop_refetched_comments
+    :param removed_fsuffix: removed comment log file suffix, appended to the rotated log file path
+    '''
+    error_logger = logging.getLogger(ERROR_LOGGER_NAME)
+    callback = partial(store_removed_comments, scheduler, removed_fsuffix)
+    error_callback = partial(drop_refetched_comments, scheduler)
+    while True:
+        batch, finished = scheduler.next_batch()
+        if not (batch or finished):
+            # the scheduler was closed
+            break
+        if batch:
+            # batches are in due order: the first comment is the most overdue
+            _, _, _, horizon, created = batch[0]
+            recheck_lag.observe(max(0, time.time() - created - scheduler.horizons[horizon]))
+            coalescer.submit(batch, [entry[0] for entry in batch], callback, error_callback, REFETCH_PRIORITIES["recheck"])
+        for segment in finished:
+            try:
+                flush_removed_comments(segment, removed_fsuffix)
+                error_logger.debug("comment re-fetch done: %s" % (segment.fpath,))
+                error_logger.debug("re-fetch stats: %s" % (json.dumps(coalescer.pool.stats()),))
+                error_logger.debug("re-fetch coalescing stats: %s" % (json.dumps(coalescer.stats()),))
+                error_logger.debug("API client stats: %s" % (json.dumps(client.stats()),))
+                error_logger.debug("recheck horizon stats: %s" % (json.dumps(scheduler.stats()),))
+                # if archiving gets interrupted, the next run only needs to archive
+                checkpoint = RecheckCheckpoint(segment.fpath, state=RECHECKED)
+                with _checkpoint_lock:
+                    checkpoint.save()
+                archive_log_files([segment.fpath, segment.fpath+removed_fsuffix], LOG_COMPRESSION,
+                                  [segment.fpath] if BLOCK_ARCHIVE else ())
+                checkpoint.remove()
+            except IOError, e:
+                error_logger.critical("File error occurred: %s" % (str(e),))
+
+def store_removed_comments(scheduler, removed_fsuffix, batch, refetched_comments):
+    '''
+    RefetchCoalescer callback: check a re-fetched batch for removed comments, and store them
+    :param scheduler: RecheckScheduler the batch comes from
+    :param removed_fsuffix: removed comment log file suffix, appended to the rotated log file path
+    :param batch: batch, as returned by RecheckScheduler.next_batch
+    :param refetched_comments: list of re-fetched comments (PRAW Comment instances)
+    '''
+    error_logger = logging.getLogger(ERROR_LOGGER_NAME)
+    removed_fullnames = set()
+    segments = {fullname: segment for fullname, segment, _, _, _ in batch}
+    try:
+        original_comments = {fullname: flagged for fullname, _, flagged, _, _ in batch}
+        # removed comments record the earliest horizon they were found removed at
+        horizons = {fullname: {"removal_horizon": scheduler.horizons[horizon]} for fullname, _, _, horizon, _ in batch}
+        removed_comments = find_removed_comments(original_comments, refetched_comments, horizons)
+        removed_fullnames.update(fullname for fullname, _ in removed_comments)
+        with _removed_comments_lock:
+            for fullname, removed_comment in removed_comments:
+                segments[fullname].removed.append(removed_comment)
+        error_logger.debug("found %d/%d removed comments" % (len(removed_comments),len(original_comments)))
+    finally:
+        # removed comments drop out of the later horizons
+        scheduler.task_done(batch, removed_fullnames)
+    try:
+        # write out removed comments of the segments whose log file was rotated already
+        for segment in set(segments.values()):
+            if segment.sealed:
+                checkpoint_segment(segment, removed_fsuffix)
+    except IOError, e:
         error_logger.critical("File error occurred: %s" % (str(e),))
+
+def checkpoint_segment(segment, removed_fsuffix):
+    '''
+    Write out the removed comments found so far for a sealed segment, and checkpoint the
+    ids of its comments done with: if the log file gets resumed by the next run, they are
+    skipped, and the removed comments are appended to (see recheck_log_file)
+    :param segment: RecheckSegment, sealed
+    :param removed_fsuffix: removed comment log file suffix, appended to the rotated log file path
+    '''
+    with _checkpoint_lock:
+        if not segment.pending:
+            # finished: recheck_due_comments archives it
+            return
+        # a comment is marked done after its removed version is handed over: snapshot first, flush then
+        done = SeenSet()
+        done.update(segment.done)
+        flush_removed_comments(segment, removed_fsuffix)
+        removed_fpath = segment.fpath + removed_fsuffix
+        checkpoint = RecheckCheckpoint(segment.fpath, removed_size=os.path.getsize(removed_fpath) if os.path.exists(removed_fpath) else 0)
+        checkpoint.save()
+        checkpoint.save_done(done)
+
+def drop_refetched_comments(scheduler, batch, e):
+    '''
+    RefetchCoalescer error callback: log the error, and drop the batch
+    :param scheduler: RecheckScheduler the batch comes from
+    :param batch: batch, as returned by RecheckScheduler.next_batch
+    :param e: the exception raised while re-fetching
+    '''
+    try:
+        log_refetch_error(e)
+    finally:
+        scheduler.task_done(batch)
+
+def log_refetch_error(e):
+    '''
+    Log an error raised while re-fetching comments, once the re-fetch pool gave up retrying
+    (the pool backs off between retries, so there is no need to sleep here)
+    :param e: the exception
+    '''
+    error_logger = logging.getLogger(ERROR_LOGGER_NAME)
+    if isinstance(e, urllib2.HTTPError):
+        error_logger.error("Reddit is down (error %s), dropping refetched comments" % e.code)
+        error_logger.critical(str(e))
+    elif isinstance(e, requests.exceptions.RequestException):
+        error_logger.error("connection to Reddit is acting up. dropping refetched comments")
+        error_logger.error(str(e))
+    else:
+        error_logger.critical("couldn't Reddit: %s. dropping refetched comments" % (str(e),))
+
+@RemoteException.showError
+def backfill_gaps(detector, coalescer, limiter, batch_size = 100, max_wait = 1*MINUTES):
+    '''
+    Backfill loop: hand the comment fullnames missed by the stream to the re-fetch requests
+    :param detector: GapDetector, fed by the ingest loop
+    :param coalescer: RefetchCoalescer, calling store_backfilled_comments and log_refetch_error
+    :param limiter: SharedLimiter pacing the batches of missing fullnames to the backfill share of the API rate limit
+    :param batch_size: how many fullnames to fetch per Reddit API call
+    :param max_wait: how long to wait for a full batch of missing fullnames, in seconds
+    '''
+    while True:
+        holes = detector.wait_for_holes(batch_size, timeout=max_wait)
+        if holes:
+            # the batch may fill the slots left in re-fetch requests: the request token is taken there
+            limiter.pace()
+            coalescer.submit(holes, [numeric_to_fullname(i) for i in holes], store_backfilled_comments, 
+                             lambda _, e: log_refetch_error(e), REFETCH_PRIORITIES["backfill"])
+
+def store_backfilled_comments(batch, fetched_comments):
+    '''
+    RefetchCoalescer callback: log the comments missed by the stream, as if they came from the stream
+    :param batch: list of missing comment ids
+    :param fetched_comments: list of fetched comments (PRAW Comment instances)
+    '''
+    error_logger = logging.getLogger(ERROR_LOGGER_NAME)
+    for comm in fetched_comments:
+        try:
+            log_comment(comm)
+        except Exception, e:
+            error_logger.error(str(e))
+            error_logger.error("cannot persist backfilled comment %s" % comm.__dict__.get("name", ""))
+    error_logger.debug("backfilled %d/%d missing comments" % (len(fetched_comments), len(batch)))
+
+def flush_removed_comments(segment, removed_fsuffix):
+    '''
+    Append the removed comments found so far for a sealed segment to its removed comment log file
+    :param segment: RecheckSegment, sealed
+    :param removed_fsuffix: removed comment log file suffix, appended to the rotated log file path
+    '''
+    with _removed_comments_lock:
+        removed_comments, segment.removed = segment.removed, []
+    if not removed_comments:
+        return
+    if REMOVED_FORMAT == "delta":
+        # the originals are only in the rotated log file: look them up outside of the lock
+        removed_comments = [(json.loads(c)["name"], c) for c in removed_comments]
+        originals = find_originals(segment.fpath, [c for c, _ in removed_comments], LOG_COMPRESSION)
+        removed_comments = [removed_comment for _, removed_comment in to_delta_records(removed_comments, originals)]
+    with _removed_comments_lock:
+        with open_log(segment.fpath+removed_fsuffix, "a", LOG_COMPRESSION, LOG_COMPRESSION_LEVEL) as f:
+            for removed_comment in removed_comments:
+                f.write(removed_comment+'\n')
+
+def to_delta_records(removed_comments, originals):
+    '''
+    :param removed_comments: list of (fullname, json-encoded removed comment), as returned by find_removed_comments
+    :param originals: dict of fullname -> original comment (dict). Comments without an original are kept in full
+
+    :returns: list of (fullname, json-encoded delta record) (see removal_delta)
+    '''
+    return [(fullname, comment_serializer.dumps(make_delta(originals.get(fullname), json.loads(removed_comment))))
+            for fullname, removed_comment in removed_comments]
         
-class LogCompletedEventHandler(PatternMatchingEventHandler):
-    '''
-    Calls a function when a file is moved
-    '''
-    def __init__(self, logger_fname, callback_func):
-        '''
-        :param logger_fname: name of the file to watch  
-        :param callback_func: function to call when the file is moved. The function should 
-                accept the moved file path as the first parameter
-        '''
-        self.logger_fname = logger_fname
-        self.callback_func = callback_func
-        PatternMatchingEventHandler.__init__(self, "*"+logger_fname, ignore_directories=True)
-    def on_moved(self, event):
-        error_logger = logging.getLogger(ERROR_LOGGER_NAME)
-        error_logger.debug("log file rotated: %s" % ( str(event),))        
-        self.callback_func(event.dest_path)       
-     
 def parse_command_line():   
     '''
     Parse command line arguments, and update global variables accordingly
@@ -270,19 +678,48 @@ def parse_command_line():
     
     global LOGGER_NAME, LOGGER_FOLDER, REMOVED_FILE_SUFFIX, ERROR_LOGGER_NAME, \
         ERROR_LOGGER_FOLDER, RUN_FOR, LOG_ROTATION_UNIT, LOG_ROTATION_INTERVAL, \
-        DEFAULT_SLEEP_TIME, REDDIT_COMMENT_BATCH_SIZE
+        DEFAULT_SLEEP_TIME, BACKOFF_BASE, REDDIT_COMMENT_BATCH_SIZE, REDDIT_API_INTERVAL, REFETCH_WORKERS, \
+        LOG_COMPRESSION, LOG_COMPRESSION_LEVEL, JSON_BACKEND, WRITE_QUEUE_SIZE, WRITE_BATCH_SIZE, \
+        WRITE_POLICY, BACKFILL_SHARE, INGEST_ENGINE, BLOCK_ARCHIVE, RECHECK_HORIZONS, PENDING_STORE_FOLDER, \
+        REMOVED_FORMAT, METRICS_PORT, METRICS_DUMP_INTERVAL, SITE_NAME, SUBREDDITS, ID_STRIPE, \
+        DEDUP_CHUNKS, COALESCE_WAIT, TIERED_STORAGE, HOT_DAYS, WARM_DAYS
 
     parser = OptionParser()
     parser.add_option("-n", "--log_name", action="store", type="string", dest="LOGGER_NAME", default=LOGGER_NAME, help="file name where to store comments")
     parser.add_option("-f", "--log_folder", action="store", type="string", dest="LOGGER_FOLDER", default=LOGGER_FOLDER, help="folder where to store comments. should terminate in /")
     parser.add_option("-r", "--removed_file_suffix", action="store", type="string", dest="REMOVED_FILE_SUFFIX", default=REMOVED_FILE_SUFFIX, help="suffix for the file containing the re-fetched comments that were removed")
+    parser.add_option("--removed_format", action="store", type="choice", choices=REMOVED_FORMATS, dest="REMOVED_FORMAT", default=REMOVED_FORMAT, help="how to store removed comments: full (the whole re-fetched comment), or delta (only what changed from the original in the log file, see removal_delta)")
     parser.add_option("-e", "--error_log_name", action="store", type="string", dest="ERROR_LOGGER_NAME", default=ERROR_LOGGER_NAME, help="file name where to log execution errors")
     parser.add_option("-l", "--error_log_folder", action="store", type="string", dest="ERROR_LOGGER_FOLDER", default=ERROR_LOGGER_FOLDER, help="folder where to log execution errors. should terminate in /")
     parser.add_option("-d", "--duration", action="store", type="int", dest="RUN_FOR", default=RUN_FOR, help="how long to run the crawler, in seconds. Zero or negative for no stop")
     parser.add_option("-u", "--rotation_unit", action="store", type="string", dest="LOG_ROTATION_UNIT", default=LOG_ROTATION_UNIT, help="S - Seconds; M - Minutes; H - Hours; D - Days; midnight - roll over at midnight; W{0-6} - roll over on a certain day (0 = Monday)")
     parser.add_option("-i", "--rotation_interval", action="store", type="int", dest="LOG_ROTATION_INTERVAL", default=LOG_ROTATION_INTERVAL, help="rotate log file this many LOG_ROTATION_UNITs")
-    parser.add_option("-s", "--sleep", action="store", type="int", dest="DEFAULT_SLEEP_TIME", default=DEFAULT_SLEEP_TIME, help="how long to sleep if errors happen")
-    parser.add_option("-b", "--batch_size", action="store", type="int", dest="REDDIT_COMMENT_BATCH_SIZE", default=REDDIT_COMMENT_BATCH_SIZE, help="how many (potentially removed) comment fullnames to ask Reddit at a time. should be <=100 to comply with API limits")
+    parser.add_option("-s", "--sleep", action="store", type="int", dest="DEFAULT_SLEEP_TIME", default=DEFAULT_SLEEP_TIME, help="longest wait after repeated errors, in seconds")
+    parser.add_option("--backoff_base", action="store", type="float", dest="BACKOFF_BASE", default=BACKOFF_BASE, help="longest wait after the first error, in seconds. Waits double, with jitter, at every consecutive error, up to --sleep")
+    parser.add_option("-b", "--batch_size", action="store", type="int", dest="REDDIT_COMMENT_BATCH_SIZE", default=REDDIT_COMMENT_BATCH_SIZE, help="how many (potentially removed) comment fullnames to ask Reddit at a time, at most: fewer while Reddit is failing. should be <=100 to comply with API limits")
+    parser.add_option("-a", "--api_interval", action="store", type="float", dest="REDDIT_API_INTERVAL", default=REDDIT_API_INTERVAL, help="time between two comment re-fetch requests, in seconds, until Reddit reports its rate limit")
+    parser.add_option("--recheck_horizons", action="store", type="string", dest="RECHECK_HORIZONS", default=None, help="comma-separated list of how long after posting comments are re-fetched, e.g. 1h,7h,24h,7d (units: s, m, h, d). Removed comments are not re-fetched at later horizons. Defaults to once, after a log rotation interval")
+    parser.add_option("--pending_folder", action="store", type="string", dest="PENDING_STORE_FOLDER", default=PENDING_STORE_FOLDER, help="folder for memory-mapping the comments waiting to be re-fetched, so that the OS can page them out. If not given, they are kept in memory")
+    parser.add_option("-w", "--refetch_workers", action="store", type="int", dest="REFETCH_WORKERS", default=REFETCH_WORKERS, help="how many comment re-fetch requests can be in flight at the same time, at most: fewer while Reddit is slow or failing")
+    parser.add_option("--coalesce_wait", action="store", type="float", dest="COALESCE_WAIT", default=COALESCE_WAIT, help="how long a comment fullname to re-fetch can wait for a full request, with the fullnames from the other sources (due comments, resumed log files, backfill), in seconds")
+    parser.add_option("-z", "--compression", action="store", type="string", dest="LOG_COMPRESSION", default=LOG_COMPRESSION, help="compress comment logs as they are written, with this codec (bz2, gzip, xz, zstd). If not given, logs are bzipped after re-fetching")
+    parser.add_option("-c", "--compression_level", action="store", type="int", dest="LOG_COMPRESSION_LEVEL", default=LOG_COMPRESSION_LEVEL, help="compression level for --compression. Defaults to the codec's default")
+    parser.add_option("-j", "--json_backend", action="store", type="string", dest="JSON_BACKEND", default=JSON_BACKEND, help="json library for storing comments: orjson, ujson, json, or auto for the fastest one installed")
+    parser.add_option("-q", "--write_queue_size", action="store", type="int", dest="WRITE_QUEUE_SIZE", default=WRITE_QUEUE_SIZE, help="how many comments can wait to be written to the log file")
+    parser.add_option("--write_batch_size", action="store", type="int", dest="WRITE_BATCH_SIZE", default=WRITE_BATCH_SIZE, help="how many comments are written to the log file at a time")
+    parser.add_option("-p", "--write_policy", action="store", type="choice", choices=WRITE_POLICIES, dest="WRITE_POLICY", default=WRITE_POLICY, help="what to do when the write queue is full: block the crawler, drop the oldest comment, or spill comments to a file")
+    parser.add_option("--backfill_share", action="store", type="float", dest="BACKFILL_SHARE", default=BACKFILL_SHARE, help="share of the API rate limit used for fetching the comment fullnames missed by the stream. 0 to disable")
+    parser.add_option("--block_archive", action="store_true", dest="BLOCK_ARCHIVE", default=BLOCK_ARCHIVE, help="archive every rotated log file as an indexed block archive, for random access by fullname, time range or subreddit")
+    parser.add_option("--tiered_storage", action="store_true", dest="TIERED_STORAGE", default=TIERED_STORAGE, help="archive log files with a fast codec, and merge them in the background into day files (LOG_FOLDER/warm), then month files with a columnar version (LOG_FOLDER/cold)")
+    parser.add_option("--hot_days", action="store", type="int", dest="HOT_DAYS", default=HOT_DAYS, help="days the log files of a day are kept as they are, after the day ended (--tiered_storage)")
+    parser.add_option("--warm_days", action="store", type="int", dest="WARM_DAYS", default=WARM_DAYS, help="days the day files of a month are kept, after the month ended (--tiered_storage)")
+    parser.add_option("--dedup_chunks", action="store", type="int", dest="DEDUP_CHUNKS", default=DEDUP_CHUNKS, help="how many chunks of 65536 comment ids (8KB each) to remember, for dropping the comments logged twice (e.g. re-emitted by the stream after a restart). 0 to disable")
+    parser.add_option("--metrics_port", action="store", type="int", dest="METRICS_PORT", default=METRICS_PORT, help="serve metrics in the Prometheus text format at http://127.0.0.1:METRICS_PORT/metrics. If not given, metrics are only logged")
+    parser.add_option("--metrics_interval", action="store", type="int", dest="METRICS_DUMP_INTERVAL", default=METRICS_DUMP_INTERVAL, help="log the metrics to the error log every this many seconds. 0 to disable")
+    parser.add_option("--ingest_engine", action="store", type="choice", choices=INGEST_ENGINES, dest="INGEST_ENGINE", default=INGEST_ENGINE, help="how to collect new comments: stream (PRAW's comment stream), or poll (walk comment fullnames through the info endpoint)")
+    parser.add_option("--site_name", action="store", type="string", dest="SITE_NAME", default=SITE_NAME, help="praw.ini section holding the application credentials, e.g. one per shard")
+    parser.add_option("--subreddits", action="store", type="string", dest="SUBREDDITS", default=SUBREDDITS, help="subreddits to stream, joined by +, e.g. AskReddit+funny. Only for the stream ingest engine")
+    parser.add_option("--id_stripe", action="store", type="string", dest="ID_STRIPE", default=None, help="only poll a stripe of the comment ids, as STRIPE/STRIPES, e.g. 0/4: ids are dealt to the stripes in blocks of --batch_size. Only for the poll ingest engine")
     (options, _) = parser.parse_args()
     # update global variables
     LOGGER_NAME = options.LOGGER_NAME
@@ -294,7 +731,62 @@ def parse_command_line():
     LOG_ROTATION_UNIT = options.LOG_ROTATION_UNIT
     LOG_ROTATION_INTERVAL = options.LOG_ROTATION_INTERVAL
     DEFAULT_SLEEP_TIME = options.DEFAULT_SLEEP_TIME
+    BACKOFF_BASE = options.BACKOFF_BASE
     REDDIT_COMMENT_BATCH_SIZE = options.REDDIT_COMMENT_BATCH_SIZE
+    REDDIT_API_INTERVAL = options.REDDIT_API_INTERVAL
+    REFETCH_WORKERS = options.REFETCH_WORKERS
+    COALESCE_WAIT = options.COALESCE_WAIT
+    LOG_COMPRESSION = options.LOG_COMPRESSION
+    LOG_COMPRESSION_LEVEL = options.LOG_COMPRESSION_LEVEL
+    JSON_BACKEND = options.JSON_BACKEND
+    WRITE_QUEUE_SIZE = options.WRITE_QUEUE_SIZE
+    WRITE_BATCH_SIZE = options.WRITE_BATCH_SIZE
+    WRITE_POLICY = options.WRITE_POLICY
+    BACKFILL_SHARE = options.BACKFILL_SHARE
+    INGEST_ENGINE = options.INGEST_ENGINE
+    SITE_NAME = options.SITE_NAME
+    SUBREDDITS = options.SUBREDDITS
+    if options.ID_STRIPE:
+        try:
+            ID_STRIPE = tuple(int(i) for i in options.ID_STRIPE.split("/"))
+            assert len(ID_STRIPE) == 2 and 0 <= ID_STRIPE[0] < ID_STRIPE[1]
+        except (ValueError, AssertionError):
+            parser.error("--id_stripe should be STRIPE/STRIPES, with 0 <= STRIPE < STRIPES")
+        if INGEST_ENGINE != "poll":
+            parser.error("--id_stripe needs the poll ingest engine")
+    if SUBREDDITS != "all" and INGEST_ENGINE != "stream":
+        parser.error("--subreddits needs the stream ingest engine")
+    client.site_name = SITE_NAME
+    BLOCK_ARCHIVE = options.BLOCK_ARCHIVE
+    TIERED_STORAGE = options.TIERED_STORAGE
+    HOT_DAYS = options.HOT_DAYS
+    WARM_DAYS = options.WARM_DAYS
+    DEDUP_CHUNKS = options.DEDUP_CHUNKS
+    PENDING_STORE_FOLDER = options.PENDING_STORE_FOLDER
+    REMOVED_FORMAT = options.REMOVED_FORMAT
+    METRICS_PORT = options.METRICS_PORT
+    METRICS_DUMP_INTERVAL = options.METRICS_DUMP_INTERVAL
+    if options.RECHECK_HORIZONS:
+        RECHECK_HORIZONS = parse_durations(options.RECHECK_HORIZONS)
+    if LOG_COMPRESSION:
+        get_codec(LOG_COMPRESSION) # fail early on unavailable codecs
+    json_encoder(JSON_BACKEND) # fail early on unavailable json libraries
+
+def parse_durations(s):
+    '''
+    :param s: comma-separated list of durations, e.g. 1h,7h,24h,7d (units: s, m, h, d; seconds if missing)
+
+    :returns: list of durations, in seconds
+    '''
+    units = {"s": SECONDS, "m": MINUTES, "h": HOURS, "d": DAYS}
+    durations = []
+    for duration in s.split(","):
+        duration = duration.strip().lower()
+        if duration[-1:] in units:
+            durations.append(float(duration[:-1]) * units[duration[-1]])
+        else:
+            durations.append(float(duration))
+    return durations
 
 def setup_error_logger():
     '''
@@ -317,26 +809,244 @@ def setup_error_logger():
 
 def setup_comment_logger():
     '''
-    Setup logger for comments fetched from Reddit, and start the file system monitor
-    for triggering comment re-fetch when the logger gets rotated
+    Setup logger for comments fetched from Reddit, and start the comment re-fetch worker
     '''
+    global recheck_scheduler, comment_serializer, comment_writer, gap_detector, api_limiter, \
+        seen_ids, written_ids, seen_ids_fpath, refetch_coalescer
     logger_path = os.path.abspath(LOGGER_FOLDER+LOGGER_NAME) 
     logger_dir = os.path.dirname(logger_path)
     logger_fname = os.path.basename(logger_path)
     mkdir_p(logger_dir)
     logger = logging.getLogger(LOGGER_NAME)
+    if TIERED_STORAGE:
+        # forked before any other thread is started
+        compactor = start_compactor(TieredStorage(logger_path, HOT_DAYS, WARM_DAYS, removed_fsuffix=REMOVED_FILE_SUFFIX, budget=Budget()), 
+                                    log_fpath=os.path.abspath(ERROR_LOGGER_FOLDER+ERROR_LOGGER_NAME+"_compactor"))
+        logging.getLogger(ERROR_LOGGER_NAME).debug("storage compactor started: process %d" % (compactor.pid,))
+    # the log file of a previous run is re-fetched as a rotated one
+    set_aside_log_file(logger_path)
     # log comments to file, rotating files at a given rate
-    handler = TimedRotatingFileHandler(logger_path, when=LOG_ROTATION_UNIT, interval=LOG_ROTATION_INTERVAL, backupCount=0, encoding="utf8", delay=False, utc=True)
+    if LOG_COMPRESSION:
+        handler = CompressedTimedRotatingFileHandler(logger_path, codec=LOG_COMPRESSION, level=LOG_COMPRESSION_LEVEL, when=LOG_ROTATION_UNIT, interval=LOG_ROTATION_INTERVAL, backupCount=0, delay=False, utc=True)
+    else:
+        handler = PublishingTimedRotatingFileHandler(logger_path, when=LOG_ROTATION_UNIT, interval=LOG_ROTATION_INTERVAL, backupCount=0, encoding="utf8", delay=False, utc=True)
     handler.setLevel(logging.DEBUG)
     logger.addHandler(handler)
     logger.setLevel(logging.DEBUG)
+    comment_serializer = CommentSerializer(json_backend=JSON_BACKEND, logger_name=ERROR_LOGGER_NAME)
+    logging.getLogger(ERROR_LOGGER_NAME).debug("storing comments with %s" % (comment_serializer.json_backend,))
+    
+    # reload the ids of the comments logged by previous runs
+    if DEDUP_CHUNKS > 0:
+        seen_ids_fpath = logger_path+SEEN_SET_SUFFIX
+        start_time = time.time()
+        seen_ids = SeenSet.load(seen_ids_fpath, DEDUP_CHUNKS)
+        written_ids = SeenSet.load(seen_ids_fpath, DEDUP_CHUNKS)
+        logging.getLogger(ERROR_LOGGER_NAME).debug("%d chunks of logged comment ids loaded in %.3f seconds" % (len(seen_ids), time.time() - start_time))
+    
+    # ingest, re-fetch, backfill and resume threads share the keep-alive connections of the API client
+    client.set_pool_size(REFETCH_WORKERS + 3)
+    
+    # setup comment re-fetch worker
+    recheck_horizons = RECHECK_HORIZONS or [handler.interval]
+    if PENDING_STORE_FOLDER:
+        mkdir_p(PENDING_STORE_FOLDER)
+    recheck_scheduler = RecheckScheduler(recheck_horizons, batch_size=REDDIT_COMMENT_BATCH_SIZE, folder=PENDING_STORE_FOLDER)
+    # due comments, resumed log files and backfilled fullnames share full re-fetch requests
+    refetch_coalescer = RefetchCoalescer(fetch_info, batch_size=REDDIT_COMMENT_BATCH_SIZE, n_workers=REFETCH_WORKERS, 
+                                         limiter=TokenBucketLimiter(1./REDDIT_API_INTERVAL), 
+                                         backoff=Backoff(BACKOFF_BASE, DEFAULT_SLEEP_TIME), max_wait=COALESCE_WAIT,
+                                         logger_name=ERROR_LOGGER_NAME).start()
+    api_limiter = refetch_coalescer.pool.limiter
+    worker = threading.Thread(target=partial(recheck_due_comments, recheck_scheduler, refetch_coalescer, removed_fsuffix=REMOVED_FILE_SUFFIX), name="recheck_worker")
+    worker.setDaemon(True)
+    worker.start()
     
-    # setup logger watchdog
-    event_handler = LogCompletedEventHandler(logger_fname, partial(recheck_log_file, removed_fsuffix=REMOVED_FILE_SUFFIX, comment_batch_size=REDDIT_COMMENT_BATCH_SIZE, delay=handler.interval))
-    observer = Observer()
-    observer.schedule(event_handler, logger_dir, recursive=False)
-    observer.setDaemon(True)
-    observer.start()
+    # setup comment writer: comments are scheduled for re-fetching once they are in the log file
+    comment_writer = BatchedLogWriter(logger, max_queue=WRITE_QUEUE_SIZE, batch_size=WRITE_BATCH_SIZE, policy=WRITE_POLICY, 
+                                      spill_fpath=logger_path+SPILL_FILE_SUFFIX, on_written=partial(schedule_written_comments, recheck_scheduler),
+                                      error_logger_name=ERROR_LOGGER_NAME).start()
+    
+    # setup backfilling of the comments missed by the stream
+    gap_detector = GapDetector()
+    if BACKFILL_SHARE > 0 and (ID_STRIPE or SUBREDDITS != "all"):
+        # the comments of the other shards would look missing
+        logging.getLogger(ERROR_LOGGER_NAME).info("backfilling disabled for sharded ingest")
+    elif BACKFILL_SHARE > 0:
+        backfiller = threading.Thread(target=partial(backfill_gaps, gap_detector, refetch_coalescer, api_limiter.share(BACKFILL_SHARE), 
+                                                     batch_size=REDDIT_COMMENT_BATCH_SIZE), name="backfill_worker")
+        backfiller.setDaemon(True)
+        backfiller.start()
+    
+    # resume re-fetching the log files left by previous runs
+    unfinished_fpaths = unfinished_log_files(logger_dir, logger_fname, handler.extMatch)
+    if unfinished_fpaths:
+        # a single re-fetch at the last horizon finds every removal the schedule would have found
+        resumer = threading.Thread(target=partial(resume_log_files, unfinished_fpaths, delay=max(recheck_horizons)), name="resume_worker")
+        resumer.setDaemon(True)
+        resumer.start()
+    
+    handler.on_rotated = partial(log_rotated, recheck_scheduler)
+    
+    setup_metrics(handler)
+
+def setup_metrics(handler):
+    '''
+    Register the gauges reading the statistics of the crawler components, and start the
+    metrics endpoint and the periodic metrics dump
+    :param handler: comment log handler
+    '''
+    error_logger = logging.getLogger(ERROR_LOGGER_NAME)
+    metrics.gauge("write_queue_depth", "comments waiting to be written to the log file", lambda: comment_writer.stats()["queue_depth"])
+    metrics.gauge("write_queue_dropped_total", "comments dropped by the write queue", lambda: comment_writer.dropped, metric_type="counter")
+    metrics.histograms("api_request_seconds", "latency of the API requests", lambda: dict(client.latency), label="endpoint")
+    metrics.gauge("api_requests_remaining", "API requests left in the current rate limit window, as last reported", lambda: api_limiter.remaining)
+    metrics.gauge("api_request_rate", "API requests per second allowed by the rate limiter", lambda: api_limiter.rate)
+    metrics.gauge("refetch_requests_total", "re-fetch requests issued", lambda: refetch_coalescer.stats()["requests"], metric_type="counter")
+    metrics.gauge("refetch_requests_saved_total", "re-fetch requests saved by sharing requests between the re-fetch sources, over a request per source batch", 
+                  lambda: refetch_coalescer.stats()["requests_saved"], metric_type="counter")
+    metrics.gauge("refetch_fullnames_total", "fullnames carried by the re-fetch requests", lambda: refetch_coalescer.stats()["fullnames"], metric_type="counter")
+    metrics.gauge("refetch_batch_size", "largest number of fullnames per re-fetch request, as adapted to errors", lambda: refetch_coalescer.batch_size)
+    metrics.gauge("refetch_concurrency", "re-fetch requests allowed in flight, as adapted to latency and errors", lambda: refetch_coalescer.concurrency)
+    metrics.gauge("recheck_backlog", "comments waiting to be re-fetched", lambda: len(recheck_scheduler))
+    metrics.gauge("recheck_overdue_seconds", "how long the earliest due comment is past its due time", recheck_scheduler.overdue)
+    metrics.gauge("comments_rechecked_total", "comments re-fetched", lambda: sum(recheck_scheduler.n_checked), metric_type="counter")
+    metrics.gauge("comments_removed_total", "re-fetched comments found removed", lambda: sum(recheck_scheduler.n_removed), metric_type="counter")
+    compression = {"archive": archive_compression}
+    if isinstance(handler, CompressedTimedRotatingFileHandler):
+        compression["log"] = handler.compression_stats
+    metrics.gauge("compression_input_bytes_total", "uncompressed bytes compressed", 
+                  lambda: dict((k, v.bytes_in) for k, v in compression.items()), label="stage", metric_type="counter")
+    metrics.gauge("compression_output_bytes_total", "compressed bytes written", 
+                  lambda: dict((k, v.bytes_out) for k, v in compression.items()), label="stage", metric_type="counter")
+    metrics.gauge("compression_seconds_total", "time spent compressing", 
+                  lambda: dict((k, v.seconds) for k, v in compression.items()), label="stage", metric_type="counter")
+    if METRICS_PORT is not None:
+        server = MetricsServer(metrics, METRICS_PORT).start()
+        error_logger.debug("serving metrics on port %d" % (server.port,))
+    if METRICS_DUMP_INTERVAL > 0:
+        MetricsDumper(metrics, METRICS_DUMP_INTERVAL, ERROR_LOGGER_NAME).start()
+
+def set_aside_log_file(logger_path):
+    '''
+    Rename the comment log file left by a previous run as a rotated log file, named after
+    its last modification time, so that it gets re-fetched instead of appended to
+    :param logger_path: comment log file path
+    '''
+    error_logger = logging.getLogger(ERROR_LOGGER_NAME)
+    if not (os.path.exists(logger_path) and os.path.getsize(logger_path)):
+        return
+    # same name format as the rotated log files
+    suffix = TimedRotatingFileHandler(os.devnull, when=LOG_ROTATION_UNIT, delay=True).suffix
+    rotated_fpath = logger_path + "." + time.strftime(suffix, time.gmtime(os.path.getmtime(logger_path)))
+    if os.path.exists(rotated_fpath):
+        error_logger.error("cannot set aside log file %s: %s exists" % (logger_path, rotated_fpath))
+        return
+    os.rename(logger_path, rotated_fpath)
+    error_logger.debug("log file of a previous run set aside: %s" % (rotated_fpath,))
+
+@RemoteException.showError
+def resume_log_files(fpaths, delay):
+    '''
+    Re-fetch the log files left by previous runs, from their checkpoints, sharing the API rate limit
+    :param fpaths: rotated log file paths
+    :param delay: how many seconds should pass between the original comment's post time, and the refetch time
+    '''
+    error_logger = logging.getLogger(ERROR_LOGGER_NAME)
+    # a log file set aside after a restart and the next one share the comments re-emitted by the stream
+    refetched = SeenSet()
+    for fpath in fpaths:
+        error_logger.debug("resuming comment re-fetch: %s" % (fpath,))
+        recheck_log_file(fpath, REMOVED_FILE_SUFFIX, REDDIT_COMMENT_BATCH_SIZE, delay, LOG_COMPRESSION, 
+                         refetched=refetched, coalescer=refetch_coalescer)
+
+def log_rotated(scheduler, fpath):
+    '''
+    Log handler callback, run right after a rollover: seal the comments logged so far with
+    the rotated log file, and snapshot the ids of the comments written so far, in the
+    background. The rotated file is archived once re-fetched
+    :param scheduler: RecheckScheduler
+    :param fpath: rotated log file path
+    '''
+    logging.getLogger(ERROR_LOGGER_NAME).debug("log file rotated: %s" % (fpath,))
+    scheduler.seal(fpath)
+    if written_ids is not None:
+        snapshotter = threading.Thread(target=save_written_ids, name="seen_snapshot")
+        snapshotter.setDaemon(True)
+        snapshotter.start()
+
+def save_written_ids():
+    '''
+    Snapshot the ids of the comments written to the log file. The comments still queued for
+    writing are left out: after a crash, they are not dropped as logged already
+    '''
+    with _written_ids_lock:
+        snapshot = SeenSet(DEDUP_CHUNKS)
+        snapshot.floor = written_ids.floor
+        snapshot.update(written_ids)
+        # the comments of the snapshot may still be buffered by the log handler
+        for handler in logging.getLogger(LOGGER_NAME).handlers:
+            if isinstance(handler, CompressedTimedRotatingFileHandler):
+                handler.flush_frame()
+        snapshot.save(seen_ids_fpath)
+
+def schedule_written_comments(scheduler, written):
+    '''
+    BatchedLogWriter callback: schedule the comments just written to the log file for re-fetching,
+    and record their ids as written
+    :param scheduler: RecheckScheduler
+    :param written: list of (json-encoded comment, (fullname, created_utc, flagged)) tuples
+    '''
+    for _, (fullname, created_utc, flagged) in written:
+        scheduler.schedule(fullname, created_utc, flagged)
+        if written_ids is not None:
+            written_ids.add(fullname_to_numeric(fullname))
+
+def log_comment(comm):
+    '''
+    Queue a comment for writing to the comment log, and for re-fetching once written, unless
+    it was logged already
+    :param comm: PRAW Comment instance
+
+    :returns: the stored version of the comment (dict), or None if it was logged already
+    '''
+    if seen_ids is not None and not seen_ids.add(fullname_to_numeric(comm.__dict__["name"])):
+        comments_duplicate.inc()
+        return None
+    start_time = time.time()
+    comment, comment_json = comment_serializer.serialize(comm.__dict__)
+    serialization_time.observe(time.time() - start_time)
+    comment_writer.put(comment_json, (comment["name"], comment["created_utc"], 
+                                      any(comment.get(k) for k in REMOVAL_CHECK_FIELDS)))
+    return comment
+
+def log_skipped_ids(first_id, last_id):
+    '''
+    IdPoller callback: log a stride of ids that never showed up, moved past by the poller.
+    The gap detector hands them out for backfilling, as the other missing ids
+    :param first_id: first skipped id, as an integer
+    :param last_id: last skipped id, as an integer
+    '''
+    error_logger = logging.getLogger(ERROR_LOGGER_NAME)
+    error_logger.warning("no comment found among ids %s-%s: moved past them" % (numeric_to_fullname(first_id), numeric_to_fullname(last_id)))
+
+def new_comments():
+    '''
+    :returns: iterator over new comments (PRAW Comment instances), according to INGEST_ENGINE
+    '''
+    global id_poller
+    if INGEST_ENGINE == "poll":
+        if id_poller is None:
+            # start from the newest comment in the listing
+            newest_comment = client.newest_comment()
+            stripe, stripes = ID_STRIPE or (0, 1)
+            id_poller = IdPoller(fetch_info, fullname_to_numeric(newest_comment.name), limiter=api_limiter, 
+                                 stride=REDDIT_COMMENT_BATCH_SIZE, stripe=stripe, stripes=stripes,
+                                 newest_id_func=lambda: fullname_to_numeric(client.newest_comment().name),
+                                 on_skip=log_skipped_ids)
+        # the poller keeps its position across errors
+        return id_poller.comments()
+    return client.comment_stream(SUBREDDITS)
 
 def reddeat():
     '''
@@ -345,7 +1055,6 @@ def reddeat():
     
     # get loggers
     error_logger = logging.getLogger(ERROR_LOGGER_NAME)
-    logger = logging.getLogger(LOGGER_NAME)
 
     # define stopping conditions
     start_time = time.time()
@@ -361,14 +1070,19 @@ def reddeat():
 
     # eat Reddit
     counter = 0
+    backoff = Backoff(BACKOFF_BASE, DEFAULT_SLEEP_TIME)
     error_logger.debug(USER_AGENT)
     error_logger.debug("%s - starting crawler" % (time.strftime("%y/%m/%d %H:%M"),))
     while not _done():
         try:
             #for comm in praw.helpers.comment_stream(r, subreddit="all", limit=None, verbosity=2):
-            for comm in r.subreddit('all').stream.comments():
+            for comm in new_comments():
                 try:
-                    logger.info(to_json(strip_empty_fields(comm.__dict__)))
+                    comment = log_comment(comm)
+                    comments_ingested.inc()
+                    if comment is not None:
+                        gap_detector.add(fullname_to_numeric(comment["name"]))
+                    backoff.reset()
                 except Exception, e:
                     
                     comment_name = ""
@@ -379,16 +1093,24 @@ def reddeat():
                 counter+=1
                 if not (counter % 10**3):
                     error_logger.debug("%s - %d comments fetched" % (time.strftime("%y/%m/%d %H:%M"), counter))
+                if not (counter % 10**4):
+                    error_logger.debug("comment writer stats: %s" % (json.dumps(comment_writer.stats()),))
+                    error_logger.debug("gap detector stats: %s" % (json.dumps(gap_detector.stats()),))
+                    error_logger.debug("API client stats: %s" % (json.dumps(client.stats()),))
+                    if seen_ids is not None:
+                        error_logger.debug("logged comment ids stats: %s" % (json.dumps(seen_ids.stats()),))
+                    if id_poller:
+                        error_logger.debug("id poller stats: %s" % (json.dumps(id_poller.stats()),))
                 if _done():
                     break
         except urllib2.HTTPError, e:
             error_logger.error("Reddit is down (error %s), sleeping..." % e.code)
             error_logger.error(str(e))
-            time.sleep(DEFAULT_SLEEP_TIME)
+            backoff.wait()
         except requests.exceptions.RequestException, e:
             error_logger.error("connection to Reddit is acting up. sleeping...")
             error_logger.error(str(e))
-            time.sleep(DEFAULT_SLEEP_TIME)
+            backoff.wait()
         except (KeyboardInterrupt, SystemExit):
             error_logger.critical("caught user/system interrupt")
             done = True
@@ -396,11 +1118,16 @@ def reddeat():
         except Exception, e:
             error_logger.critical("couldn't Reddit: %s" % (str(e),))
             error_logger.error(str(e))
-            time.sleep(DEFAULT_SLEEP_TIME)
+            backoff.wait()
         except:
             error_logger.critical("an unknown error happened. sleeping")
-            time.sleep(DEFAULT_SLEEP_TIME)
-            
+            backoff.wait()
+
+    # write out queued comments
+    comment_writer.stop()
+    error_logger.debug("comment writer stats: %s" % (json.dumps(comment_writer.stats()),))
+    if written_ids is not None:
+        save_written_ids()
     error_logger.debug("%s - %d comments fetched. bye" % (time.strftime("%y/%m/%d %H:%M"), counter))
 
 if __name__ == '__main__':
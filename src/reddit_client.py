@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18/oct/2026
+
+Reddit API client layer, shared by the ingest, re-fetch, backfill and resume threads.
+
+RedditClient creates its praw.Reddit instance lazily, on the first request, so that
+importing or starting the crawler never waits on the network. It owns the HTTP
+connection pool (PRAW's requests session, whose keep-alive pool is sized for the
+threads sharing it), and refreshes the OAuth access token ahead of its expiry, under
+a lock, so that concurrent requests never find an expired token, nor race to refresh
+it. The latency of every request is recorded in a LatencyHistogram per endpoint.
+429 answers are raised as refetch_pool.RateLimited, with the seconds left until the
+rate limit window resets, so that the callers block their rate limiter until then.
+'''
+
+import threading
+import time
+import praw
+import prawcore
+import requests
+from metrics import Histogram
+from refetch_pool import RateLimited
+
+LATENCY_BUCKETS = (.05, .1, .25, .5, 1., 2.5, 5., 10., 30.) # upper bounds of the latency histogram buckets, in seconds
+TOKEN_REFRESH_MARGIN = 5*60 # refresh the access token this many seconds before it expires
+RATE_LIMIT_RESET = 60 # seconds to wait after a 429 without X-Ratelimit-Reset header: the length of Reddit's rate limit window
+
+class LatencyHistogram(Histogram):
+    '''
+    Thread-safe histogram of request latencies, in seconds
+    '''
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        Histogram.__init__(self, buckets)
+
+class RedditClient(object):
+    '''
+    Lazily connected, thread-safe wrapper of praw.Reddit for the endpoints used by the crawler
+    '''
+    def __init__(self, site_name='reddit', user_agent=None, pool_size=10, read_only=True,
+                 refresh_margin=TOKEN_REFRESH_MARGIN, factory=praw.Reddit):
+        '''
+        :param site_name: praw.ini section holding the application credentials
+        :param user_agent: user agent for the application
+        :param pool_size: how many keep-alive connections to keep open: one per thread issuing requests
+        :param read_only: whether to use the application-only (read-only) OAuth flow
+        :param refresh_margin: refresh the access token this many seconds before it expires
+        :param factory: function creating the praw.Reddit instance
+        '''
+        self.site_name = site_name
+        self.user_agent = user_agent
+        self.pool_size = pool_size
+        self.read_only = read_only
+        self.refresh_margin = refresh_margin
+        self.token_refreshes = 0
+        self.latency = {} # endpoint -> LatencyHistogram
+        self._factory = factory
+        self._reddit = None
+        self._lock = threading.Lock() # guards the creation of the praw.Reddit instance, and token refreshes
+
+    @property
+    def reddit(self):
+        '''
+        The praw.Reddit instance, created on first use
+        '''
+        if self._reddit is None:
+            with self._lock:
+                if self._reddit is None:
+                    reddit = self._factory(self.site_name, user_agent=self.user_agent)
+                    reddit.read_only = self.read_only
+                    self._mount_pool(reddit)
+                    self._reddit = reddit
+        return self._reddit
+
+    def set_pool_size(self, pool_size):
+        '''
+        :param pool_size: how many keep-alive connections to keep open: one per thread issuing requests
+        '''
+        self.pool_size = pool_size
+        if self._reddit is not None:
+            self._mount_pool(self._reddit)
+
+    def _mount_pool(self, reddit):
+        session = getattr(getattr(getattr(reddit, '_core', None), '_requestor', None), '_http', None)
+        if hasattr(session, 'mount'):
+            session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size))
+
+    def _refresh_token(self, reddit):
+        '''
+        Refresh the access token if it expires within refresh_margin seconds
+        '''
+        authorizer = getattr(getattr(reddit, '_core', None), '_authorizer', None)
+        expires_at = getattr(authorizer, '_expiration_timestamp', None)
+        if expires_at is None or expires_at - time.time() > self.refresh_margin:
+            return
+        with self._lock:
+            # another thread may have refreshed it while this one was waiting
+            if authorizer._expiration_timestamp - time.time() <= self.refresh_margin:
+                authorizer.refresh()
+                self.token_refreshes += 1
+
+    def _request(self, endpoint, func, *args, **kwargs):
+        reddit = self.reddit
+        self._refresh_token(reddit)
+        histogram = self.latency.get(endpoint)
+        if histogram is None:
+            histogram = self.latency.setdefault(endpoint, LatencyHistogram())
+        start_time = time.time()
+        try:
+            return func(reddit, *args, **kwargs)
+        except prawcore.exceptions.ResponseException, e:
+            # TooManyRequests, on the prawcore versions that have it, is a ResponseException
+            if getattr(e.response, 'status_code', None) != 429:
+                raise
+            raise RateLimited(self._reset_in(e.response))
+        finally:
+            histogram.observe(time.time() - start_time)
+
+    def _reset_in(self, response):
+        '''
+        :returns: seconds until the rate limit window resets, according to a 429 response
+        '''
+        try:
+            return float(response.headers["X-Ratelimit-Reset"])
+        except (KeyError, TypeError, ValueError):
+            rate_limit = self.rate_limit()
+            return rate_limit[1] if rate_limit and rate_limit[1] > 0 else RATE_LIMIT_RESET
+
+    def rate_limit(self):
+        '''
+        :returns: (remaining, reset_in), the API rate limit state after the last request, or None if unknown
+        '''
+        rate_limiter = getattr(getattr(self._reddit, '_core', None), '_rate_limiter', None)
+        if getattr(rate_limiter, 'remaining', None) is None or getattr(rate_limiter, 'reset_timestamp', None) is None:
+            return None
+        return rate_limiter.remaining, rate_limiter.reset_timestamp - time.time()
+
+    def info(self, fullnames):
+        '''
+        Fetch a batch of things by fullname
+        :param fullnames: list of fullnames
+
+        :returns: (list of PRAW things, (remaining, reset_in)) where the latter is the API rate
+            limit state after the request, or None if unknown. Raises RateLimited on 429s
+        '''
+        # PRAW's info is a lazy generator: the request is issued while listing it
+        things = self._request("info", lambda reddit: list(reddit.info(fullnames=fullnames) or []))
+        return things, self.rate_limit()
+
+    def newest_comment(self, subreddit='all'):
+        '''
+        :returns: the newest comment of a subreddit (PRAW Comment instance)
+        '''
+        return self._request("comments", lambda reddit: next(iter(reddit.subreddit(subreddit).comments(limit=1))))
+
+    def comment_stream(self, subreddit='all'):
+        '''
+        :returns: iterator over the new comments of a subreddit (PRAW Comment instances), as
+            streamed by PRAW. Its listing requests are issued by PRAW, and not timed
+        '''
+        reddit = self.reddit
+        self._refresh_token(reddit)
+        return reddit.subreddit(subreddit).stream.comments()
+
+    def me(self):
+        '''
+        :returns: the authenticated user, to check that authorization succeeds
+        '''
+        return self._request("me", lambda reddit: reddit.user.me())
+
+    def stats(self):
+        '''
+        :returns: dict with the token refreshes, and the latency histogram of every endpoint
+        '''
+        return {'token_refreshes': self.token_refreshes,
+                'latency': dict((endpoint, histogram.as_dict()) for endpoint, histogram in self.latency.items())}
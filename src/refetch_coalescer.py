@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18/oct/2026
+
+Coalescing layer in front of RefetchPool: the fullnames handed over by all the
+re-fetch sources (the multi-horizon recheck schedule, the log files resumed from a
+previous run, the gap backfill) are packed into shared info requests, so that a
+request carries batch_size fullnames whenever there are that many waiting, instead
+of one request per source batch. A request goes out once it is full, or once its
+oldest fullname waited max_wait seconds. Sources are served by priority: lower
+priority fullnames fill the slots left in the requests.
+
+Each source batch gets its callback (or error callback) once all of its fullnames
+were re-fetched, possibly over several requests, with the things of its fullnames.
+
+The request size and the number of requests in flight adapt to the observed API
+behaviour (AIMD, as TCP congestion control): an error halves both, a response slower
+than target_latency takes one request in flight off, and every round of fast
+responses gives one back, and doubles a reduced request size. 429s are left to the
+rate limiter.
+
+stats reports how many requests the coalescing saved over re-fetching every source
+batch on its own, in requests of batch_size fullnames.
+'''
+
+import collections
+import threading
+import time
+from refetch_pool import RefetchPool, RateLimited
+
+MAX_WAIT = 1. # seconds a fullname waits for a full request
+TARGET_LATENCY = 2. # seconds: slower responses reduce the requests in flight
+MIN_BATCH_SIZE = 10 # smallest request size the adaptation goes down to
+LATENCY_SMOOTHING = .1 # weight of the last response in the latency and error rate averages
+
+class SourceBatch(object):
+    '''
+    Book-keeping for a batch of fullnames handed over by a source
+    '''
+    __slots__ = ('batch', 'callback', 'error_callback', 'left', 'things', 'error')
+
+    def __init__(self, batch, n_fullnames, callback, error_callback):
+        self.batch = batch # opaque batch object, passed back to the callbacks
+        self.callback = callback
+        self.error_callback = error_callback
+        self.left = n_fullnames # fullnames not re-fetched yet
+        self.things = []
+        self.error = None # last error of the requests carrying fullnames of the batch
+
+class RefetchCoalescer(object):
+    '''
+    Packs the fullnames of all the sources into full info requests, issued by a RefetchPool
+    '''
+    def __init__(self, fetch_func, batch_size=100, n_workers=4, limiter=None, backoff=None, max_wait=MAX_WAIT,
+                 target_latency=TARGET_LATENCY, min_batch_size=MIN_BATCH_SIZE, max_pending=None, fullname_of=lambda thing: thing.name,
+                 logger_name="refetch_pool"):
+        '''
+        :param fetch_func: function taking a list of fullnames, and returning a tuple (things, rate_limit), as for RefetchPool
+        :param batch_size: largest number of fullnames per request
+        :param n_workers: largest number of requests in flight
+        :param limiter: TokenBucketLimiter shared by the requests, as for RefetchPool
+        :param backoff: Backoff for the waits between failed requests, as for RefetchPool
+        :param max_wait: how long a fullname can wait for a full request, in seconds
+        :param target_latency: response time above which fewer requests are kept in flight, in seconds
+        :param min_batch_size: smallest request size, after errors
+        :param max_pending: how many fullnames can wait for a request; submit blocks when full. Defaults to 4 full requests per worker
+        :param fullname_of: function returning the fullname of a re-fetched thing
+        :param logger_name: logger for the exceptions raised by the callbacks, as for RefetchPool
+        '''
+        self.max_batch_size = self.batch_size = batch_size
+        self.max_concurrency = self.concurrency = n_workers
+        self.max_wait = max_wait
+        self.target_latency = target_latency
+        self.min_batch_size = min(min_batch_size, batch_size)
+        self.max_pending = max_pending or 4 * batch_size * n_workers
+        self.fullname_of = fullname_of
+        self.pool = RefetchPool(self._fetch, self._done, self._failed, n_workers=n_workers, limiter=limiter,
+                                max_queue=n_workers, backoff=backoff, logger_name=logger_name)
+        self.n_requests, self.n_fullnames, self.n_batches, self.n_batch_requests = 0, 0, 0, 0
+        self.n_errors, self.mean_latency, self.error_rate = 0, 0., 0.
+        self._fetch_func = fetch_func
+        self._pending = collections.defaultdict(collections.deque) # priority -> deque of (fullname, SourceBatch, submitted at)
+        self._n_pending = 0
+        self._in_flight = 0
+        self._successes = 0 # fast responses since the last adaptation
+        self._closed = False
+        self._cond = threading.Condition()
+        self._dispatcher = threading.Thread(target=self._dispatch, name="refetch_coalescer")
+        self._dispatcher.setDaemon(True)
+
+    def start(self):
+        self.pool.start()
+        self._dispatcher.start()
+        return self
+
+    def submit(self, batch, fullnames, callback, error_callback=None, priority=0):
+        '''
+        Queue the fullnames of a source batch for re-fetching, blocking while too many fullnames are waiting
+        :param batch: opaque batch object, passed back to the callbacks
+        :param fullnames: fullnames to re-fetch
+        :param callback: function called with (batch, things) once all the fullnames are re-fetched
+        :param error_callback: function called with (batch, exception) instead, if a request carrying some of them failed
+        :param priority: lower priority fullnames are re-fetched first
+        '''
+        fullnames = list(fullnames)
+        source_batch = SourceBatch(batch, len(fullnames), callback, error_callback)
+        if not fullnames:
+            callback(batch, [])
+            return
+        with self._cond:
+            while self._n_pending >= self.max_pending and not self._closed:
+                self._cond.wait()
+            submitted_at = time.time()
+            self._pending[priority].extend((fullname, source_batch, submitted_at) for fullname in fullnames)
+            self._n_pending += len(fullnames)
+            self.n_batches += 1
+            self.n_batch_requests += -(-len(fullnames) // self.max_batch_size)
+            self._cond.notify_all()
+
+    def fetch(self, fullnames, priority=0):
+        '''
+        Re-fetch fullnames through the shared requests, blocking until done
+        :param fullnames: fullnames to re-fetch
+        :param priority: as for submit
+
+        :returns: (list of re-fetched things, None), as a fetch function. Raises the error of a failed request
+        '''
+        done = threading.Event()
+        result = []
+        def callback(_, things):
+            result.append(things)
+            done.set()
+        def error_callback(_, e):
+            result.append(e)
+            done.set()
+        self.submit(None, fullnames, callback, error_callback, priority)
+        done.wait()
+        if isinstance(result[0], Exception):
+            raise result[0]
+        return result[0], None
+
+    def _take(self, now):
+        '''
+        :returns: list of (fullname, SourceBatch) of the next request, or None if it should wait.
+            Called with the lock held
+        '''
+        if not self._n_pending or self._in_flight >= self.concurrency:
+            return None
+        oldest = min(queue[0][2] for queue in self._pending.itervalues() if queue)
+        if self._n_pending < self.batch_size and now - oldest < self.max_wait and not self._closed:
+            return None
+        request = []
+        for priority in sorted(self._pending):
+            queue = self._pending[priority]
+            while queue and len(request) < self.batch_size:
+                fullname, source_batch, _ = queue.popleft()
+                request.append((fullname, source_batch))
+            if not queue:
+                del self._pending[priority]
+        self._n_pending -= len(request)
+        self._in_flight += 1
+        self.n_requests += 1
+        self.n_fullnames += len(request)
+        self._cond.notify_all()
+        return request
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.time()
+                    request = self._take(now)
+                    if request is not None:
+                        break
+                    if self._closed and not self._n_pending:
+                        return
+                    if self._n_pending and self._in_flight < self.concurrency:
+                        # wait for the oldest fullname to reach max_wait, or for more fullnames
+                        oldest = min(queue[0][2] for queue in self._pending.itervalues() if queue)
+                        self._cond.wait(max(oldest + self.max_wait - now, 0.001))
+                    else:
+                        self._cond.wait()
+            # the same fullname from several sources takes a single slot
+            fullnames = list(collections.OrderedDict.fromkeys(fullname for fullname, _ in request))
+            self.pool.submit(request, fullnames)
+
+    def _fetch(self, fullnames):
+        start_time = time.time()
+        try:
+            result = self._fetch_func(fullnames)
+        except RateLimited:
+            raise
+        except Exception:
+            self._adapt(time.time() - start_time, True)
+            raise
+        self._adapt(time.time() - start_time, False)
+        return result
+
+    def _adapt(self, latency, error):
+        with self._cond:
+            self.mean_latency += LATENCY_SMOOTHING * (latency - self.mean_latency)
+            self.error_rate += LATENCY_SMOOTHING * ((1. if error else 0.) - self.error_rate)
+            if error:
+                self.n_errors += 1
+                self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+                self.concurrency = max(1, self.concurrency // 2)
+                self._successes = 0
+            elif latency > self.target_latency:
+                self.concurrency = max(1, self.concurrency - 1)
+                self._successes = 0
+            else:
+                self._successes += 1
+                # additive increase, once per round of requests in flight
+                if self._successes >= self.concurrency:
+                    self._successes = 0
+                    self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+                    self.batch_size = min(self.max_batch_size, self.batch_size * 2)
+            self._cond.notify_all()
+
+    def _finish(self, request, things=None, error=None):
+        '''
+        Hand the things of a finished request to the source batches, and call the callbacks of the completed ones
+        '''
+        things_by_fullname = dict((self.fullname_of(thing), thing) for thing in things or ())
+        completed = []
+        with self._cond:
+            self._in_flight -= 1
+            for fullname, source_batch in request:
+                thing = things_by_fullname.get(fullname)
+                if thing is not None:
+                    source_batch.things.append(thing)
+                if error is not None:
+                    source_batch.error = error
+                source_batch.left -= 1
+                if not source_batch.left:
+                    completed.append(source_batch)
+            self._cond.notify_all()
+        for source_batch in completed:
+            if source_batch.error is None:
+                source_batch.callback(source_batch.batch, source_batch.things)
+            elif source_batch.error_callback:
+                source_batch.error_callback(source_batch.batch, source_batch.error)
+
+    def _done(self, request, things):
+        self._finish(request, things)
+
+    def _failed(self, request, e):
+        self._finish(request, error=e)
+
+    def join(self):
+        '''
+        Block until all the submitted fullnames are re-fetched
+        '''
+        with self._cond:
+            while self._n_pending or self._in_flight:
+                self._cond.wait(self.max_wait)
+
+    def stop(self):
+        '''
+        Send out the fullnames waiting for a full request, and stop once they are re-fetched
+        '''
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._dispatcher.join()
+        self.pool.stop()
+
+    def stats(self):
+        '''
+        :returns: dict with the requests issued, the fullnames they carried (a fullname submitted
+            by several sources at once counts once per source), the source batches
+            submitted, the requests re-fetching every source batch on its own would have taken,
+            the requests saved, the current request size and requests in flight, and the average
+            latency and error rate
+        '''
+        with self._cond:
+            return {'requests': self.n_requests, 'fullnames': self.n_fullnames, 'batches': self.n_batches,
+                    'uncoalesced_requests': self.n_batch_requests, 'requests_saved': self.n_batch_requests - self.n_requests,
+                    'fullnames_per_request': float(self.n_fullnames) / self.n_requests if self.n_requests else 0.,
+                    'pending': self._n_pending, 'in_flight': self._in_flight, 'batch_size': self.batch_size,
+                    'concurrency': self.concurrency, 'mean_latency': self.mean_latency, 'error_rate': self.error_rate,
+                    'errors': self.n_errors}
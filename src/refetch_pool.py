@@ -0,0 +1,397 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18/oct/2026
+
+Bounded pool of worker threads re-fetching comment batches through the API's info
+endpoint. All workers share a TokenBucketLimiter, which follows Reddit's rate limit
+headers (X-Ratelimit-Remaining and X-Ratelimit-Reset) so that the pool spends the
+whole API budget of the current window, without being answered with 429s.
+
+The pool does not know about PRAW: it is given a fetch function, which takes a list
+of fullnames and returns the re-fetched things together with the rate limit state,
+so it can be run against a local fake info endpoint (see fake_reddit.py).
+
+ProcessTokenBucketLimiter keeps the token bucket in shared memory, so that a pool of
+processes (see reprocess.py) shares a single API budget.
+
+Failed requests are retried after an exponential backoff with full jitter (Backoff),
+shared by all the workers through the limiter: the first retry comes within a second,
+and the wait only grows up to its cap while the errors go on.
+'''
+
+import logging
+import multiprocessing
+import random
+import threading
+import time
+import Queue
+
+class RateLimited(Exception):
+    '''
+    Raised by fetch functions when the API answers with a 429
+    '''
+    def __init__(self, reset_in):
+        '''
+        :param reset_in: seconds until the rate limit window resets
+        '''
+        Exception.__init__(self, "rate limited for %s seconds" % (reset_in,))
+        self.reset_in = reset_in
+
+class Backoff(object):
+    '''
+    Thread-safe exponential backoff with full jitter: after n consecutive failures, the
+    wait is drawn uniformly between 0 and min(cap, base * 2**n)
+    '''
+    def __init__(self, base=1., cap=60., sleep=time.sleep, rnd=random.random):
+        '''
+        :param base: upper bound of the first wait, in seconds
+        :param cap: upper bound of any wait, in seconds
+        :param sleep: sleep function
+        :param rnd: function returning a random float in [0, 1)
+        '''
+        self.base = float(base)
+        self.cap = float(cap)
+        self.failures = 0 # consecutive failures
+        self._sleep = sleep
+        self._rnd = rnd
+        self._lock = threading.Lock()
+
+    def delay(self):
+        '''
+        Record a failure
+
+        :returns: how many seconds to wait before trying again
+        '''
+        with self._lock:
+            upper = min(self.cap, self.base * 2 ** min(self.failures, 32))
+            self.failures += 1
+        return self._rnd() * upper
+
+    def wait(self):
+        '''
+        Record a failure, and sleep before trying again
+
+        :returns: how many seconds were slept
+        '''
+        seconds = self.delay()
+        self._sleep(seconds)
+        return seconds
+
+    def reset(self):
+        '''
+        Record a success
+        '''
+        with self._lock:
+            self.failures = 0
+
+class TokenBucketLimiter(object):
+    '''
+    Thread-safe token bucket, refilled at a rate derived from the API rate limit headers
+    '''
+    def __init__(self, rate, capacity=1, clock=time.time, sleep=time.sleep):
+        '''
+        :param rate: initial refill rate, in requests per second, used until the first rate limit update
+        :param capacity: maximum number of tokens (requests that can be issued in a burst)
+        :param clock: clock function
+        :param sleep: sleep function
+        '''
+        self.rate = float(rate)
+        self.capacity = capacity
+        self.remaining = None # requests left in the current window, as last reported by the API
+        self._tokens = float(capacity)
+        self._last_refill = clock()
+        self._blocked_until = 0
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self):
+        '''
+        Block until a request can be issued, and take a token
+
+        :returns: how many seconds the caller waited
+        '''
+        waited = 0
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._refill(now)
+                if now < self._blocked_until:
+                    needs_to_wait = self._blocked_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    if self.remaining is not None:
+                        self.remaining -= 1
+                    return waited
+                else:
+                    needs_to_wait = (1 - self._tokens) / self.rate
+            self._sleep(needs_to_wait)
+            waited += needs_to_wait
+
+    def update(self, remaining, reset_in):
+        '''
+        Spread the requests left in the current window evenly until the window resets
+        :param remaining: requests left in the current window
+        :param reset_in: seconds until the window resets
+        '''
+        if remaining is None or reset_in is None:
+            return
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            reset_in = max(float(reset_in), 0)
+            # other workers may have issued requests since this response was sent
+            self.remaining = int(remaining)
+            if self.remaining < 1:
+                self._tokens = 0
+                self._blocked_until = now + reset_in
+            else:
+                self.rate = self.remaining / max(reset_in, 1.)
+                self._tokens = min(self._tokens, self.remaining)
+
+    def update_from_headers(self, headers):
+        '''
+        Update the limiter from the rate limit headers of an API response
+        :param headers: response headers (case-insensitive mapping, or dict with lower-case keys)
+        '''
+        remaining, reset_in = headers.get('x-ratelimit-remaining'), headers.get('x-ratelimit-reset')
+        if remaining is not None and reset_in is not None:
+            self.update(float(remaining), float(reset_in))
+
+    def block(self, seconds):
+        '''
+        Stop issuing requests for a while, e.g. after a 429 response
+        :param seconds: how long to stop for
+        '''
+        with self._lock:
+            self._tokens = 0
+            self._blocked_until = max(self._blocked_until, self._clock() + seconds)
+
+    def share(self, fraction):
+        '''
+        :param fraction: share of this limiter's rate, between 0 and 1
+
+        :returns: a SharedLimiter, issuing at most fraction of the requests allowed by this limiter
+        '''
+        return SharedLimiter(self, fraction)
+
+def _shared_state(index):
+    def get(self):
+        return self._state[index]
+    def set(self, value):
+        self._state[index] = value
+    return property(get, set)
+
+class ProcessTokenBucketLimiter(TokenBucketLimiter):
+    '''
+    TokenBucketLimiter shared by processes: the bucket lives in shared memory, guarded
+    by a process lock. It must be created before the processes are started, and handed
+    to them at start (e.g. through multiprocessing.Pool's initargs)
+    '''
+    rate = _shared_state(0)
+    _tokens = _shared_state(1)
+    _last_refill = _shared_state(2)
+    _blocked_until = _shared_state(3)
+    _remaining = _shared_state(4) # NaN if unknown
+
+    def __init__(self, rate, capacity=1, clock=time.time, sleep=time.sleep):
+        self._state = multiprocessing.RawArray('d', 5)
+        TokenBucketLimiter.__init__(self, rate, capacity, clock, sleep)
+        self._lock = multiprocessing.Lock()
+
+    @property
+    def remaining(self):
+        remaining = self._remaining
+        return None if remaining != remaining else int(remaining)
+
+    @remaining.setter
+    def remaining(self, value):
+        self._remaining = float("nan") if value is None else value
+
+class SharedLimiter(object):
+    '''
+    Limiter drawing from a parent TokenBucketLimiter, capped at a share of the parent's rate
+    '''
+    def __init__(self, parent, fraction):
+        '''
+        :param parent: TokenBucketLimiter
+        :param fraction: share of the parent's rate, between 0 and 1
+        '''
+        self.parent = parent
+        self.fraction = fraction
+        self._own = TokenBucketLimiter(parent.rate * fraction, clock=parent._clock, sleep=parent._sleep)
+
+    @property
+    def rate(self):
+        return self.parent.rate * self.fraction
+
+    @property
+    def remaining(self):
+        return self.parent.remaining
+
+    def acquire(self):
+        # the parent's rate follows the API rate limit
+        self._own.rate = self.rate
+        return self._own.acquire() + self.parent.acquire()
+
+    def pace(self):
+        '''
+        Block until this share allows a request, without taking a token from the parent: for
+        requests that take their token elsewhere (e.g. coalesced with other requests)
+
+        :returns: how many seconds the caller waited
+        '''
+        self._own.rate = self.rate
+        return self._own.acquire()
+
+    def update(self, remaining, reset_in):
+        self.parent.update(remaining, reset_in)
+
+    def block(self, seconds):
+        self.parent.block(seconds)
+
+class WorkerStats(object):
+    '''
+    Per-worker request counters and latencies
+    '''
+    __slots__ = ('requests', 'errors', 'retries', 'callback_errors', 'fullnames', 'total_latency', 'max_latency', 'total_wait')
+
+    def __init__(self):
+        self.requests, self.errors, self.retries, self.callback_errors, self.fullnames = 0, 0, 0, 0, 0
+        self.total_latency, self.max_latency, self.total_wait = 0., 0., 0.
+
+    def as_dict(self):
+        return {'requests': self.requests, 'errors': self.errors, 'retries': self.retries,
+                'callback_errors': self.callback_errors, 'fullnames': self.fullnames,
+                'mean_latency': self.total_latency / self.requests if self.requests else 0.,
+                'max_latency': self.max_latency, 'rate_limit_wait': self.total_wait}
+
+class RefetchPool(object):
+    '''
+    Bounded queue of fullname batches, consumed by worker threads sharing a rate limiter
+    '''
+    def __init__(self, fetch_func, callback, error_callback=None, n_workers=4, limiter=None, max_queue=64, retries=3, backoff=None,
+                 logger_name="refetch_pool"):
+        '''
+        :param fetch_func: function taking a list of fullnames, and returning a tuple
+            (things, rate_limit), where rate_limit is a (remaining, reset_in) tuple, or None
+        :param callback: function called by the workers with (batch, things) once a batch is re-fetched
+        :param error_callback: function called by the workers with (batch, exception) if a re-fetch fails retries times
+        :param n_workers: number of worker threads
+        :param limiter: TokenBucketLimiter (or SharedLimiter) shared by the workers. If None, one request per second is allowed
+        :param max_queue: maximum number of batches waiting for a worker; submit blocks when full
+        :param retries: how many times a failed batch is retried before giving up on it
+        :param backoff: Backoff for the waits between failed requests, blocking all the workers. If None, waits start within 1 second, up to 1 minute
+        :param logger_name: logger for the exceptions raised by the callbacks, which do not stop the workers
+        '''
+        self.fetch_func = fetch_func
+        self.callback = callback
+        self.error_callback = error_callback
+        self.limiter = limiter or TokenBucketLimiter(1)
+        self.retries = retries
+        self.backoff = backoff or Backoff()
+        self.logger = logging.getLogger(logger_name)
+        self.max_queue_depth = 0
+        self._queue = Queue.Queue(max_queue)
+        self._stats = [WorkerStats() for _ in range(n_workers)]
+        self._workers = [threading.Thread(target=self._work, args=(i,), name="refetch_worker_%d" % i) for i in range(n_workers)]
+        for worker in self._workers:
+            worker.setDaemon(True)
+
+    def start(self):
+        for worker in self._workers:
+            worker.start()
+        return self
+
+    def submit(self, batch, fullnames):
+        '''
+        Queue a batch for re-fetching, blocking if the queue is full
+        :param batch: opaque batch object, passed back to the callbacks
+        :param fullnames: fullnames to re-fetch
+        '''
+        self._queue.put((batch, fullnames))
+        self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+
+    def join(self):
+        '''
+        Block until all the submitted batches are processed
+        '''
+        self._queue.join()
+
+    def stop(self):
+        '''
+        Let the workers exit once the submitted batches are processed
+        '''
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+
+    def stats(self):
+        '''
+        :returns: dict with the queue depth, its high-water mark, and per-worker statistics
+        '''
+        return {'queue_depth': self._queue.qsize(), 'max_queue_depth': self.max_queue_depth,
+                'rate': self.limiter.rate, 'remaining': self.limiter.remaining,
+                'workers': [s.as_dict() for s in self._stats]}
+
+    def _work(self, worker_id):
+        stats = self._stats[worker_id]
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    break
+                batch, fullnames = item
+                try:
+                    things = self._fetch(stats, batch, fullnames)
+                    if things is not None:
+                        self.callback(batch, things)
+                except Exception:
+                    # a failing callback loses its batch, not the worker
+                    stats.callback_errors += 1
+                    self.logger.exception("re-fetch callback failed, batch of %d fullnames dropped" % (len(fullnames),))
+            finally:
+                self._queue.task_done()
+
+    def _fetch(self, stats, batch, fullnames):
+        '''
+        Re-fetch a batch within the rate limit, retrying after 429s and, up to retries times, after errors
+
+        :returns: the re-fetched things, or None if the request failed
+        '''
+        failures = 0
+        while True:
+            stats.total_wait += self.limiter.acquire()
+            start_time = time.time()
+            try:
+                things, rate_limit = self.fetch_func(fullnames)
+            except RateLimited, e:
+                stats.errors += 1
+                self.limiter.block(e.reset_in)
+                continue
+            except Exception, e:
+                stats.errors += 1
+                # the errors of any worker make all of them wait longer
+                self.limiter.block(self.backoff.delay())
+                failures += 1
+                if failures <= self.retries:
+                    stats.retries += 1
+                    continue
+                if self.error_callback:
+                    self.error_callback(batch, e)
+                return None
+            finally:
+                latency = time.time() - start_time
+                stats.requests += 1
+                stats.fullnames += len(fullnames)
+                stats.total_latency += latency
+                stats.max_latency = max(stats.max_latency, latency)
+            self.backoff.reset()
+            if rate_limit:
+                self.limiter.update(*rate_limit)
+            return things
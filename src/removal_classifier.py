@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18/oct/2026
+
+Batch classifier of re-fetched comments into removed and not removed ones.
+
+The fields the removal rules look at are extracted from the whole re-fetched batch,
+one array per field, and every rule is evaluated over the whole array at once. Each
+rule sets a bit of the reason bitmask of the comments it matches: a comment is removed
+if its bitmask is non-zero, and the bitmask tells which rules matched (see reasons).
+
+Two columns do not come from the re-fetched comment: returned (whether Reddit sent the
+comment back at all), and flagged (whether the original comment had some of the removal
+check fields set, see pending_store.FLAGGED). New removal markers are added as rules
+(see RemovalClassifier.add_rule), over a comment field and a vectorized test.
+'''
+
+import numpy as np
+
+MAX_RULES = 32 # reason bitmasks are uint32
+
+def is_set(values):
+    '''
+    :returns: bool array, True for the values that are not empty, zero or None
+    '''
+    # truth-tests every object in C
+    return np.asarray(values, dtype=object).astype(bool)
+
+def is_missing(values):
+    '''
+    :returns: bool array, True for the values that are empty, zero or None
+    '''
+    return ~is_set(values)
+
+def contains(marker):
+    '''
+    :param marker: text to look for
+
+    :returns: test function, returning a bool array, True for the values containing marker
+    '''
+    def test(values):
+        # faster than numpy's string functions, for batches of API size
+        return np.array([isinstance(v, basestring) and marker in v for v in values], dtype=bool)
+    return test
+
+def author_name(author):
+    '''
+    :param author: author of a comment: PRAW Redditor instance, or its name
+
+    :returns: the author name, or None
+    '''
+    if isinstance(author, basestring):
+        return author
+    return getattr(author, "name", None)
+
+FIELD_GETTERS = {"author": author_name} # field -> function turning the field value into what the rules test
+DEFAULT_RULES = ( # (reason, field, test)
+    ("not_returned", "returned", is_missing),
+    ("flagged", "flagged", is_set),
+    ("author_missing", "author", is_missing),
+    ("author_deleted", "author", contains(u"[deleted]")),
+    ("author_removed", "author", contains(u"[removed]")),
+    ("body_missing", "body", is_missing),
+    ("body_deleted", "body", contains(u"[deleted]")),
+    ("body_removed", "body", contains(u"[removed]")),
+    ("banned_by", "banned_by", is_set),
+    ("mod_reports", "mod_reports", is_set),
+    ("user_reports", "user_reports", is_set),
+    ("num_reports", "num_reports", is_set),
+    ("removal_reason", "removal_reason", is_set),
+    ("report_reason", "report_reason", is_set),
+    )
+
+class RemovalClassifier(object):
+    '''
+    Vectorized removal rules, each setting a bit of the reason bitmask
+    '''
+    def __init__(self, rules=DEFAULT_RULES):
+        '''
+        :param rules: sequence of (reason, field, test) tuples, where test is a function
+            from an array of field values to a bool array. Rule i sets bit i
+        '''
+        self.rules = []
+        for reason, field, test in rules:
+            self.add_rule(reason, field, test)
+
+    def add_rule(self, reason, field, test):
+        '''
+        :param reason: rule name, as returned by reasons
+        :param field: comment field the rule tests (or returned, or flagged)
+        :param test: function from an array of field values to a bool array
+
+        :returns: the bit the rule sets
+        '''
+        if len(self.rules) == MAX_RULES:
+            raise ValueError("too many removal rules (max %d)" % (MAX_RULES,))
+        self.rules.append((reason, field, test))
+        return 1 << (len(self.rules) - 1)
+
+    def bit(self, reason):
+        '''
+        :returns: the bit set by a rule
+        '''
+        return 1 << [rule_reason for rule_reason, _, _ in self.rules].index(reason)
+
+    def columns(self, comments, flagged=None):
+        '''
+        Extract the fields the rules test
+        :param comments: list of re-fetched comments (PRAW Comment instances or dicts), None for the ones Reddit did not return
+        :param flagged: sequence of bools, whether the original comments had some removal check fields set. None for all False
+
+        :returns: dict of field -> object array
+        '''
+        names = sorted(set(field for _, field, _ in self.rules) - set(("returned", "flagged")))
+        # a single pass over the comments, one row of field values per comment
+        table = np.empty((len(comments), len(names)), dtype=object)
+        if len(comments):
+            table[:] = [[None] * len(names) if c is None else map((c if isinstance(c, dict) else c.__dict__).get, names)
+                        for c in comments]
+        columns = {"returned": np.array([c is not None for c in comments], dtype=bool),
+                   "flagged": np.array(flagged if flagged is not None else [False] * len(comments), dtype=bool)}
+        for i, field in enumerate(names):
+            columns[field] = table[:, i]
+            if field in FIELD_GETTERS:
+                columns[field] = np.array([FIELD_GETTERS[field](v) for v in columns[field]], dtype=object)
+        return columns
+
+    def classify(self, comments, flagged=None):
+        '''
+        :param comments: list of re-fetched comments (PRAW Comment instances or dicts), None for the ones Reddit did not return
+        :param flagged: sequence of bools, whether the original comments had some removal check fields set. None for all False
+
+        :returns: uint32 array of reason bitmasks, non-zero for the removed comments
+        '''
+        columns = self.columns(comments, flagged)
+        masks = np.zeros(len(comments), dtype=np.uint32)
+        for i, (_, field, test) in enumerate(self.rules):
+            matched = test(columns[field])
+            if field not in ("returned", "flagged"):
+                # comments Reddit did not return have no fields to test
+                matched &= columns["returned"]
+            masks |= matched.astype(np.uint32) << np.uint32(i)
+        return masks
+
+    def reasons(self, mask):
+        '''
+        :param mask: reason bitmask
+
+        :returns: list of the reasons of the rules that set the bitmask
+        '''
+        return [reason for i, (reason, _, _) in enumerate(self.rules) if int(mask) >> i & 1]
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18/oct/2026
+
+Delta format for removed comment log files (--removed_format delta).
+
+Most of a re-fetched removed comment repeats the original, which is in the main log
+already. A delta record only keeps the fullname, the bitmask of the removal rules the
+comment matched (removal_reasons), when it was re-fetched (refetched_utc), the other
+META_FIELDS reddeat adds (e.g. removal_horizon), and:
+- changed: the fields whose re-fetched value differs from the original one
+- dropped: the fields of the original that are empty in the re-fetched version
+Comments Reddit did not return at all have neither: there is nothing to compare. They
+are told apart from the comments that came back unchanged (e.g. removed as flagged) by
+the not_returned bit of removal_reasons (see removal_classifier).
+
+The original is looked up in the log file the comment was logged to: find_originals
+scans it for the removed fullnames, and only parses their lines. read_removed joins a
+removed comment log file back with its main log, through the indexed block archive if
+there is one (see block_archive), and yields the full (before, after) pairs.
+
+Usage: python removal_delta.py REMOVED_FILE [LOG_FILE_OR_ARCHIVE]
+'''
+
+import json
+import os
+import sys
+from compressed_log import open_log, codec_for_path, CODECS
+from block_archive import BlockArchive, ARCHIVE_SUFFIX
+from pending_store import scan_comment_line
+from removal_classifier import RemovalClassifier
+
+META_FIELDS = ("name", "removal_reasons", "removal_horizon", "refetched_utc") # fields of a removed comment that are not comment fields
+REMOVED_FILE_SUFFIX = ".removed" # as in reddeat
+NOT_RETURNED = RemovalClassifier().bit("not_returned") # removal_reasons bit of the comments Reddit did not return
+
+def make_delta(original, removed):
+    '''
+    :param original: original comment (dict), as stored in the main log, or None if unknown
+    :param removed: removed comment (dict), as stored in full format
+
+    :returns: the delta record (dict). If the original is unknown, the removed comment itself
+    '''
+    if original is None:
+        return removed
+    delta = dict((k, v) for k, v in removed.iteritems() if k in META_FIELDS)
+    if len(delta) == len(removed):
+        # not returned by Reddit: nothing to compare
+        return delta
+    changed = dict((k, v) for k, v in removed.iteritems() if k not in META_FIELDS and original.get(k) != v)
+    dropped = sorted(k for k in original if k not in removed and k not in META_FIELDS)
+    if changed:
+        delta["changed"] = changed
+    if dropped:
+        delta["dropped"] = dropped
+    return delta
+
+def is_delta(record):
+    '''
+    :returns: whether a removed comment record is a delta record (or a not returned comment)
+    '''
+    return all(k in META_FIELDS or k in ("changed", "dropped") for k in record)
+
+def apply_delta(original, record):
+    '''
+    :param original: original comment (dict), or None if unknown
+    :param record: removed comment record, in delta or full format
+
+    :returns: the re-fetched comment (dict), or None if Reddit did not return it
+    '''
+    if not is_delta(record):
+        return record
+    if record.get("removal_reasons", 0) & NOT_RETURNED:
+        return None
+    after = dict(original or {})
+    for k in record.get("dropped", ()):
+        after.pop(k, None)
+    after.update(record.get("changed", {}))
+    after.update((k, v) for k, v in record.iteritems() if k in META_FIELDS)
+    return after
+
+def find_originals(log_fpath, fullnames, codec=None):
+    '''
+    Look up comments in a log file, only parsing their lines
+    :param log_fpath: comment log file
+    :param fullnames: fullnames to look up
+    :param codec: codec name of the log file, if compressed. None to guess it from the extension
+
+    :returns: dict of fullname -> original comment (dict), for the fullnames found
+    '''
+    fullnames = set(fullnames)
+    originals = {}
+    if not fullnames:
+        return originals
+    with open_log(log_fpath, 'r', codec) as log_f:
+        for line in log_f:
+            if not line.strip():
+                continue
+            fullname, _, _ = scan_comment_line(line)
+            if fullname in fullnames:
+                originals[fullname] = json.loads(line)
+                if len(originals) == len(fullnames):
+                    break
+    return originals
+
+def main_log_fpath(removed_fpath, removed_fsuffix=REMOVED_FILE_SUFFIX):
+    '''
+    :param removed_fpath: removed comment log file, possibly compressed
+
+    :returns: path of the block archive of its main log file, if any, or else of the main log file, or None
+    '''
+    codec = codec_for_path(removed_fpath)
+    extension = codec.extension if codec else ""
+    base = removed_fpath[:len(removed_fpath)-len(extension)]
+    if base.endswith(removed_fsuffix):
+        base = base[:-len(removed_fsuffix)]
+    candidates = [base + ARCHIVE_SUFFIX + c.extension for c in CODECS.itervalues()] + \
+                 [base + extension, base] + [base + c.extension for c in CODECS.itervalues()]
+    for fpath in candidates:
+        if os.path.exists(fpath):
+            return fpath
+    return None
+
+def read_removed(removed_fpath, log_fpath=None, codec=None):
+    '''
+    Rebuild the (before, after) pairs of a removed comment log file, in delta or full format
+    :param removed_fpath: removed comment log file
+    :param log_fpath: its main log file, or the block archive of it. None to find it next to removed_fpath
+    :param codec: codec name of the removed comment log file, if compressed. None to guess it from the extension
+
+    :returns: iterator over (fullname, original comment or None, re-fetched comment or None, removed comment record)
+    '''
+    log_fpath = log_fpath or main_log_fpath(removed_fpath)
+    with open_log(removed_fpath, 'r', codec) as removed_f:
+        records = [json.loads(line) for line in removed_f if line.strip()]
+    if log_fpath is None:
+        originals = {}
+    elif ARCHIVE_SUFFIX in os.path.basename(log_fpath):
+        # random access by fullname, through the archive index
+        with BlockArchive(log_fpath) as archive:
+            originals = dict((record["name"], archive.get(record["name"])) for record in records)
+    else:
+        originals = find_originals(log_fpath, [record["name"] for record in records])
+    for record in records:
+        original = originals.get(record["name"])
+        yield record["name"], original, apply_delta(original, record), record
+
+def main():
+    if len(sys.argv) < 2:
+        sys.exit("usage: python removal_delta.py REMOVED_FILE [LOG_FILE_OR_ARCHIVE]")
+    for fullname, before, after, _ in read_removed(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None):
+        print json.dumps({"name": fullname, "before": before, "after": after})
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18/oct/2026
+
+Offline re-fetch of archived comment log files, for re-deriving the removed comments
+of a backlog of logs.
+
+The log files are fanned out over a pool of processes. Each worker decompresses its
+file as a stream, re-fetches the comments by fullname in batches, and checks them
+with reddeat's removal check. All workers draw from a single API budget, through a
+ProcessTokenBucketLimiter that follows Reddit's rate limit headers. Worker errors
+come back with their original traceback (see RemoteException.showError).
+
+The removed comments found in each log file are written to a part file; once all files
+are done, the parts are merged, in log file order, into a single removed comment file,
+keeping the first version of every comment. Log files whose part is already there
+are skipped, so an interrupted run can be restarted with the same arguments. The
+fullnames of the batches that failed are recorded next to the part: the next run only
+re-fetches those, until none fails.
+
+Usage: python reprocess.py [options] DIR_OR_GLOB [DIR_OR_GLOB ...]
+'''
+
+import glob
+import json
+import multiprocessing
+import os
+import sys
+from optparse import OptionParser
+import RemoteException
+from compressed_log import open_log, codec_for_path
+from block_archive import ARCHIVE_SUFFIX
+from fullnames import fullname_to_numeric
+from pending_store import scan_comment_line
+from refetch_pool import ProcessTokenBucketLimiter, Backoff
+
+REMOVED_FILE_SUFFIX = ".removed" # as in reddeat
+PART_SUFFIX = ".part" # suffix for the removed comments found in a single log file
+FAILED_SUFFIX = ".failed" # suffix for the fullnames of the batches that failed, appended to the part file path
+MAX_RETRIES = 3 # how many times a failed batch is re-fetched
+RETRY_DELAY = 10 # longest wait, in seconds, before re-fetching a failed batch (waits grow exponentially, with jitter)
+
+_limiter = None # ProcessTokenBucketLimiter, set in every worker by _init_worker
+
+def _init_worker(limiter):
+    global _limiter
+    _limiter = limiter
+
+def find_log_files(patterns, removed_fsuffix=REMOVED_FILE_SUFFIX):
+    '''
+    :param patterns: directories, or glob patterns
+    :param removed_fsuffix: removed comment log file suffix
+
+    :returns: sorted list of the archived comment log files (no removed comment log files), or of
+        their block archives, if there is no compressed copy of them
+    '''
+    fpaths, block_archives = set(), {}
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "*")
+        for fpath in glob.glob(pattern):
+            codec = codec_for_path(fpath)
+            if not (codec and os.path.isfile(fpath)):
+                continue
+            name = fpath[:-len(codec.extension)]
+            if name.endswith(ARCHIVE_SUFFIX):
+                block_archives[name[:-len(ARCHIVE_SUFFIX)]] = fpath
+            elif not name.endswith(removed_fsuffix):
+                fpaths.add(fpath)
+    names = set(fpath[:-len(codec_for_path(fpath).extension)] for fpath in fpaths)
+    fpaths.update(fpath for name, fpath in block_archives.iteritems() if name not in names)
+    return sorted(fpaths)
+
+def part_fpath(fpath, parts_dir):
+    return os.path.join(parts_dir, os.path.basename(fpath) + PART_SUFFIX)
+
+def _fetch_removed(reddeat, original_comments):
+    '''
+    Re-fetch a batch of comments through the shared limiter, retrying on errors
+
+    :returns: (list of (fullname, json) of the removed comments, requests issued), or (None, requests issued) if the batch failed
+    '''
+    backoff = Backoff(1., RETRY_DELAY)
+    for attempt in xrange(1, MAX_RETRIES + 1):
+        _limiter.acquire()
+        try:
+            refetched_comments, rate_limit = reddeat.fetch_info(list(original_comments))
+        except Exception, e:
+            sys.stderr.write("re-fetch failed (attempt %d/%d): %s\n" % (attempt, MAX_RETRIES, e))
+            backoff.wait()
+            continue
+        if rate_limit:
+            _limiter.update(*rate_limit)
+        return reddeat.find_removed_comments(original_comments, refetched_comments), attempt
+    return None, MAX_RETRIES
+
+@RemoteException.showError
+def reprocess_log_file(fpath, parts_dir, batch_size=100):
+    '''
+    Re-fetch the comments of an archived log file, and write the removed ones to its part file.
+    If the part file is there, only the comments of the batches that failed are re-fetched, if any
+    :param fpath: archived comment log file
+    :param parts_dir: folder for the part files
+    :param batch_size: how many comment fullnames to fetch per Reddit API call
+
+    :returns: dict with the log file path, and counters of comments, removed comments, requests and failed batches
+    '''
+    # imported here, so that every worker process has its own Reddit client
+    import reddeat
+    stats = {"fpath": fpath, "comments": 0, "removed": 0, "requests": 0, "failed_batches": 0}
+    dest_fpath = part_fpath(fpath, parts_dir)
+    failed_fpath = dest_fpath + FAILED_SUFFIX
+    retry = os.path.exists(dest_fpath)
+    if retry and not os.path.exists(failed_fpath):
+        stats["skipped"] = True
+        return stats
+    stats["retried"] = retry
+    retry_fullnames = read_fullnames(failed_fpath) if retry else None
+    failed = []
+    with open_log(fpath, 'r') as log_f:
+        # the removed comments of the failed batches are added to the part
+        with open_log(dest_fpath if retry else dest_fpath + ".tmp", 'a' if retry else 'w') as part_f:
+            original_comments = {}
+            for line in log_f:
+                if line.strip():
+                    # the removal check needs the fullname, and whether removal check fields are set
+                    fullname, _, flagged = scan_comment_line(line, reddeat.REMOVAL_CHECK_FIELDS)
+                    if retry_fullnames is None or fullname in retry_fullnames:
+                        original_comments[fullname] = flagged
+                if len(original_comments) < batch_size:
+                    continue
+                _reprocess_batch(reddeat, original_comments, part_f, stats, failed)
+                original_comments = {}
+            if original_comments:
+                _reprocess_batch(reddeat, original_comments, part_f, stats, failed)
+    # the failed fullnames are recorded before the part is: a part is never there without them
+    if failed:
+        write_fullnames(failed_fpath, failed)
+    elif os.path.exists(failed_fpath):
+        os.remove(failed_fpath)
+    if not retry:
+        os.rename(dest_fpath + ".tmp", dest_fpath)
+    return stats
+
+def read_fullnames(fpath):
+    '''
+    :returns: set of the fullnames in a file, one per line
+    '''
+    with open(fpath, 'r') as f:
+        return set(line.strip() for line in f if line.strip())
+
+def write_fullnames(fpath, fullnames):
+    '''
+    Atomically replace a file with fullnames, one per line
+    '''
+    with open(fpath + ".tmp", 'w') as f:
+        for fullname in fullnames:
+            f.write(fullname + "\n")
+    os.rename(fpath + ".tmp", fpath)
+
+def _reprocess_batch(reddeat, original_comments, part_f, stats, failed):
+    removed_comments, requests = _fetch_removed(reddeat, original_comments)
+    stats["comments"] += len(original_comments)
+    stats["requests"] += requests
+    if removed_comments is None:
+        stats["failed_batches"] += 1
+        failed.extend(original_comments)
+        return
+    stats["removed"] += len(removed_comments)
+    for _, removed_comment in removed_comments:
+        part_f.write(removed_comment + u"\n")
+
+def merge_parts(part_fpaths, dest_fpath):
+    '''
+    Merge part files into a single removed comment file, keeping the first version of every comment
+    :param part_fpaths: part files, in the order of their log files
+    :param dest_fpath: merged file. Compressed according to its extension
+
+    :returns: (comments written, duplicates dropped)
+    '''
+    seen = set()
+    n_written, n_duplicates = 0, 0
+    with open_log(dest_fpath, 'w') as dest_f:
+        for fpath in part_fpaths:
+            with open_log(fpath, 'r') as part_f:
+                for line in part_f:
+                    if not line.strip():
+                        continue
+                    numeric_id = fullname_to_numeric(json.loads(line)["name"])
+                    if numeric_id in seen:
+                        n_duplicates += 1
+                        continue
+                    seen.add(numeric_id)
+                    dest_f.write(line)
+                    n_written += 1
+    return n_written, n_duplicates
+
+def reprocess(fpaths, dest_fpath, n_workers=None, batch_size=100, api_interval=1.):
+    '''
+    Re-fetch archived comment log files over a pool of processes, and merge the removed comments
+    :param fpaths: archived comment log files
+    :param dest_fpath: merged removed comment file
+    :param n_workers: how many processes. None for one per CPU
+    :param batch_size: how many comment fullnames to fetch per Reddit API call
+    :param api_interval: time between two requests, in seconds, until Reddit reports its rate limit
+
+    :returns: list of the stats returned by reprocess_log_file, for the files that did not fail
+    '''
+    parts_dir = dest_fpath + ".parts"
+    if not os.path.isdir(parts_dir):
+        os.makedirs(parts_dir)
+    limiter = ProcessTokenBucketLimiter(1. / api_interval)
+    pool = multiprocessing.Pool(n_workers, initializer=_init_worker, initargs=(limiter,))
+    results = [(fpath, pool.apply_async(reprocess_log_file, (fpath, parts_dir, batch_size))) for fpath in fpaths]
+    pool.close()
+    all_stats = []
+    for fpath, result in results:
+        try:
+            stats = result.get()
+        except Exception, e:
+            # the remote traceback is part of the message
+            sys.stderr.write("cannot reprocess %s: %s\n" % (fpath, e))
+            continue
+        all_stats.append(stats)
+        print "%s: %d comments, %d removed, %d requests, %d failed batches%s" % (
+            fpath, stats["comments"], stats["removed"], stats["requests"], stats["failed_batches"],
+            " (done already)" if stats.get("skipped") else " (failed batches retried)" if stats.get("retried") else "")
+    pool.join()
+    done_fpaths = set(stats["fpath"] for stats in all_stats)
+    n_written, n_duplicates = merge_parts([part_fpath(fpath, parts_dir) for fpath in fpaths if fpath in done_fpaths], dest_fpath)
+    print "%d removed comments written to %s (%d duplicates dropped)" % (n_written, dest_fpath, n_duplicates)
+    return all_stats
+
+def main():
+    parser = OptionParser(usage="%prog [options] DIR_OR_GLOB [DIR_OR_GLOB ...]")
+    parser.add_option("-o", "--output", action="store", type="string", dest="output", default="reprocessed"+REMOVED_FILE_SUFFIX+".bz2", help="merged removed comment file. Compressed according to its extension")
+    parser.add_option("-w", "--workers", action="store", type="int", dest="workers", default=None, help="how many processes. Defaults to one per CPU")
+    parser.add_option("-b", "--batch_size", action="store", type="int", dest="batch_size", default=100, help="how many comment fullnames to ask Reddit at a time. should be <=100 to comply with API limits")
+    parser.add_option("-a", "--api_interval", action="store", type="float", dest="api_interval", default=1., help="time between two requests, in seconds, until Reddit reports its rate limit")
+    (options, args) = parser.parse_args()
+    if not args:
+        parser.error("no log files")
+    fpaths = find_log_files(args)
+    print "reprocessing %d log files" % (len(fpaths),)
+    reprocess(fpaths, options.output, options.workers, options.batch_size, options.api_interval)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18/oct/2026
+
+Memory-bounded set of comment ids, for dropping the comments logged twice: re-emitted
+by the stream after a restart, or by its warm-up, or logged by two ingest paths.
+
+Comment ids are serial integers, and the ids seen are dense, so the set is a bitmap,
+split in chunks of 2**16 ids, as the bitmap containers of a roaring bitmap: a chunk
+takes 8KB, and covers about half an hour of Reddit's comments. Only the max_chunks
+highest chunks are kept: older chunks are dropped, and ids below them are reported as
+new, and not stored. The set is snapshotted to a single numpy file (keys, and chunks
+as one uint8 array), which loads in milliseconds; sets of several shards can be merged
+with update.
+'''
+
+import os
+import threading
+import numpy as np
+
+CHUNK_BITS = 16 # ids per chunk, as a power of 2
+CHUNK_BYTES = (1 << CHUNK_BITS) // 8
+MAX_CHUNKS = 1024 # chunks kept by default: 8MB, about 3 weeks of comments at 30 comments/s
+SNAPSHOT_SUFFIX = ".seen" # suffix for the snapshot file, appended to the log file path
+
+class SeenSet(object):
+    '''
+    Thread-safe chunked bitmap of integer ids, keeping the max_chunks highest chunks
+    '''
+    def __init__(self, max_chunks=MAX_CHUNKS):
+        '''
+        :param max_chunks: how many chunks of 2**CHUNK_BITS ids to keep
+        '''
+        self.max_chunks = max_chunks
+        self.floor = 0 # chunks below this key were dropped
+        self.n_added, self.n_seen, self.n_too_old = 0, 0, 0
+        self._chunks = {} # chunk key -> bytearray bitmap
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock() # snapshots of concurrent callers share the temporary file
+
+    def __len__(self):
+        return len(self._chunks)
+
+    def __contains__(self, numeric_id):
+        key, offset = numeric_id >> CHUNK_BITS, numeric_id & ((1 << CHUNK_BITS) - 1)
+        chunk = self._chunks.get(key)
+        return chunk is not None and bool(chunk[offset >> 3] & (1 << (offset & 7)))
+
+    def add(self, numeric_id):
+        '''
+        :param numeric_id: id, as an integer
+
+        :returns: True if the id was not in the set (or is below the chunks kept), False if it was
+        '''
+        key, offset = numeric_id >> CHUNK_BITS, numeric_id & ((1 << CHUNK_BITS) - 1)
+        byte, bit = offset >> 3, 1 << (offset & 7)
+        with self._lock:
+            chunk = self._chunks.get(key)
+            if chunk is None:
+                if key < self.floor:
+                    self.n_too_old += 1
+                    return True
+                chunk = self._chunks[key] = bytearray(CHUNK_BYTES)
+                self._evict()
+            elif chunk[byte] & bit:
+                self.n_seen += 1
+                return False
+            chunk[byte] |= bit
+            self.n_added += 1
+            return True
+
+    def _evict(self):
+        while len(self._chunks) > self.max_chunks:
+            key = min(self._chunks)
+            del self._chunks[key]
+            self.floor = max(self.floor, key + 1)
+
+    def update(self, other):
+        '''
+        Add all the ids of another SeenSet, e.g. the snapshot of another shard
+        '''
+        with self._lock:
+            for key, chunk in other._chunks.items():
+                if key < self.floor:
+                    continue
+                if key in self._chunks:
+                    self._chunks[key] = bytearray(np.bitwise_or(np.frombuffer(self._chunks[key], dtype=np.uint8),
+                                                                np.frombuffer(chunk, dtype=np.uint8)).tobytes())
+                else:
+                    self._chunks[key] = bytearray(chunk)
+            self._evict()
+
+    def save(self, fpath):
+        '''
+        Snapshot the set to file, atomically
+        :param fpath: snapshot file path
+        '''
+        with self._lock:
+            keys = np.array(sorted(self._chunks), dtype=np.int64)
+            chunks = np.frombuffer("".join(str(self._chunks[key]) for key in keys), dtype=np.uint8)
+            floor = self.floor
+        tmp_fpath = fpath + ".tmp"
+        with self._save_lock:
+            with open(tmp_fpath, 'wb') as f:
+                np.savez(f, keys=keys, chunks=chunks.reshape(len(keys), CHUNK_BYTES), floor=floor)
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(tmp_fpath, fpath)
+
+    @classmethod
+    def load(cls, fpath, max_chunks=MAX_CHUNKS):
+        '''
+        :param fpath: snapshot file path
+        :param max_chunks: how many chunks to keep
+
+        :returns: the SeenSet saved to fpath, or an empty one if there is no snapshot
+        '''
+        seen = cls(max_chunks)
+        if not os.path.exists(fpath):
+            return seen
+        with open(fpath, 'rb') as f:
+            snapshot = np.load(f)
+            seen.floor = int(snapshot["floor"])
+            seen._chunks = dict((int(key), bytearray(chunk.tobytes())) for key, chunk in zip(snapshot["keys"], snapshot["chunks"]))
+        seen._evict()
+        return seen
+
+    def stats(self):
+        '''
+        :returns: dict with the ids added, the ids found already in the set, the ids too old to
+            tell, and the chunks kept, with the range of ids they cover
+        '''
+        with self._lock:
+            keys = sorted(self._chunks)
+        return {'added': self.n_added, 'seen': self.n_seen, 'too_old': self.n_too_old, 'chunks': len(keys),
+                'min_id': keys[0] << CHUNK_BITS if keys else None, 'max_id': (keys[-1] + 1) << CHUNK_BITS if keys else None}
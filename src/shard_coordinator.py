@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18/oct/2026
+
+Sharded ingest: runs one reddeat process per set of API credentials, each ingesting a
+partition of the comments into its own log files, so that ingest is bounded by the
+sum of the rate limits of the credentials, instead of a single one.
+
+Every shard gets its own praw.ini section (--site_name), its own log and error log
+names (LOG_NAME_SHARD), and one partition:
+- stripes: the comment id space is dealt to the shards in blocks of --batch_size ids,
+  each shard polling its own blocks through the info endpoint (--id_stripe)
+- subreddits: each shard streams a group of subreddits (--subreddits)
+Shards share nothing but the log folder, and the coordinator only starts them, and
+restarts the ones that exit, until it is interrupted. Shards spread over several hosts
+by running a coordinator on each, with the same --shards and distinct --first_shard.
+
+merge_shards.py merges the rotated log files of all the shards into a single,
+deduplicated, time-ordered log.
+
+Usage: python shard_coordinator.py [options] SITE_NAME [SITE_NAME ...] [-- reddeat options]
+'''
+
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+from optparse import OptionParser
+
+PARTITIONS = ("stripes", "subreddits")
+RESTART_DELAY = 10 # seconds to wait before restarting a shard that exited
+CHECK_INTERVAL = 1 # seconds between two checks of the shard processes
+
+def shard_args(shard, shards, site_name, partition, log_name="reddeat", subreddit_groups=None):
+    '''
+    :param shard: shard index, between 0 and shards-1
+    :param shards: number of shards, over all hosts
+    :param site_name: praw.ini section of the shard
+    :param partition: stripes or subreddits
+    :param log_name: log file name, suffixed with the shard index
+    :param subreddit_groups: list of subreddit groups (joined by +), one per shard, for the subreddits partition
+
+    :returns: reddeat command line arguments of the shard
+    '''
+    args = ["--site_name", site_name, "--log_name", "%s_%d" % (log_name, shard),
+            "--error_log_name", "%s_%d_error" % (log_name, shard)]
+    if partition == "stripes":
+        args += ["--ingest_engine", "poll", "--id_stripe", "%d/%d" % (shard, shards)]
+    else:
+        args += ["--ingest_engine", "stream", "--subreddits", subreddit_groups[shard]]
+    return args
+
+class ShardCoordinator(object):
+    '''
+    Starts the shard processes, and restarts the ones that exit
+    '''
+    def __init__(self, commands, restart_delay=RESTART_DELAY, logger_name="shard_coordinator"):
+        '''
+        :param commands: dict of shard index -> command line of the shard process
+        :param restart_delay: seconds to wait before restarting a shard that exited
+        :param logger_name: logger for the shard starts and exits
+        '''
+        self.commands = commands
+        self.restart_delay = restart_delay
+        self.logger = logging.getLogger(logger_name)
+        self.processes = {} # shard index -> Popen
+        self.restarts = dict((shard, 0) for shard in commands)
+        self._exited_at = {} # shard index -> when it exited
+        self._stopped = False
+
+    def _start(self, shard):
+        self.logger.info("starting shard %d: %s" % (shard, " ".join(self.commands[shard])))
+        self.processes[shard] = subprocess.Popen(self.commands[shard])
+
+    def check(self, now=None):
+        '''
+        Start the shards that are not running, and whose restart delay is over
+        '''
+        now = time.time() if now is None else now
+        for shard in sorted(self.commands):
+            process = self.processes.get(shard)
+            if process is not None and process.poll() is None:
+                continue
+            if process is not None:
+                self.logger.error("shard %d exited with code %s" % (shard, process.returncode))
+                del self.processes[shard]
+                self._exited_at[shard] = now
+            if now - self._exited_at.get(shard, 0) >= self.restart_delay:
+                if shard in self._exited_at:
+                    self.restarts[shard] += 1
+                self._start(shard)
+
+    def run(self, check_interval=CHECK_INTERVAL):
+        '''
+        Run the shards until stop is called
+        '''
+        while not self._stopped:
+            self.check()
+            time.sleep(check_interval)
+
+    def stop(self, *args):
+        '''
+        Stop restarting shards, and ask the running ones to stop (their queued comments get written out)
+        '''
+        self._stopped = True
+        for process in self.processes.values():
+            if process.poll() is None:
+                # reddeat stops on KeyboardInterrupt
+                process.send_signal(signal.SIGINT)
+        for process in self.processes.values():
+            process.wait()
+
+def main():
+    parser = OptionParser(usage="%prog [options] SITE_NAME [SITE_NAME ...] [-- reddeat options]")
+    parser.add_option("-p", "--partition", action="store", type="choice", choices=PARTITIONS, dest="partition", default="stripes", help="how to split the comments: stripes of comment ids (poll ingest engine), or subreddit groups (stream ingest engine)")
+    parser.add_option("-g", "--subreddit_groups", action="store", type="string", dest="subreddit_groups", default=None, help="comma-separated subreddit groups, one per shard over all hosts, e.g. AskReddit+funny,pics+aww")
+    parser.add_option("--shards", action="store", type="int", dest="shards", default=None, help="number of shards over all hosts. Defaults to the number of SITE_NAMEs")
+    parser.add_option("--first_shard", action="store", type="int", dest="first_shard", default=0, help="index of the shard of the first SITE_NAME, for running shards on several hosts")
+    parser.add_option("-n", "--log_name", action="store", type="string", dest="log_name", default="reddeat", help="log file name, suffixed with the shard index")
+    argv = sys.argv[1:]
+    reddeat_args = argv[argv.index("--") + 1:] if "--" in argv else []
+    (options, site_names) = parser.parse_args(argv[:argv.index("--")] if "--" in argv else argv)
+    if not site_names:
+        parser.error("no praw.ini sections")
+    shards = options.shards or len(site_names)
+    if options.first_shard + len(site_names) > shards:
+        parser.error("more shards than --shards")
+    subreddit_groups = None
+    if options.partition == "subreddits":
+        subreddit_groups = (options.subreddit_groups or "").split(",")
+        if len(subreddit_groups) != shards:
+            parser.error("--subreddit_groups needs one group per shard")
+    reddeat_fpath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reddeat.py")
+    commands = dict((shard, [sys.executable, reddeat_fpath] + reddeat_args +
+                     shard_args(shard, shards, site_name, options.partition, options.log_name, subreddit_groups))
+                    for shard, site_name in enumerate(site_names, options.first_shard))
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    coordinator = ShardCoordinator(commands)
+    signal.signal(signal.SIGTERM, lambda *args: coordinator.stop())
+    try:
+        coordinator.run()
+    except KeyboardInterrupt:
+        coordinator.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,430 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18/oct/2026
+
+Storage lifecycle of the archived comment logs, in three tiers:
+- hot: the rotated log files, as archived by reddeat once re-fetched, in the log
+  folder: one file per rotation interval, compressed with a fast codec (--compression,
+  or gzip when archiving), and indexed if --block_archive is set
+- warm: one file per day, in LOG_FOLDER/warm: the hot files of the day merged into a
+  block archive (see block_archive) with a high-ratio codec, so still indexed by
+  fullname, time range and subreddit, and their removed comment files concatenated
+- cold: one file per month, in LOG_FOLDER/cold: the warm files of the month merged
+  into a single file with the highest-ratio codec available, with a columnar version
+  (see columnar) for analytics
+
+The compactor moves a day to the warm tier once all its hot files are archived and
+the day ended more than hot_days ago, and a month to the cold tier once it ended more
+than warm_days ago, and has no hot days left. Merging minute-level rotations cuts the
+file count by ~1440 per day. Comments logged twice in a day (e.g. re-emitted by the
+stream after a restart) are kept once.
+
+Every merge is written to temporary files first, then committed through a manifest
+listing the renames and the source files to remove: if the compactor is interrupted,
+the next run completes the committed merge, or starts the uncommitted one over.
+
+The compactor runs in its own process, at the lowest CPU priority, and keeps under a
+budget of uncompressed bytes per second and of CPU time share, sleeping between chunks
+of work.
+
+Usage: python storage_tiers.py [options] LOG_PATH (the log folder, followed by the log name, e.g. log/reddeat)
+'''
+
+import json
+import logging
+import multiprocessing
+import os
+import re
+import time
+from calendar import timegm
+from optparse import OptionParser
+import numpy as np
+from block_archive import write_archive, ARCHIVE_SUFFIX, INDEX_SUFFIX
+from columnar import read_columns, load_columns, COLUMNS_SUFFIX
+from compressed_log import open_log, codec_for_path, get_codec, CODECS
+from fullnames import fullname_to_numeric
+from pending_store import scan_comment_line
+from seen_set import SeenSet
+
+DAY = 24 * 60 * 60
+HOT_DAYS = 2 # days a day stays in the hot tier, after it ended
+WARM_DAYS = 30 # days a month stays in the warm tier, after it ended
+WARM_CODEC = "bz2" # codec of the warm tier
+COLD_CODEC = "xz" if "xz" in CODECS else "bz2" # codec of the cold tier
+IO_RATE = 10 * 1024 * 1024 # uncompressed bytes per second the compactor reads, at most
+CPU_SHARE = .25 # share of a CPU the compactor uses, at most
+COMPACTION_INTERVAL = 60 * 60 # seconds between two compactions
+REMOVED_FILE_SUFFIX = ".removed" # as in reddeat
+MANIFEST_SUFFIX = ".compaction" # suffix for the manifest of the merge being committed, appended to the log file path
+TMP_SUFFIX = ".tmp"
+ROTATED_NAME = re.compile(r"^(\d{4}-\d{2}-\d{2})(?:_\d{2}(?:-\d{2}){0,2})?(.*)$") # rotation suffix, and what follows
+
+def _cpu_time():
+    user_time, system_time = os.times()[:2]
+    return user_time + system_time
+
+class Budget(object):
+    '''
+    Keeps a process under a rate of bytes processed and a share of CPU time, by sleeping between chunks of work
+    '''
+    def __init__(self, io_rate=IO_RATE, cpu_share=CPU_SHARE, clock=time.time, cpu_clock=_cpu_time, sleep=time.sleep):
+        '''
+        :param io_rate: bytes per second, at most. None for no limit
+        :param cpu_share: CPU seconds per second, at most. None for no limit
+        :param clock: clock function
+        :param cpu_clock: function returning the CPU time of the process
+        :param sleep: sleep function
+        '''
+        self.io_rate = io_rate
+        self.cpu_share = cpu_share
+        self._clock, self._cpu_clock, self._sleep = clock, cpu_clock, sleep
+        self.reset()
+
+    def reset(self):
+        '''
+        Start a new run of work: the idle time before it is not spent on it
+        '''
+        self.n_bytes, self.slept = 0, 0.
+        self._start, self._cpu_start = self._clock(), self._cpu_clock()
+
+    def charge(self, n_bytes):
+        '''
+        Record a chunk of work, and sleep until the work done so far fits the budget
+        :param n_bytes: bytes processed by the chunk
+        '''
+        self.n_bytes += n_bytes
+        # how long the work done so far should have taken, at least
+        needed = max(float(self.n_bytes) / self.io_rate if self.io_rate else 0,
+                     (self._cpu_clock() - self._cpu_start) / self.cpu_share if self.cpu_share else 0)
+        elapsed = self._clock() - self._start
+        if needed > elapsed:
+            self._sleep(needed - elapsed)
+            self.slept += needed - elapsed
+
+def throttled(lines, budget, chunk_size=1024*1024):
+    '''
+    :returns: iterator over lines, charging budget every chunk_size bytes
+    '''
+    n_bytes = 0
+    for line in lines:
+        n_bytes += len(line)
+        if n_bytes >= chunk_size:
+            budget.charge(n_bytes)
+            n_bytes = 0
+        yield line
+    budget.charge(n_bytes)
+
+def _day_start(day):
+    return timegm(time.strptime(day, "%Y-%m-%d"))
+
+def _month_end(month):
+    year, month = int(month[:4]), int(month[5:7])
+    return timegm((year + month // 12, month % 12 + 1, 1, 0, 0, 0))
+
+class TieredStorage(object):
+    '''
+    The tiers of the archived logs of a log file path, and their compaction
+    '''
+    def __init__(self, log_path, hot_days=HOT_DAYS, warm_days=WARM_DAYS, warm_codec=WARM_CODEC, cold_codec=COLD_CODEC,
+                 columnar=True, budget=None, removed_fsuffix=REMOVED_FILE_SUFFIX, logger_name="storage_tiers"):
+        '''
+        :param log_path: comment log file path, as given to the log handler
+        :param hot_days: days a day stays in the hot tier, after it ended
+        :param warm_days: days a month stays in the warm tier, after it ended
+        :param warm_codec: codec name of the warm tier
+        :param cold_codec: codec name of the cold tier
+        :param columnar: whether to build the columnar version of the cold files
+        :param budget: Budget of the compaction. None for no limit
+        :param removed_fsuffix: removed comment log file suffix
+        :param logger_name: logger for the merges
+        '''
+        self.folder, self.name = os.path.split(os.path.abspath(log_path))
+        self.warm_folder, self.cold_folder = os.path.join(self.folder, "warm"), os.path.join(self.folder, "cold")
+        self.hot_days, self.warm_days = hot_days, warm_days
+        self.warm_codec, self.cold_codec = get_codec(warm_codec), get_codec(cold_codec)
+        self.columnar = columnar
+        self.budget = budget or Budget(None, None)
+        self.removed_fsuffix = removed_fsuffix
+        self.manifest_fpath = os.path.join(self.folder, self.name + MANIFEST_SUFFIX)
+        self.logger = logging.getLogger(logger_name)
+
+    def hot_files(self):
+        '''
+        :returns: dict of day (%Y-%m-%d) -> dict with the archived comment log files, or their
+            block archives ("logs"), removed comment log files ("removed"), block archive indexes
+            ("indexes") of the day, and the files not archived yet ("unfinished"), each in rotation order
+        '''
+        days = {}
+        prefix = self.name + "."
+        for fname in sorted(os.listdir(self.folder)):
+            match = ROTATED_NAME.match(fname[len(prefix):]) if fname.startswith(prefix) else None
+            fpath = os.path.join(self.folder, fname)
+            if not match or not os.path.isfile(fpath):
+                continue
+            day, tail = match.groups()
+            codec = codec_for_path(fname)
+            files = days.setdefault(day, {"logs": [], "removed": [], "indexes": [], "unfinished": []})
+            if tail.startswith(ARCHIVE_SUFFIX):
+                # block archives are read as log files, concatenated frames
+                files["logs" if codec and tail == ARCHIVE_SUFFIX + codec.extension else "indexes"].append(fpath)
+            elif codec and tail == codec.extension:
+                files["logs"].append(fpath)
+            elif codec and tail == self.removed_fsuffix + codec.extension:
+                files["removed"].append(fpath)
+            else:
+                files["unfinished"].append(fpath)
+        return days
+
+    def warm_fpaths(self, day):
+        '''
+        :returns: (block archive path, index path, removed comment log file path) of a warm day
+        '''
+        archive_fpath = os.path.join(self.warm_folder, "%s.%s%s%s" % (self.name, day, ARCHIVE_SUFFIX, self.warm_codec.extension))
+        return archive_fpath, archive_fpath + INDEX_SUFFIX, os.path.join(self.warm_folder, "%s.%s%s%s" % (
+            self.name, day, self.removed_fsuffix, self.warm_codec.extension))
+
+    def cold_fpaths(self, month):
+        '''
+        :returns: (comment log file path, removed comment log file path) of a cold month
+        '''
+        return tuple(os.path.join(self.cold_folder, "%s.%s%s%s" % (self.name, month, suffix, self.cold_codec.extension))
+                     for suffix in ("", self.removed_fsuffix))
+
+    def warm_days_of(self):
+        '''
+        :returns: dict of month (%Y-%m) -> sorted list of its warm days
+        '''
+        months = {}
+        if os.path.isdir(self.warm_folder):
+            prefix = self.name + "."
+            for fname in os.listdir(self.warm_folder):
+                match = ROTATED_NAME.match(fname[len(prefix):]) if fname.startswith(prefix) else None
+                if match:
+                    months.setdefault(match.group(1)[:7], set()).add(match.group(1))
+        return dict((month, sorted(days)) for month, days in months.iteritems())
+
+    def compact(self, now=None):
+        '''
+        Complete an interrupted merge, then move the days and months due to the next tier
+
+        :returns: (days moved to the warm tier, months moved to the cold tier)
+        '''
+        now = time.time() if now is None else now
+        self.budget.reset()
+        self.recover()
+        n_days, n_months = 0, 0
+        hot_files = self.hot_files()
+        for day, files in sorted(hot_files.iteritems()):
+            if files["unfinished"] or _day_start(day) + DAY + self.hot_days * DAY > now:
+                continue
+            self.merge_day(day, files)
+            n_days += 1
+        hot_months = set(day[:7] for day in self.hot_files())
+        for month, days in sorted(self.warm_days_of().iteritems()):
+            if month in hot_months or _month_end(month) + self.warm_days * DAY > now:
+                continue
+            self.merge_month(month, days)
+            n_months += 1
+        return n_days, n_months
+
+    def _comment_lines(self, fpaths):
+        '''
+        :returns: iterator over the comment lines of files, keeping the first line of each comment
+        '''
+        seen = SeenSet(max_chunks=1 << 16)
+        for fpath in fpaths:
+            with open_log(fpath, 'r') as log_f:
+                for line in log_f:
+                    if line.strip() and seen.add(fullname_to_numeric(scan_comment_line(line)[0])):
+                        yield line
+
+    def _lines(self, fpaths):
+        for fpath in fpaths:
+            with open_log(fpath, 'r') as log_f:
+                for line in log_f:
+                    yield line
+
+    def _write(self, fpath, codec, lines):
+        with open_log(fpath, 'w', codec) as out_f:
+            for line in lines:
+                out_f.write(line)
+
+    def merge_day(self, day, files):
+        '''
+        Merge the hot files of a day (and the warm files of the day, if any) into its warm files
+        :param day: %Y-%m-%d
+        :param files: dict of hot files of the day, as returned by hot_files
+        '''
+        if not os.path.isdir(self.warm_folder):
+            os.makedirs(self.warm_folder)
+        archive_fpath, index_fpath, removed_fpath = self.warm_fpaths(day)
+        renames = []
+        if files["logs"]:
+            sources = ([archive_fpath] if os.path.exists(archive_fpath) else []) + files["logs"]
+            n_comments = write_archive(throttled(self._comment_lines(sources), self.budget), archive_fpath + TMP_SUFFIX,
+                                       index_fpath + TMP_SUFFIX, self.warm_codec.name)
+            # the index goes first: an archive is only found through its index
+            renames += [(index_fpath + TMP_SUFFIX, index_fpath), (archive_fpath + TMP_SUFFIX, archive_fpath)]
+            self.logger.info("%s: %d hot log files merged, %d comments" % (day, len(files["logs"]), n_comments))
+        if files["removed"]:
+            sources = ([removed_fpath] if os.path.exists(removed_fpath) else []) + files["removed"]
+            self._write(removed_fpath + TMP_SUFFIX, self.warm_codec, throttled(self._lines(sources), self.budget))
+            renames.append((removed_fpath + TMP_SUFFIX, removed_fpath))
+        self.commit(renames, files["logs"] + files["removed"] + files["indexes"])
+
+    def merge_month(self, month, days):
+        '''
+        Merge the warm files of a month (and the cold files of the month, if any) into its cold files
+        :param month: %Y-%m
+        :param days: warm days of the month
+        '''
+        if not os.path.isdir(self.cold_folder):
+            os.makedirs(self.cold_folder)
+        renames, sources = [], []
+        warm_fpaths = [self.warm_fpaths(day) for day in days]
+        for cold_fpath, fpaths in zip(self.cold_fpaths(month), ([fpath for fpath, _, _ in warm_fpaths],
+                                                                [fpath for _, _, fpath in warm_fpaths])):
+            fpaths = [fpath for fpath in fpaths if os.path.exists(fpath)]
+            if not fpaths:
+                continue
+            inputs = ([cold_fpath] if os.path.exists(cold_fpath) else []) + fpaths
+            self._write(cold_fpath + TMP_SUFFIX, self.cold_codec, throttled(self._lines(inputs), self.budget))
+            renames.append((cold_fpath + TMP_SUFFIX, cold_fpath))
+            if self.columnar:
+                renames += self._merge_columns(cold_fpath, inputs)
+            sources += fpaths
+        sources += [index_fpath for _, index_fpath, _ in warm_fpaths if os.path.exists(index_fpath)]
+        self.logger.info("%s: %d warm days merged" % (month, len(days)))
+        self.commit(renames, sources)
+
+    def _merge_columns(self, cold_fpath, inputs):
+        '''
+        Build the columnar version of a cold file from the columns of its inputs, one input at a time
+
+        :returns: renames committing it
+        '''
+        columns_fpath = cold_fpath[:-len(self.cold_codec.extension)] + COLUMNS_SUFFIX
+        part_fpaths = []
+        for i, fpath in enumerate(inputs):
+            part_fpath = "%s.%d%s" % (columns_fpath, i, TMP_SUFFIX)
+            if i == 0 and fpath == cold_fpath and os.path.exists(columns_fpath):
+                # the cold file being extended: its columns are already there
+                part_fpath = columns_fpath
+            else:
+                columns = read_columns(fpath, removed_fsuffix=self.removed_fsuffix,
+                                       throttle=lambda lines: throttled(lines, self.budget))
+                with open(part_fpath, 'wb') as f:
+                    np.savez(f, **columns)
+            part_fpaths.append(part_fpath)
+        with open(columns_fpath + TMP_SUFFIX, 'wb') as f:
+            np.savez_compressed(f, **load_columns(part_fpaths))
+        for part_fpath in part_fpaths:
+            if part_fpath != columns_fpath:
+                os.remove(part_fpath)
+        return [(columns_fpath + TMP_SUFFIX, columns_fpath)]
+
+    def commit(self, renames, sources):
+        '''
+        Record a merge in the manifest, then move its temporary files in place, and remove its sources
+        :param renames: list of (temporary file, final file)
+        :param sources: files to remove
+        '''
+        with open(self.manifest_fpath + TMP_SUFFIX, 'wb') as f:
+            json.dump({"renames": renames, "sources": sources}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(self.manifest_fpath + TMP_SUFFIX, self.manifest_fpath)
+        self.recover()
+
+    def recover(self):
+        '''
+        Complete the merge recorded in the manifest, if any
+        '''
+        if not os.path.exists(self.manifest_fpath):
+            return
+        with open(self.manifest_fpath, 'rb') as f:
+            manifest = json.load(f)
+        for tmp_fpath, fpath in manifest["renames"]:
+            if os.path.exists(tmp_fpath):
+                os.rename(tmp_fpath, fpath)
+        for fpath in manifest["sources"]:
+            if os.path.exists(fpath):
+                os.remove(fpath)
+        os.remove(self.manifest_fpath)
+
+    def stats(self):
+        '''
+        :returns: dict of tier -> dict with its number of files, and their bytes
+        '''
+        stats = {}
+        for tier, folder in (("hot", self.folder), ("warm", self.warm_folder), ("cold", self.cold_folder)):
+            fpaths = [os.path.join(folder, fname) for fname in os.listdir(folder)
+                      if fname.startswith(self.name + ".")] if os.path.isdir(folder) else []
+            fpaths = [fpath for fpath in fpaths if os.path.isfile(fpath)]
+            stats[tier] = {"files": len(fpaths), "bytes": sum(os.path.getsize(fpath) for fpath in fpaths)}
+        return stats
+
+def run_compactor(storage, interval=COMPACTION_INTERVAL, log_fpath=None, parent_pid=None):
+    '''
+    Compaction loop, at the lowest CPU priority
+    :param storage: TieredStorage
+    :param interval: seconds between two compactions
+    :param log_fpath: file to log the merges to. None to leave the logger as it is
+    :param parent_pid: stop once this process exits. None to run forever
+    '''
+    if log_fpath:
+        handler = logging.FileHandler(log_fpath)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+        storage.logger.addHandler(handler)
+        storage.logger.setLevel(logging.INFO)
+        storage.logger.propagate = False
+    try:
+        os.nice(19)
+    except (AttributeError, OSError):
+        pass
+    while parent_pid is None or os.getppid() == parent_pid:
+        try:
+            start_time = time.time()
+            n_days, n_months = storage.compact()
+            if n_days or n_months:
+                storage.logger.info("%d days moved to the warm tier, %d months to the cold tier, in %.0f seconds (%.0f slept): %s" % (
+                    n_days, n_months, time.time() - start_time, storage.budget.slept, json.dumps(storage.stats())))
+        except (IOError, OSError, ValueError), e:
+            storage.logger.error("compaction failed: %s" % (str(e),))
+        time.sleep(interval)
+
+def start_compactor(storage, interval=COMPACTION_INTERVAL, log_fpath=None):
+    '''
+    Run the compaction loop in a child process, stopping with the current process
+
+    :returns: the child process
+    '''
+    process = multiprocessing.Process(target=run_compactor, args=(storage, interval, log_fpath, os.getpid()), name="compactor")
+    process.daemon = True
+    process.start()
+    return process
+
+def main():
+    parser = OptionParser(usage="%prog [options] LOG_PATH")
+    parser.add_option("--hot_days", action="store", type="int", dest="hot_days", default=HOT_DAYS, help="days a day stays in the hot tier, after it ended")
+    parser.add_option("--warm_days", action="store", type="int", dest="warm_days", default=WARM_DAYS, help="days a month stays in the warm tier, after it ended")
+    parser.add_option("--warm_codec", action="store", type="string", dest="warm_codec", default=WARM_CODEC, help="codec of the warm tier (bz2, gzip, xz, zstd)")
+    parser.add_option("--cold_codec", action="store", type="string", dest="cold_codec", default=COLD_CODEC, help="codec of the cold tier (bz2, gzip, xz, zstd)")
+    parser.add_option("--no_columnar", action="store_false", dest="columnar", default=True, help="do not build the columnar version of the cold files")
+    parser.add_option("--io_rate", action="store", type="float", dest="io_rate", default=IO_RATE, help="uncompressed bytes per second read, at most. 0 for no limit")
+    parser.add_option("--cpu_share", action="store", type="float", dest="cpu_share", default=CPU_SHARE, help="share of a CPU used, at most. 0 for no limit")
+    parser.add_option("--interval", action="store", type="int", dest="interval", default=None, help="compact every this many seconds. If not given, compact once")
+    (options, args) = parser.parse_args()
+    if len(args) != 1:
+        parser.error("no log path")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    storage = TieredStorage(args[0], options.hot_days, options.warm_days, options.warm_codec, options.cold_codec, options.columnar,
+                            Budget(options.io_rate or None, options.cpu_share or None))
+    if options.interval:
+        run_compactor(storage, options.interval)
+    else:
+        print storage.compact()
+        print json.dumps(storage.stats())
+
+if __name__ == '__main__':
+    main()